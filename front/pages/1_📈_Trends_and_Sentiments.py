@@ -2,30 +2,40 @@ import streamlit as st
 import altair as alt
 import pandas as pd
 import random
+import requests
 import plotly.graph_objects as go
+from front.utils import fetch_trends
 
 st.set_page_config(layout="wide")
 
-st.title("Trends and Sentiments :chart_with_upwards_trend:")
+url = "http://localhost:8000/"
 
-features_df = pd.read_csv("generation/features.csv")
-features_df["cancer_types"] = features_df["cancer_types"].apply(
-    eval
-)  # Convert string to list
+st.title("Trends and Sentiments :chart_with_upwards_trend:")
 
-articles_df = (
-    features_df.drop(
-        columns=["treatment_name", "treatment_description", "treatment_sentiment"]
+# The aggregates are only fetched again when the features change
+try:
+    version = requests.get(url + "trends/version").json()["version"]
+except requests.exceptions.RequestException as e:
+    st.error(f"An error occurred: {e}")
+    st.stop()
+if version is None:
+    st.info(
+        "No features yet, run the feature extraction first (python -m src.features)"
     )
-    .drop_duplicates(subset=["article_name"])
-    .reset_index(drop=True)
-)
-cancer_df = articles_df.explode("cancer_types").reset_index(drop=True)
+    st.stop()
+trends = fetch_trends(url, version)
+
+cancer_counts_df = pd.DataFrame(trends["cancer_type_counts"])
+article_type_counts_df = pd.DataFrame(trends["article_type_counts"])
+article_date_counts_df = pd.DataFrame(trends["article_date_counts"])
+treatment_counts_df = pd.DataFrame(trends["treatment_counts"])
+treatment_sentiment_df = pd.DataFrame(trends["treatment_sentiment_counts"])
+treatment_articles = trends["treatment_articles"]
 
 st.markdown("## Cancer types repartition")
 
 cancer_repartition_chart = (
-    alt.Chart(cancer_df[cancer_df["cancer_types"].isna() == False])
+    alt.Chart(cancer_counts_df)
     .mark_bar()
     .encode(
         y=alt.Y(
@@ -34,7 +44,7 @@ cancer_repartition_chart = (
             sort="-x",
             axis=alt.Axis(labelLimit=200, labelPadding=10),
         ),
-        x="count()",
+        x=alt.X("sum(count):Q", title="Count of Records"),
         color="article_type",
     )
     .properties(title="Number of articles per cancer type")
@@ -47,26 +57,30 @@ st.markdown("---")
 st.markdown("## Articles repartition")
 
 articles_repartition_barchart = (
-    alt.Chart(articles_df)
+    alt.Chart(article_type_counts_df)
     .mark_bar()
-    .encode(x="article_type", y="count()")
+    .encode(x="article_type", y=alt.Y("count:Q", title="Count of Records"))
     .properties(title="Number of articles per type")
 )
 
 articles_repartition_piechart = (
-    alt.Chart(articles_df)
+    alt.Chart(article_type_counts_df)
     .mark_arc()
     .encode(
-        theta="count()",
+        theta="count:Q",
         color="article_type",
     )
     .properties(title="Number of articles per type")
 )
 
 articles_date_repartition_chart = (
-    alt.Chart(articles_df)
+    alt.Chart(article_date_counts_df)
     .mark_bar()
-    .encode(x="article_date", y="count()", color="article_type")
+    .encode(
+        x="article_date",
+        y=alt.Y("sum(count):Q", title="Count of Records"),
+        color="article_type",
+    )
     .properties(title="Number of articles per date")
 )
 
@@ -96,16 +110,18 @@ sentiment_colors_dict = {
 
 sentiment_colors = [sentiment_colors_dict[sentiment] for sentiment in sentiment_order]
 
-top_k = features_df["treatment_name"].value_counts()[:k]
-top_k_features_df = features_df[features_df["treatment_name"].isin(top_k.index)]
+top_k = treatment_counts_df["treatment_name"].head(k)
+top_k_sentiment_df = treatment_sentiment_df[
+    treatment_sentiment_df["treatment_name"].isin(top_k)
+]
 
 # Créer le graphique Altair
 treatment_repartition_chart = (
-    alt.Chart(top_k_features_df)
+    alt.Chart(top_k_sentiment_df)
     .mark_bar(size=30)
     .encode(
         y=alt.Y("treatment_name", title="Treatment name", sort="-x"),
-        x=alt.X("count()").title("Number of mentions"),
+        x=alt.X("sum(count):Q").title("Number of mentions"),
         color=alt.Color(
             "treatment_sentiment:N",
             scale=alt.Scale(domain=sentiment_order, range=sentiment_colors),
@@ -116,41 +132,24 @@ treatment_repartition_chart = (
 
 st.altair_chart(treatment_repartition_chart, use_container_width=True)
 
-# Compter les occurrences de chaque paire traitement-sentiment
-treatment_sentiment_counts = (
-    top_k_features_df.groupby(["treatment_name", "treatment_sentiment"])
-    .size()
-    .reset_index(name="count")
-)
-# Assurer que les sentiments sont dans l'ordre fixe
-treatment_sentiment_counts["treatment_sentiment"] = pd.Categorical(
-    treatment_sentiment_counts["treatment_sentiment"],
-    categories=sentiment_order,
-    ordered=True,
-)
-treatment_sentiment_counts = treatment_sentiment_counts.sort_values(
-    "treatment_sentiment"
-)
-
-# Créer des listes pour les sources, cibles et valeurs
-source = []
-target = []
-value = []
+# Les paires traitement-sentiment sont déjà comptées, dans l'ordre fixe des sentiments
+treatment_sentiment_counts = top_k_sentiment_df[
+    top_k_sentiment_df["treatment_sentiment"].isin(sentiment_order)
+]
 
 # Créer un dictionnaire pour mapper les traitements et les sentiments à des indices
 treatment_dict = {
     treatment: i
-    for i, treatment in enumerate(top_k_features_df["treatment_name"].unique())
+    for i, treatment in enumerate(treatment_sentiment_counts["treatment_name"].unique())
 }
 sentiment_dict = {
     sentiment: i + len(treatment_dict) for i, sentiment in enumerate(sentiment_order)
 }
 
-# Remplir les listes source, target et value
-for _, row in treatment_sentiment_counts.iterrows():
-    source.append(treatment_dict[row["treatment_name"]])
-    target.append(sentiment_dict[row["treatment_sentiment"]])
-    value.append(row["count"])
+# Créer les listes source, cible et valeur
+source = treatment_sentiment_counts["treatment_name"].map(treatment_dict).tolist()
+target = treatment_sentiment_counts["treatment_sentiment"].map(sentiment_dict).tolist()
+value = treatment_sentiment_counts["count"].tolist()
 
 # Créer une liste de couleurs pour les nœuds
 colors = [
@@ -162,12 +161,9 @@ colors.extend(sentiment_colors)
 
 # Créer le texte personnalisé pour les nœuds de traitement
 node_labels = list(treatment_dict.keys()) + list(sentiment_dict.keys())
-node_customdata = []
-for treatment in treatment_dict.keys():
-    articles = top_k_features_df[top_k_features_df["treatment_name"] == treatment][
-        "article_name"
-    ].unique()
-    node_customdata.append("<br>".join(articles))
+node_customdata = [
+    "<br>".join(treatment_articles[treatment]) for treatment in treatment_dict
+]
 node_customdata.extend([""] * len(sentiment_dict))
 
 # Créer le diagramme de Sankey
@@ -196,5 +192,5 @@ fig.update_layout(
 
 st.plotly_chart(fig)
 
-with st.expander("Show features"):
-    st.write(features_df)
+with st.expander("Show treatments"):
+    st.write(treatment_counts_df)
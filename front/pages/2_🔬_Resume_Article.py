@@ -23,15 +23,21 @@ pdf_file = st.sidebar.file_uploader(
 
 def upload_pdf():
     if pdf_file:
-        response = requests.post(url + "upload_pdf", files={"file": pdf_file})
+        response = requests.post(
+            url + "upload_pdfs",
+            files=[("files", (f.name, f, "application/pdf")) for f in pdf_file],
+        )
         if response.status_code == 200:
-            st.session_state.upload_success = True
+            errors = [r for r in response.json() if r["error"] is not None]
+            for r in errors:
+                st.sidebar.error(f"{r['filename']}: {r['error']}")
+            st.session_state.upload_success = len(errors) < len(pdf_file)
             st.session_state.cache_bust = time.time()
             st.session_state.pdf_paths = fetch_pdf_paths(
                 url, cache_bust=st.session_state.cache_bust
             )
         else:
-            st.sidebar.error("An error occurred while uploading the file")
+            st.sidebar.error("An error occurred while uploading the files")
 
 
 if pdf_file:
@@ -57,6 +63,11 @@ st.markdown("## Choose the article you want to analyze")
 pdf_name = st.selectbox("Article", options=pdf_names)
 pdf_path = [path for path in st.session_state.pdf_paths if pdf_name in path][0]
 
+grouped = st.toggle(
+    "Answer the questions together",
+    help="Retrieve the passages once and ask every question in a single model call: "
+    "fewer tokens, but a longer wait",
+)
 analyse_button = st.button("Analyze")
 answers = []
 
@@ -71,14 +82,25 @@ if analyse_button:
                     "pdf_path": pdf_path,
                 },
                 "prompts": prompts_df["prompts"].tolist(),
+                "mode": "grouped" if grouped else "per_prompt",
             }
             response = requests.post(url + "resume_article_from_prompts", json=payload)
             response.raise_for_status()
 
             result = response.json()
-            result_df = pd.DataFrame(result)
+            result_df = pd.DataFrame(
+                {"prompts": result["prompts"], "answers": result["answers"]}
+            )
         st.session_state.analysis = result_df
 
+        for prompt, error in zip(result["prompts"], result["errors"]):
+            if error is not None:
+                st.warning(f"{prompt}: {error}")
+        st.caption(
+            f"Analysis done in {result['total_time']:.1f} s, "
+            f"{result['total_tokens']} tokens"
+        )
+
     except requests.exceptions.RequestException as e:
         st.error(f"An error occurred while making the request: {str(e)}")
         if hasattr(e, "response") and e.response is not None:
@@ -101,7 +123,7 @@ if st.session_state.analysis is not None:
     # st.markdown(resume)
 
     for response in df["answers"]:
-        if response != "Information not available.":
+        if response and response != "Information not available.":
             st.markdown(response)
             st.markdown("---")
 
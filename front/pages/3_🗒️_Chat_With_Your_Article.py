@@ -1,5 +1,6 @@
 import streamlit as st
 import requests
+import json
 from front.utils import fetch_pdf_paths
 import os
 import pandas as pd
@@ -73,26 +74,49 @@ if search_button:
     st.markdown("## Response")
 
     try:
-        with st.spinner("Searching..."):
-
-            body = {
-                "chain_parameters": {
-                    "search_type": search_type,
-                    "top_k": top_k,
-                    "pdf_path": pdf_path,
-                },
-                "query": text_query,
-            }
-
-            response = requests.post(url + "query_article", json=body)
+        body = {
+            "chain_parameters": {
+                "search_type": search_type,
+                "top_k": top_k,
+                "pdf_path": pdf_path,
+            },
+            "query": text_query,
+        }
+
+        with requests.post(
+            url + "query_article_stream", json=body, stream=True
+        ) as response:
             response.raise_for_status()  # This will raise an exception for HTTP errors
 
-            result = response.json()
+            frames = (json.loads(line) for line in response.iter_lines() if line)
 
-            st.write(result["answer"])
+            with st.spinner("Searching..."):
+                context_frame = next(frames)
+            if context_frame["type"] == "error":
+                raise RuntimeError(context_frame["detail"])
+
+            metadata = {}
+
+            def answer_tokens():
+                # Yield the answer tokens as they arrive, keeping the final metadata frame
+                for frame in frames:
+                    if frame["type"] == "token":
+                        yield frame["content"]
+                    elif frame["type"] == "metadata":
+                        metadata.update(frame)
+                    elif frame["type"] == "error":
+                        raise RuntimeError(frame["detail"])
+
+            st.write_stream(answer_tokens())
+
+            if metadata.get("time_to_first_token") is not None:
+                st.caption(
+                    f"First token after {metadata['time_to_first_token']:.2f} s, "
+                    f"answer completed in {metadata['total_time']:.2f} s"
+                )
 
             with st.expander("View documents"):
-                for doc in result["context"]:
+                for doc in context_frame["context"]:
                     st.markdown(doc["metadata"])
                     st.markdown(doc["page_content"])
 
@@ -18,6 +18,21 @@ def fetch_pdf_paths(url: str, cache_bust: float = 0):
     return requests.get(url + "list_pdfs").json()
 
 
+@st.cache_data
+def fetch_trends(url: str, version: str):
+    """
+    Fetch the precomputed aggregates of the Trends page from the FastAPI server
+
+    Args:
+        url (str): The URL of the FastAPI server
+        version (str): The version of the features, so that the cache is busted when they change
+
+    Returns:
+        dict: The aggregates
+    """
+    return requests.get(url + "trends").json()
+
+
 def create_markdown_resume(answers_df: pd.DataFrame, title) -> str:
     """
     Create a markdown resume from the answers DataFrame
@@ -0,0 +1,181 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from langchain_core.documents import Document
+from langchain_core.messages import AIMessage
+from typing import Any, Dict
+from .config import answer_cache_path, ANSWER_CACHE_TTL, ANSWER_CACHE_MAX_ENTRIES
+
+
+def normalize_question(question: str) -> str:
+    """
+    Normalize a question so that trivially different spellings share a cache entry
+
+    Args:
+        question (str): The question
+
+    Returns:
+        str: The question, lowercased and with its whitespace collapsed
+    """
+
+    return " ".join(question.split()).lower()
+
+
+def answer_cache_key(question: str, **fields: Any) -> str:
+    """
+    Get the cache key of an answer
+
+    Args:
+        question (str): The question
+        **fields: What else the answer depends on: document hash, retrieval settings, model and prompt
+
+    Returns:
+        str: The SHA-256 of the normalized question and the fields
+    """
+
+    payload = json.dumps(
+        {"question": normalize_question(question), **fields}, sort_keys=True
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class AnswerCache:
+    """
+    Persistent cache of RAG answers, with their context chunks, stored in SQLite.
+    Entries expire after a TTL and the least recently used ones are evicted beyond max_entries.
+    """
+
+    def __init__(self, path: str, ttl: float, max_entries: int):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS answers ("
+                "key TEXT PRIMARY KEY, file_hash TEXT, response TEXT NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get(self, key: str) -> Dict[str, Any] | None:
+        """
+        Get a cached RAG chain response
+
+        Args:
+            key (str): The cache key
+
+        Returns:
+            Dict[str, Any] | None: The response, shaped like the output of the RAG chain and flagged
+            with cache_hit in its response_metadata, or None on a miss
+        """
+
+        now = time.time()
+        with self._lock, self._connect() as connection:
+            row = connection.execute(
+                "SELECT response, created_at FROM answers WHERE key = ? AND created_at > ?",
+                (key, now - self.ttl),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            connection.execute(
+                "UPDATE answers SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+            self.hits += 1
+
+        response, created_at = json.loads(row[0]), row[1]
+        return {
+            "llm_response": AIMessage(
+                content=response["answer"],
+                response_metadata={
+                    **response["response_metadata"],
+                    "cache_hit": True,
+                    "cached_at": created_at,
+                },
+            ),
+            "chunks": [Document(**chunk) for chunk in response["chunks"]],
+            "question": response["question"],
+        }
+
+    def put(self, key: str, file_hash: str | None, response: Dict[str, Any]):
+        """
+        Cache a RAG chain response, evicting expired and least recently used entries
+
+        Args:
+            key (str): The cache key
+            file_hash (str | None): The hash of the document the answer comes from
+            response (Dict[str, Any]): The output of the RAG chain
+        """
+
+        payload = json.dumps(
+            {
+                "question": response["question"],
+                "answer": response["llm_response"].content,
+                "response_metadata": response["llm_response"].response_metadata,
+                "chunks": [
+                    {"page_content": doc.page_content, "metadata": doc.metadata}
+                    for doc in response["chunks"]
+                ],
+            },
+            default=str,
+        )
+        now = time.time()
+        with self._lock, self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO answers (key, file_hash, response, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, file_hash, payload, now, now),
+            )
+            connection.execute(
+                "DELETE FROM answers WHERE created_at <= ?", (now - self.ttl,)
+            )
+            connection.execute(
+                "DELETE FROM answers WHERE key IN (SELECT key FROM answers "
+                "ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def purge(self, file_hash: str | None = None) -> int:
+        """
+        Remove the cached answers of a document, or all of them
+
+        Args:
+            file_hash (str | None): The hash of the document, None to empty the cache
+
+        Returns:
+            int: The number of answers removed
+        """
+
+        with self._lock, self._connect() as connection:
+            if file_hash is None:
+                return connection.execute("DELETE FROM answers").rowcount
+            return connection.execute(
+                "DELETE FROM answers WHERE file_hash = ?", (file_hash,)
+            ).rowcount
+
+    def stats(self) -> Dict[str, int | float]:
+        with self._connect() as connection:
+            entries = connection.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+answer_cache = AnswerCache(
+    answer_cache_path, ttl=ANSWER_CACHE_TTL, max_entries=ANSWER_CACHE_MAX_ENTRIES
+)
@@ -1,16 +1,24 @@
 from langchain_ollama import ChatOllama
-from .config import openwebui_api_key, base_url, system_prompt
+from .config import openwebui_api_key, base_url, system_prompt, CONTEXT_MAX_TOKENS
 from langchain_core.embeddings import Embeddings
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnablePassthrough
+from langchain_core.runnables import RunnableLambda, RunnablePassthrough
 from langchain_core.vectorstores import VectorStoreRetriever
 from langchain_core.documents import Document
+from langchain_core.messages import AIMessageChunk
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_openai import ChatOpenAI
 from dotenv import load_dotenv
+import asyncio
+import hashlib
 import os
-from typing import Dict, List
-from .vector_store import get_retriever
+from typing import Any, AsyncIterator, Dict, List, Tuple
+from .answer_cache import AnswerCache, answer_cache, answer_cache_key
+from .context_assembly import assemble_context
+from .embedding_cache import embedding_model_name
+from .file_manifest import file_manifest
+from .index_factory import StoreSettings
+from .vector_store import aget_retriever, get_retriever
 
 load_dotenv()
 
@@ -43,54 +51,89 @@ def format_docs(docs: List[Document]) -> str:
     return "\n\n".join(doc.page_content for doc in docs)
 
 
-def retrieve_and_format(
-    query: str, retriever: VectorStoreRetriever
-) -> Dict[str, str | List[Document]]:
+def retrieve_and_format(query: str, retriever: VectorStoreRetriever) -> Dict[str, Any]:
     """
-    Retrieve and format the best documents for a given query
+    Retrieve the best documents for a given query and assemble them into a context under the token budget
 
     Args:
         query (str): The query to use
         retriever (VectorStoreRetriever): The retriever object to use
 
     Returns:
-        Dict[str, str | List[Document]]: The context and chunks of the best documents
+        Dict[str, Any]: The context, the chunks it contains and its token statistics
     """
 
     docs = retriever.invoke(query)
-    return {"context": format_docs(docs), "chunks": docs}  # Store the original chunks
+    return assemble_context(docs)
 
 
-def get_rag_chain(
-    search_type: str = "mmr",
-    search_kwargs: dict = None,
-    pdf_path: str = None,
-    embedding_function: Embeddings = None,
-):
+async def aretrieve_and_format(
+    query: str, retriever: VectorStoreRetriever
+) -> Dict[str, Any]:
     """
-    Get a RAG chain object for a given search type, search arguments, and PDF file.
-    If the vector store for the PDF file does not exist, it will be created using the given embedding function.
+    Asynchronously retrieve the best documents for a given query and assemble them into a context
 
     Args:
-        search_type (str): The search type to use
-        search_kwargs (dict): The search arguments to pass to the retriever
-        pdf_path (str): The path to the PDF file to use
-        embedding_function (Embeddings): The embedding function to use. If the vector store does not exist, it will be created using this function, otherwise it will be loade and the embedding function should be the same as the one used to create the vector store.
+        query (str): The query to use
+        retriever (VectorStoreRetriever): The retriever object to use
+
+    Returns:
+        Dict[str, Any]: The context, the chunks it contains and its token statistics
+    """
+
+    docs = await retriever.ainvoke(query)
+    return assemble_context(docs)
+
+
+async def astream_answer(context: str, question: str) -> AsyncIterator[AIMessageChunk]:
+    """
+    Stream the answer of the generation model to a question, token by token
+
+    Args:
+        context (str): The formatted context to answer from
+        question (str): The question to answer
+
+    Yields:
+        AIMessageChunk: The chunks of the answer, as generated by the model
+    """
+
+    async for chunk in (prompt | generation_model).astream(
+        {"context": context, "input": question}
+    ):
+        yield chunk
+
+
+def add_context_stats(response: Dict) -> Dict:
+    response = dict(response)
+    response["llm_response"].response_metadata.update(response.pop("context_stats"))
+    return response
+
+
+async def aadd_context_stats(response: Dict) -> Dict:
+    return add_context_stats(response)
+
+
+def build_rag_chain(retriever: VectorStoreRetriever):
+    """
+    Build a RAG chain on top of a retriever. The chain can be driven with invoke or ainvoke,
+    in which case retrieval and generation are awaited instead of blocking a thread.
+    The token statistics of the context are added to the response_metadata of the answer.
+
+    Args:
+        retriever (VectorStoreRetriever): The retriever object to use
 
     Returns:
         rag_chain: The RAG chain object
     """
 
-    retriever = get_retriever(
-        search_type=search_type,
-        search_kwargs=search_kwargs,
-        pdf_path=pdf_path,
-        embedding_function=embedding_function,
-    )
+    async def aretrieve(x):
+        return await aretrieve_and_format(x, retriever)
 
     rag_chain = (
         {
-            "context_and_chunks": lambda x: retrieve_and_format(x, retriever),
+            "context_and_chunks": RunnableLambda(
+                lambda x: retrieve_and_format(x, retriever), afunc=aretrieve
+            ),
             "question": RunnablePassthrough(),
         }
         | RunnablePassthrough()
@@ -105,7 +148,179 @@ def get_rag_chain(
             ),
             "chunks": lambda x: x["context_and_chunks"]["chunks"],
             "question": lambda x: x["question"],
+            "context_stats": lambda x: x["context_and_chunks"]["context_stats"],
         }
+        | RunnableLambda(add_context_stats, afunc=aadd_context_stats)
     )
 
     return rag_chain
+
+
+def model_name(model) -> str:
+    """
+    Get the name of the model behind a chat model object
+
+    Args:
+        model: The chat model
+
+    Returns:
+        str: The model name
+    """
+
+    return (
+        getattr(model, "model_name", None)
+        or getattr(model, "model", None)
+        or type(model).__name__
+    )
+
+
+def with_answer_cache(
+    rag_chain,
+    file_hash: str,
+    search_type: str,
+    search_kwargs: dict,
+    settings: StoreSettings,
+    embedding_function: Embeddings,
+    use_cache: bool = True,
+    cache: AnswerCache = answer_cache,
+):
+    """
+    Put the answer cache in front of a RAG chain. Answers are keyed on the document, the normalized
+    question, the retrieval settings, the embedding model, the generation model and the system prompt,
+    and cached answers come back with cache_hit set in their response_metadata. The context token
+    budget is part of the key, as it changes what the model sees.
+
+    Args:
+        rag_chain: The RAG chain
+        file_hash (str): The hash of the PDF the chain retrieves from
+        search_type (str): The search type of the retriever
+        search_kwargs (dict): The search arguments of the retriever
+        settings (StoreSettings): The store settings
+        embedding_function (Embeddings): The embedding function of the store
+        use_cache (bool): Whether to look answers up, otherwise fresh answers still refresh the cache
+        cache (AnswerCache): The answer cache
+
+    Returns:
+        rag_chain: The RAG chain with its answers cached
+    """
+
+    settings = settings or StoreSettings()
+    fields = {
+        "file_hash": file_hash,
+        "search_type": search_type,
+        "search_kwargs": search_kwargs,
+        "store": settings.key,
+        "embedding_model": embedding_model_name(embedding_function),
+        "dimensions": settings.dimensions,
+        "model": model_name(generation_model),
+        "system_prompt": hashlib.sha256(system_prompt.encode("utf-8")).hexdigest(),
+        "context_max_tokens": CONTEXT_MAX_TOKENS,
+    }
+
+    def lookup(question: str) -> Tuple[str, Dict | None]:
+        key = answer_cache_key(question, **fields)
+        return key, cache.get(key) if use_cache else None
+
+    def store(key: str, response: Dict) -> Dict:
+        response["llm_response"].response_metadata["cache_hit"] = False
+        cache.put(key, file_hash, response)
+        return response
+
+    def invoke(question: str) -> Dict:
+        key, cached = lookup(question)
+        return cached or store(key, rag_chain.invoke(question))
+
+    async def ainvoke(question: str) -> Dict:
+        # The SQLite reads and writes run in a thread, not to block the event loop
+        key, cached = await asyncio.to_thread(lookup, question)
+        if cached:
+            return cached
+        return await asyncio.to_thread(store, key, await rag_chain.ainvoke(question))
+
+    return RunnableLambda(invoke, afunc=ainvoke)
+
+
+def get_rag_chain(
+    search_type: str = "mmr",
+    search_kwargs: dict = None,
+    pdf_path: str = None,
+    embedding_function: Embeddings = None,
+    settings: StoreSettings = None,
+    use_cache: bool = True,
+):
+    """
+    Get a RAG chain object for a given search type, search arguments, and PDF file.
+    If the vector store for the PDF file does not exist, it will be created using the given embedding function.
+    Its answers go through the answer cache.
+
+    Args:
+        search_type (str): The search type to use
+        search_kwargs (dict): The search arguments to pass to the retriever
+        pdf_path (str): The path to the PDF file to use
+        embedding_function (Embeddings): The embedding function to use. If the vector store does not exist, it will be created using this function, otherwise it will be loade and the embedding function should be the same as the one used to create the vector store.
+        settings (StoreSettings): The store settings, the defaults if not set
+        use_cache (bool): Whether to serve cached answers
+
+    Returns:
+        rag_chain: The RAG chain object
+    """
+
+    retriever = get_retriever(
+        search_type=search_type,
+        search_kwargs=search_kwargs,
+        pdf_path=pdf_path,
+        embedding_function=embedding_function,
+        settings=settings,
+    )
+
+    return with_answer_cache(
+        build_rag_chain(retriever),
+        file_manifest.get_hash(pdf_path),
+        search_type,
+        search_kwargs,
+        settings,
+        embedding_function,
+        use_cache,
+    )
+
+
+async def aget_rag_chain(
+    search_type: str = "mmr",
+    search_kwargs: dict = None,
+    pdf_path: str = None,
+    embedding_function: Embeddings = None,
+    settings: StoreSettings = None,
+    use_cache: bool = True,
+):
+    """
+    Asynchronous version of get_rag_chain. Loading or creating the vector store is offloaded to a worker thread.
+
+    Args:
+        search_type (str): The search type to use
+        search_kwargs (dict): The search arguments to pass to the retriever
+        pdf_path (str): The path to the PDF file to use
+        embedding_function (Embeddings): The embedding function to use
+        settings (StoreSettings): The store settings, the defaults if not set
+        use_cache (bool): Whether to serve cached answers
+
+    Returns:
+        rag_chain: The RAG chain object
+    """
+
+    retriever = await aget_retriever(
+        search_type=search_type,
+        search_kwargs=search_kwargs,
+        pdf_path=pdf_path,
+        embedding_function=embedding_function,
+        settings=settings,
+    )
+
+    return with_answer_cache(
+        build_rag_chain(retriever),
+        file_manifest.get_hash(pdf_path),
+        search_type,
+        search_kwargs,
+        settings,
+        embedding_function,
+        use_cache,
+    )
@@ -0,0 +1,147 @@
+"""
+Measure the throughput of the text cleaner on synthetic pages, with the regular expressions as they were
+before they were precompiled and merged, and as they are now, and check that both give the same output.
+Typical pages have short lines like a parsed two-column article. Long single-line pages are what some
+PDFs extract to, and where the previous patterns backtracked.
+
+Usage:
+    python -m src.cleaning_benchmark [--pages 500] [--repeat 3]
+"""
+
+import argparse
+import random
+import re
+import time
+import unicodedata
+from typing import Callable, List
+from .text_cleaning import clean_text
+
+WORDS = (
+    "patients treated with osimertinib showed a median progression free survival of months "
+    "compared with the control arm hazard ratio confidence interval EGFR mutation tumour response"
+).split()
+METADATA = [
+    "https://doi.org/10.1016/j.jtho.2020.01.001",
+    "DOI: 10.1200/JCO.2019",
+    "Vol. 38",
+    "Page 12",
+    "© 2020 Elsevier",
+    "Creative Commons Attribution License",
+    "Correspondence: Dr. Smith, Institut Curie",
+    "eﬃcacy",
+]
+
+
+def previous_clean_text(text: str) -> str:
+    """
+    The cleaner as it was before its patterns were precompiled and merged
+
+    Args:
+        text (str): The text to clean
+
+    Returns:
+        str: The cleaned text
+    """
+
+    text = unicodedata.normalize("NFKD", text)
+    text = re.sub(
+        r"http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+",
+        "",
+        text,
+    )
+    text = re.sub(r"DOI:?\s*\d+[\./]\d+", "", text)
+    text = re.sub(r"Vol\.\s*\d+", "", text)
+    text = re.sub(r"\b(?:[Pp]age|[Pp]ages)\s*\d+", "", text)
+    text = re.sub(r"©.*?(?:\d{4})?", "", text)
+    text = re.sub(r"Creative Commons.*?License", "", text)
+    text = re.sub(r"[Cc]orrespondence.*?:.*", "", text)
+    text = re.sub(r"[\n\t\r]+", " ", text)
+    text = re.sub(r"\s+", " ", text)
+    return text.strip()
+
+
+def sample_pages(
+    num_pages: int, num_lines: int, words_per_line: int, seed: int = 0
+) -> List[str]:
+    """
+    Build synthetic pages of words with scientific metadata scattered through them
+
+    Args:
+        num_pages (int): The number of pages
+        num_lines (int): The number of lines per page
+        words_per_line (int): The number of words per line
+        seed (int): The random seed
+
+    Returns:
+        List[str]: The pages
+    """
+
+    rng = random.Random(seed)
+    pages = []
+    for _ in range(num_pages):
+        lines = []
+        for _ in range(num_lines):
+            words = rng.choices(WORDS, k=words_per_line)
+            if rng.random() < 0.2:
+                words.insert(rng.randrange(len(words)), rng.choice(METADATA))
+            lines.append(" ".join(words))
+        pages.append("\n".join(lines))
+    return pages
+
+
+def pages_per_second(
+    clean: Callable[[str], str], pages: List[str], repeat: int
+) -> float:
+    """
+    Measure the best throughput of a cleaner over several runs
+
+    Args:
+        clean (Callable[[str], str]): The cleaner
+        pages (List[str]): The pages
+        repeat (int): The number of runs
+
+    Returns:
+        float: The number of pages cleaned per second
+    """
+
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for page in pages:
+            clean(page)
+        best = min(best, time.perf_counter() - start)
+    return len(pages) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--pages", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    page_sets = {
+        "typical": sample_pages(args.pages, 60, 12),
+        "single-line": [
+            page.replace("\n", " ") for page in sample_pages(args.pages // 5, 240, 12)
+        ],
+    }
+
+    print(
+        f"{'pages':<13}{'KB/page':>9}{'previous/s':>12}{'current/s':>11}{'speedup':>9}"
+    )
+    for name, pages in page_sets.items():
+        mismatches = sum(
+            clean_text(page) != previous_clean_text(page) for page in pages
+        )
+        if mismatches:
+            raise AssertionError(f"{mismatches} {name} pages are cleaned differently")
+        previous = pages_per_second(previous_clean_text, pages, args.repeat)
+        current = pages_per_second(clean_text, pages, args.repeat)
+        size = sum(map(len, pages)) / len(pages) / 1024
+        print(
+            f"{name:<13}{size:>9.1f}{previous:>12.0f}{current:>11.0f}{current / previous:>8.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Compare the concurrent-request capacity of the RAG endpoint served synchronously, as it was before the
+handlers became async, and asynchronously, as it is now.
+Both handlers run the same RAG chain over a FAISS store of synthetic chunks. The generation model and the
+embedding endpoint are replaced by stubs that sleep for their latency, so the benchmark runs offline and
+costs nothing. Requests are sent in-process through the ASGI interface, so the sync handler goes through
+the same bounded threadpool as under uvicorn.
+
+Usage:
+    python -m src.concurrency_benchmark [--concurrency 10 40 80 160 320] [--requests 320]
+                                        [--llm-latency 2.0] [--embedding-latency 0.05]
+"""
+
+import argparse
+import asyncio
+import itertools
+import os
+import statistics
+import time
+import httpx
+import numpy as np
+from fastapi import Body, FastAPI
+from langchain_community.vectorstores import FAISS
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+from typing import Any, Dict, List
+from . import chains
+from .embedding_benchmark import RemoteEmbeddingsStub, sample_texts
+
+
+class SlowChatModelStub(GenericFakeChatModel):
+    """
+    Stands in for the generation model: each call sleeps for a fixed latency, blocking in the sync path
+    and awaiting in the async one, and returns the same short answer
+    """
+
+    latency: float = 2.0
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency)
+        return super()._generate(messages, stop, run_manager, **kwargs)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        return super()._generate(messages, stop, run_manager, **kwargs)
+
+
+def build_app(rag_chain) -> FastAPI:
+    """
+    Build an app serving the RAG chain with both handler shapes
+
+    Args:
+        rag_chain: The RAG chain
+
+    Returns:
+        FastAPI: The app, with the sync handler on /sync and the async handler on /async
+    """
+
+    app = FastAPI()
+
+    @app.post("/sync")
+    def query_sync(query: str = Body(...)) -> Dict[str, Any]:
+        response = rag_chain.invoke(query)
+        return {"answer": response["llm_response"].content}
+
+    @app.post("/async")
+    async def query_async(query: str = Body(...)) -> Dict[str, Any]:
+        response = await rag_chain.ainvoke(query)
+        return {"answer": response["llm_response"].content}
+
+    return app
+
+
+async def benchmark_endpoint(
+    app: FastAPI, path: str, num_requests: int, concurrency: int
+) -> Dict[str, Any]:
+    """
+    Send requests to an endpoint with a fixed number in flight and measure its throughput and latency
+
+    Args:
+        app (FastAPI): The app
+        path (str): The path of the endpoint
+        num_requests (int): The number of requests
+        concurrency (int): The number of requests in flight at the same time
+
+    Returns:
+        Dict[str, Any]: The measures
+    """
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    failures = 0
+
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app),
+        base_url="http://benchmark",
+        timeout=None,
+    ) as client:
+
+        async def request(i: int):
+            nonlocal failures
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post(
+                    path, json=f"What is the response rate of treatment {i}?"
+                )
+                latencies.append(time.perf_counter() - start)
+                failures += response.status_code != 200
+
+        start = time.perf_counter()
+        await asyncio.gather(*(request(i) for i in range(num_requests)))
+        seconds = time.perf_counter() - start
+
+    return {
+        "requests_per_second": num_requests / seconds,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": float(np.percentile(latencies, 95)) * 1000,
+        "failures": failures,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument(
+        "--concurrency", type=int, nargs="+", default=[10, 40, 80, 160, 320]
+    )
+    parser.add_argument(
+        "--requests",
+        type=int,
+        default=320,
+        help="Requests per run, at least the concurrency of the run",
+    )
+    parser.add_argument(
+        "--llm-latency",
+        type=float,
+        default=2.0,
+        help="Latency of a generation call, in seconds",
+    )
+    parser.add_argument(
+        "--embedding-latency",
+        type=float,
+        default=0.05,
+        help="Round-trip latency of a query embedding request, in seconds",
+    )
+    parser.add_argument("--top-k", type=int, default=4)
+    args = parser.parse_args()
+
+    # The config turns LangSmith tracing on, which would add its uploads to the measures
+    os.environ["LANGCHAIN_TRACING_V2"] = "false"
+    embedding_function = RemoteEmbeddingsStub(256, args.embedding_latency, 0.0, 1000)
+    vector_store = FAISS.from_texts(sample_texts(None, 256), embedding_function)
+    chains.generation_model = SlowChatModelStub(
+        messages=itertools.repeat(AIMessage(content="A stubbed answer.")),
+        latency=args.llm_latency,
+    )
+    app = build_app(
+        chains.build_rag_chain(
+            vector_store.as_retriever(
+                search_type="similarity", search_kwargs={"k": args.top_k}
+            )
+        )
+    )
+
+    print(
+        f"{'handler':<10}{'concurrency':>12}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}"
+        f"{'failures':>10}"
+    )
+    for concurrency in args.concurrency:
+        for handler in ("sync", "async"):
+            results = asyncio.run(
+                benchmark_endpoint(
+                    app, f"/{handler}", max(args.requests, concurrency), concurrency
+                )
+            )
+            print(
+                f"{handler:<10}{concurrency:>12}{results['requests_per_second']:>10.1f}"
+                f"{results['p50_ms']:>10.0f}{results['p95_ms']:>10.0f}{results['failures']:>10}"
+            )
+
+
+if __name__ == "__main__":
+    main()
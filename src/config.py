@@ -12,14 +12,144 @@ os.environ["LANGCHAIN_PROJECT"] = "test_rag"
 openwebui_api_key = os.getenv("OPENWEBUI_API_KEY")
 base_url = "http://149.202.125.247:8080/ollama"
 embedding_model = "mxbai-embed-large:latest"
+EMBEDDING_BATCH_SIZE = 32  # set to 1 for Ollama versions without the /api/embed route
+EMBEDDING_MAX_CONCURRENCY = 4
+EMBEDDING_TIMEOUT = 60  # seconds
+EMBEDDING_MAX_RETRIES = 3
+
+### CPU Embedding Model (sentence-transformers, run in process)
+LOCAL_EMBEDDING_MODEL = os.getenv(
+    "LOCAL_EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2"
+)
+LOCAL_EMBEDDING_BATCH_SIZE = 32
+LOCAL_EMBEDDING_THREADS = int(os.getenv("LOCAL_EMBEDDING_THREADS", os.cpu_count() or 1))
+# Quantize the linear layers of the model to int8 (torch dynamic quantization)
+LOCAL_EMBEDDING_QUANTIZE = (
+    os.getenv("LOCAL_EMBEDDING_QUANTIZE", "false").lower() == "true"
+)
+LOCAL_EMBEDDING_BATCH_WAIT = (
+    0.005  # seconds a query waits for concurrent queries to batch with
+)
+
+EMBEDDING_BACKENDS = ["openai", "custom", "local"]
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "openai")  # backend of the API
+
 embedding_folder = os.path.join("src", "embeddings")
 UPLOAD_DIRECTORY = os.path.join("src", "docs")
 
+### File Manifest
+manifest_path = os.path.join(embedding_folder, "manifest.json")
+HASH_BLOCK_SIZE = 1024 * 1024  # 1 MB
+
+### Chunk Embedding Cache
+embedding_cache_path = os.path.join(embedding_folder, "embedding_cache.sqlite")
+
+### Query Embedding Cache
+QUERY_EMBEDDING_CACHE_MAX_ENTRIES = 4096  # query embeddings kept in memory
+# Also keep query embeddings in the embedding cache, so that they survive restarts
+QUERY_EMBEDDING_CACHE_PERSISTENT = (
+    os.getenv("QUERY_EMBEDDING_CACHE_PERSISTENT", "true").lower() == "true"
+)
+# Pre-embed the prompts of prompts.csv at startup
+QUERY_EMBEDDING_WARMUP = os.getenv("QUERY_EMBEDDING_WARMUP", "true").lower() == "true"
+prompts_csv_path = "prompts.csv"
+
+### Extracted Text Cache
+text_cache_path = os.path.join(embedding_folder, "text_cache.sqlite")
+
+### Feature Extraction (dataset of the Trends page)
+features_folder = "generation"
+features_path = os.path.join(features_folder, "features.parquet")
+features_csv_path = os.path.join(features_folder, "features.csv")
+features_checkpoint_folder = os.path.join(features_folder, "checkpoints")
+trends_aggregates_path = os.path.join(features_folder, "trends.json")
+FEATURES_MAX_CONCURRENCY = 4  # documents extracted at the same time
+FEATURES_TOP_K = 6  # chunks retrieved per feature query
+
+### Answer Cache
+answer_cache_path = os.path.join(embedding_folder, "answer_cache.sqlite")
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", 7 * 24 * 3600))  # seconds
+ANSWER_CACHE_MAX_ENTRIES = 10000
+
+### Vector Store Cache
+VECTOR_STORE_CACHE_MAX_BYTES = int(
+    os.getenv("VECTOR_STORE_CACHE_MAX_BYTES", 1024 * 1024 * 1024)
+)  # 1 GB
+# Seconds a rebuilt store keeps its previous version on disk, for the requests other workers are
+# still answering from it
+STORE_VERSION_RETENTION = 600
+
+
+### Vector Indexes
+DEFAULT_INDEX_TYPE = "flat"  # one of "flat", "ivf_flat", "hnsw", "ivf_pq"
+DEFAULT_EMBEDDING_DIMENSIONS = (
+    None  # e.g. 256 to truncate text-embedding-3-large vectors
+)
+DEFAULT_PRECISION = "float32"  # one of "float32", "float16", "int8"
+IVF_MIN_POINTS_PER_LIST = 39  # training vectors needed per inverted list / PQ centroid
+IVF_MAX_LISTS = 4096
+IVF_NPROBE = 16
+HNSW_M = 32
+HNSW_EF_SEARCH = 64
+PQ_DIMS_PER_SUBQUANTIZER = 8
+
+# Memory-map the vectors of flat and IVF stores so that uvicorn workers share them through the page cache
+VECTOR_STORE_MMAP = os.getenv("VECTOR_STORE_MMAP", "true").lower() == "true"
+# Number of vectors scanned at a time by memory-mapped flat indexes
+MMAP_SEARCH_BLOCK_SIZE = 65536
+
+# zlib level used to compress the chunks kept in the SQLite docstore of each store, 0 to disable
+DOCSTORE_COMPRESSION_LEVEL = int(os.getenv("DOCSTORE_COMPRESSION_LEVEL", 6))
+
+### Corpus Index
+# Also index every uploaded document in a single corpus-wide vector store
+ENABLE_CORPUS_INDEX = os.getenv("ENABLE_CORPUS_INDEX", "false").lower() == "true"
+CORPUS_INDEX_TYPE = "ivf_flat"  # trained once the corpus is large enough, must support deletes (not "hnsw")
+# The IVF corpus index is retrained once the corpus would get this many times more inverted lists
+CORPUS_RETRAIN_LIST_GROWTH = 4
+# Added documents are appended to a log, and the whole corpus index is only saved again once the log
+# holds this many vectors, or this share of the saved index if larger
+CORPUS_SNAPSHOT_MIN_VECTORS = 20000
+CORPUS_SNAPSHOT_GROWTH = 0.5
+
+### Background Ingestion
+INGESTION_MAX_WORKERS = 2
+INGESTION_MAX_PENDING = 100
+# Finished ingestion and feature extraction jobs can be polled for this long (seconds), and the
+# oldest are dropped beyond this many
+JOB_FINISHED_TTL = 24 * 3600
+JOB_MAX_FINISHED = 1000
+# Documents with at least this many pages are parsed and cleaned by a process pool
+INGESTION_PARALLEL_MIN_PAGES = 32
+INGESTION_EXTRACT_WORKERS = min(os.cpu_count() or 1, 4)
+INGESTION_PAGES_PER_TASK = 4
+# Chunks parsed ahead of the embedder before parsing pauses
+INGESTION_QUEUE_MAX_CHUNKS = 512
+INGESTION_EMBED_BATCH_SIZE = EMBEDDING_BATCH_SIZE * EMBEDDING_MAX_CONCURRENCY
+
 
 ### RAG Model
 root_doc_path = os.path.join("src", "docs")
 pdf_paths = [os.path.join(root_doc_path, pdf) for pdf in os.listdir(root_doc_path)]
-search_types = ["mmr", "similarity"]
+search_types = ["mmr", "similarity", "bm25", "hybrid"]
+dense_search_types = ["mmr", "similarity"]  # the corpus index has no keyword index
+BM25_K1 = 1.5
+BM25_B = 0.75
+RRF_K = 60  # reciprocal rank fusion constant of the hybrid search
+HYBRID_MIN_CANDIDATES = 20  # chunks taken from each ranking before fusion
+# Token budget of the retrieved context sent to the generation model, counted with the tiktoken
+# encoding of gpt-4o-mini
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", 4000))
+CONTEXT_TOKEN_ENCODING = "o200k_base"
+# Share of a passage already in the context above which it is dropped as a near-duplicate
+CONTEXT_DUPLICATE_THRESHOLD = 0.8
+RESUME_MAX_CONCURRENCY = (
+    4  # prompts answered at the same time by /resume_article_from_prompts
+)
+# Questions asked in the same model call by the "grouped" resume mode, and the token budget of
+# the context they share
+RESUME_QUESTIONS_PER_CALL = 16
+RESUME_CONTEXT_MAX_TOKENS = 8000
 
 system_prompt = """
 You are an assistant for question-answering tasks.
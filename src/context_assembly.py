@@ -0,0 +1,224 @@
+import math
+import re
+from functools import lru_cache
+from langchain_core.documents import Document
+from typing import Any, Dict, List, Set, Tuple
+from .config import (
+    CONTEXT_MAX_TOKENS,
+    CONTEXT_DUPLICATE_THRESHOLD,
+    CONTEXT_TOKEN_ENCODING,
+)
+
+CONTEXT_SEPARATOR = "\n\n"
+SHINGLE_SIZE = 5
+WORD_PATTERN = re.compile(r"\w+")
+
+
+@lru_cache(maxsize=1)
+def token_encoding():
+    """
+    Get the tiktoken encoding of the generation model, loaded once
+
+    Returns:
+        The encoding, or None if it cannot be loaded (tiktoken downloads it on first use)
+    """
+
+    try:
+        import tiktoken
+
+        return tiktoken.get_encoding(CONTEXT_TOKEN_ENCODING)
+    except Exception as e:
+        print(f"Token encoding unavailable, estimating tokens from characters: {e}")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """
+    Count the tokens of a text for the generation model
+
+    Args:
+        text (str): The text
+
+    Returns:
+        int: The number of tokens, estimated as 4 characters per token without the encoding
+    """
+
+    encoding = token_encoding()
+    if encoding is None:
+        return math.ceil(len(text) / 4)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """
+    Keep the beginning of a text that fits in a number of tokens
+
+    Args:
+        text (str): The text
+        max_tokens (int): The number of tokens
+
+    Returns:
+        str: The truncated text
+    """
+
+    encoding = token_encoding()
+    if encoding is None:
+        return text[: max_tokens * 4]
+    return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+
+
+def _merge(passage: Dict[str, Any], doc: Document, start: int) -> Dict[str, Any] | None:
+    # Merge a chunk starting within or right after a passage, if their texts agree on the overlap:
+    # start indexes are relative to a page section, and a page can have several sections
+    overlap = passage["end"] - start
+    if overlap < 0 or start < passage["start"]:
+        return None
+    text = doc.page_content
+    if len(text) <= overlap:
+        offset = start - passage["start"]
+        if passage["text"][offset : offset + len(text)] != text:
+            return None
+        merged_text = passage["text"]
+    elif overlap == 0 or passage["text"][-overlap:] == text[:overlap]:
+        merged_text = passage["text"] + text[overlap:]
+    else:
+        return None
+    return {
+        **passage,
+        "text": merged_text,
+        "end": passage["start"] + len(merged_text),
+        "rank": min(passage["rank"], doc.metadata["rank"]),
+        "chunks": passage["chunks"] + [doc],
+    }
+
+
+def merge_chunks(docs: List[Document]) -> List[Dict[str, Any]]:
+    """
+    Merge the chunks that overlap or follow each other in the same page into passages, using
+    their start_index metadata. The splitter overlaps consecutive chunks by up to 200 characters,
+    which are only kept once.
+
+    Args:
+        docs (List[Document]): The retrieved chunks, best first
+
+    Returns:
+        List[Dict[str, Any]]: The passages, best first, with their text, the rank of their best chunk
+        and their chunks
+    """
+
+    passages = []
+    located: Dict[Tuple[Any, Any], List[Tuple[int, Document]]] = {}
+    for rank, doc in enumerate(docs):
+        doc = Document(
+            page_content=doc.page_content, metadata={**doc.metadata, "rank": rank}
+        )
+        start = doc.metadata.get("start_index")
+        if start is None:
+            passages.append(_passage(doc, 0))
+        else:
+            key = (doc.metadata.get("source"), doc.metadata.get("page"))
+            located.setdefault(key, []).append((start, doc))
+
+    for chunks in located.values():
+        chunks.sort(key=lambda chunk: chunk[0])
+        page_passages = []
+        for start, doc in chunks:
+            merged = None
+            for i, passage in enumerate(page_passages):
+                merged = _merge(passage, doc, start)
+                if merged is not None:
+                    page_passages[i] = merged
+                    break
+            if merged is None:
+                page_passages.append(_passage(doc, start))
+        passages.extend(page_passages)
+
+    return sorted(passages, key=lambda passage: passage["rank"])
+
+
+def _passage(doc: Document, start: int) -> Dict[str, Any]:
+    return {
+        "text": doc.page_content,
+        "start": start,
+        "end": start + len(doc.page_content),
+        "rank": doc.metadata["rank"],
+        "chunks": [doc],
+    }
+
+
+def _shingles(text: str) -> Set[Tuple[str, ...]]:
+    words = WORD_PATTERN.findall(text.lower())
+    if len(words) < SHINGLE_SIZE:
+        return {tuple(words)}
+    return {
+        tuple(words[i : i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)
+    }
+
+
+def assemble_context(
+    docs: List[Document],
+    max_tokens: int = CONTEXT_MAX_TOKENS,
+    duplicate_threshold: float = CONTEXT_DUPLICATE_THRESHOLD,
+) -> Dict[str, Any]:
+    """
+    Build the context of the generation model from the retrieved chunks: overlapping and adjacent
+    chunks are merged, passages whose text mostly appears in a better passage are dropped, and the
+    passages are packed in relevance order under a token budget.
+
+    Args:
+        docs (List[Document]): The retrieved chunks, best first
+        max_tokens (int): The token budget of the context
+        duplicate_threshold (float): The share of the word 5-grams of a passage already in the
+            context above which it is dropped as a near-duplicate
+
+    Returns:
+        Dict[str, Any]: The context, the chunks it contains, best first, and its token statistics:
+        the tokens of the context, and those saved compared to joining every chunk verbatim
+    """
+
+    context_passages = []
+    seen: Set[Tuple[str, ...]] = set()
+    tokens = 0
+    duplicates = 0
+    separator_tokens = count_tokens(CONTEXT_SEPARATOR)
+    for passage in merge_chunks(docs):
+        shingles = _shingles(passage["text"])
+        if len(shingles & seen) >= duplicate_threshold * len(shingles):
+            duplicates += len(passage["chunks"])
+            continue
+        passage_tokens = count_tokens(passage["text"]) + separator_tokens
+        if tokens + passage_tokens > max_tokens:
+            if context_passages:
+                continue
+            # Keep the beginning of the best passage rather than an empty context
+            passage = {
+                **passage,
+                "text": truncate_to_tokens(passage["text"], max_tokens),
+            }
+            passage_tokens = max_tokens
+        context_passages.append(passage)
+        seen |= shingles
+        tokens += passage_tokens
+
+    context = CONTEXT_SEPARATOR.join(passage["text"] for passage in context_passages)
+    chunk_ranks = sorted(
+        doc.metadata["rank"]
+        for passage in context_passages
+        for doc in passage["chunks"]
+    )
+    context_tokens = count_tokens(context)
+    return {
+        "context": context,
+        "chunks": [docs[rank] for rank in chunk_ranks],
+        "context_stats": {
+            "context_tokens": context_tokens,
+            "context_tokens_saved": count_tokens(
+                CONTEXT_SEPARATOR.join(doc.page_content for doc in docs)
+            )
+            - context_tokens,
+            "context_chunks": len(chunk_ranks),
+            "context_chunks_merged": len(chunk_ranks) - len(context_passages),
+            "context_chunks_duplicates": duplicates,
+            "context_chunks_over_budget": len(docs) - len(chunk_ranks) - duplicates,
+        },
+    }
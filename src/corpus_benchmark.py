@@ -0,0 +1,181 @@
+"""
+Measure the cost of adding documents to the corpus index as it grows, with the whole index saved after
+every document, as it was before the log of added vectors, and with the log and batched saves, and the
+latency of queries over the whole corpus and over a subset of its documents at each size.
+Documents are synthetic chunks with random vectors, so the benchmark only measures the index and its
+persistence, not parsing or embedding.
+
+Usage:
+    python -m src.corpus_benchmark [--articles 10 100 1000 10000] [--baseline-articles 1000]
+                                   [--chunks 20] [--dimensions 128] [--queries 50]
+                                   [--subset 5] [--top-k 4]
+"""
+
+import argparse
+import tempfile
+import time
+import numpy as np
+from langchain_core.documents import Document
+from typing import Any, Dict, List, Optional
+from .corpus_index import CorpusIndex
+from .embedding_benchmark import RemoteEmbeddingsStub
+
+FILLER = "MET exon 14 skipping mutations respond to capmatinib and tepotinib. " * 12
+
+
+def benchmark_queries(
+    index: CorpusIndex,
+    file_paths: Optional[List[str]],
+    num_queries: int,
+    top_k: int,
+    dimensions: int,
+) -> float:
+    """
+    Measure the mean latency of similarity searches over the corpus index
+
+    Args:
+        index (CorpusIndex): The corpus index
+        file_paths (Optional[List[str]]): The documents searched, None for the whole corpus
+        num_queries (int): The number of queries
+        top_k (int): The number of chunks retrieved per query
+        dimensions (int): The dimensions of the vectors
+
+    Returns:
+        float: The mean latency of a query, in milliseconds
+    """
+
+    retriever = index.as_retriever("similarity", top_k, file_paths)
+    rng = np.random.default_rng(1)
+    queries = rng.standard_normal((num_queries, dimensions), dtype=np.float32)
+    start = time.perf_counter()
+    for query in queries:
+        # The query vector is given directly, so the stub embedding endpoint is not timed
+        if file_paths is None:
+            retriever.vectorstore.similarity_search_by_vector(query.tolist(), k=top_k)
+        else:
+            retriever._search(query.tolist())
+    return (time.perf_counter() - start) / num_queries * 1000
+
+
+def benchmark_corpus(
+    index: CorpusIndex,
+    checkpoints: List[int],
+    num_chunks: int,
+    dimensions: int,
+    num_queries: int = 50,
+    subset_size: int = 5,
+    top_k: int = 4,
+) -> List[Dict[str, Any]]:
+    """
+    Add synthetic articles to a corpus index and measure the time per article between checkpoints, and
+    the latency of queries over the whole corpus and over a subset of its articles at each checkpoint
+
+    Args:
+        index (CorpusIndex): The corpus index, empty
+        checkpoints (List[int]): The numbers of articles at which the measures are taken
+        num_chunks (int): The number of chunks per article
+        dimensions (int): The dimensions of the vectors
+        num_queries (int): The number of queries per checkpoint
+        subset_size (int): The number of articles in the searched subset
+        top_k (int): The number of chunks retrieved per query
+
+    Returns:
+        List[Dict[str, Any]]: The measures at each checkpoint
+    """
+
+    rng = np.random.default_rng(0)
+    results = []
+    latencies = []
+    start = time.perf_counter()
+    for article in range(max(checkpoints)):
+        chunks = [
+            Document(
+                page_content=f"Article {article}, chunk {chunk}. {FILLER}",
+                metadata={"source": f"docs/article_{article}.pdf", "page": chunk},
+            )
+            for chunk in range(num_chunks)
+        ]
+        vectors = rng.standard_normal((num_chunks, dimensions), dtype=np.float32)
+        added = time.perf_counter()
+        index.add_chunks(
+            f"article-{article}", f"docs/article_{article}.pdf", chunks, vectors
+        )
+        latencies.append(time.perf_counter() - added)
+        if article + 1 in checkpoints:
+            total_seconds = time.perf_counter() - start
+            subset = [f"docs/article_{i}.pdf" for i in range(subset_size)]
+            query_args = (num_queries, top_k, dimensions)
+            results.append(
+                {
+                    "articles": article + 1,
+                    "vectors": index._store.index.ntotal,
+                    "add_ms": float(np.mean(latencies)) * 1000,
+                    "add_max_ms": max(latencies) * 1000,
+                    "total_seconds": total_seconds,
+                    "query_ms": benchmark_queries(index, None, *query_args),
+                    "subset_query_ms": benchmark_queries(index, subset, *query_args),
+                }
+            )
+            latencies = []
+            # The queries are not part of the time taken to build the corpus
+            start = time.perf_counter() - total_seconds
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument(
+        "--articles", type=int, nargs="+", default=[10, 100, 1000, 10000]
+    )
+    parser.add_argument(
+        "--baseline-articles",
+        type=int,
+        default=1000,
+        help="Stop the save-every-document run here, its total time grows quadratically",
+    )
+    parser.add_argument("--chunks", type=int, default=20)
+    parser.add_argument("--dimensions", type=int, default=128)
+    parser.add_argument(
+        "--queries", type=int, default=50, help="Queries per checkpoint"
+    )
+    parser.add_argument(
+        "--subset", type=int, default=5, help="Articles in the searched subset"
+    )
+    parser.add_argument("--top-k", type=int, default=4)
+    args = parser.parse_args()
+
+    embedding_function = RemoteEmbeddingsStub(args.dimensions, 0.0, 0.0, 1000)
+    runs = {
+        "every-add": (
+            {"snapshot_min_vectors": 0, "snapshot_growth": 0.0},
+            [n for n in args.articles if n <= args.baseline_articles],
+        ),
+        "logged": ({}, args.articles),
+    }
+
+    print(
+        f"{'saves':<11}{'articles':>10}{'vectors':>10}{'add ms':>10}{'max ms':>10}"
+        f"{'total s':>10}{'query ms':>10}{'subset ms':>11}"
+    )
+    for name, (options, checkpoints) in runs.items():
+        with tempfile.TemporaryDirectory() as path:
+            index = CorpusIndex(embedding_function, path=path, **options)
+            for result in benchmark_corpus(
+                index,
+                checkpoints,
+                args.chunks,
+                args.dimensions,
+                args.queries,
+                args.subset,
+                args.top_k,
+            ):
+                print(
+                    f"{name:<11}{result['articles']:>10}{result['vectors']:>10}"
+                    f"{result['add_ms']:>10.1f}{result['add_max_ms']:>10.0f}"
+                    f"{result['total_seconds']:>10.1f}{result['query_ms']:>10.2f}"
+                    f"{result['subset_query_ms']:>11.2f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
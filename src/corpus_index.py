@@ -0,0 +1,515 @@
+import asyncio
+import faiss
+import os
+import numpy as np
+import threading
+from filelock import FileLock
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import Embeddings
+from langchain_community.vectorstores.utils import maximal_marginal_relevance
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForRetrieverRun,
+    CallbackManagerForRetrieverRun,
+)
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from typing import Any, Dict, List, Tuple
+from uuid import uuid4
+from .config import (
+    embedding_folder,
+    CORPUS_INDEX_TYPE,
+    CORPUS_RETRAIN_LIST_GROWTH,
+    CORPUS_SNAPSHOT_MIN_VECTORS,
+    CORPUS_SNAPSHOT_GROWTH,
+)
+from .docstore import SQLiteDocstore
+from .file_manifest import file_manifest
+from .ingestion import embed_pdf_chunks
+from .keyword_index import _documents
+from .index_factory import (
+    STORE_METADATA_FILE,
+    StoreSettings,
+    _ivf_lists,
+    build_index,
+    effective_index_type,
+    load_store_metadata,
+)
+from .persistence import (
+    DOCSTORE_FILE,
+    is_vector_store,
+    load_vector_store,
+    save_vector_store,
+)
+from .vector_store import embedding_backend
+
+CORPUS_INDEX_UPGRADES = ["flat", "ivf_flat", "ivf_pq"]
+LOCK_FILE = "corpus.lock"
+LOG_PREFIX = "vectors."
+LOG_SUFFIX = ".log"
+CHUNK_ID_BYTES = 36  # chunk ids are uuid4 strings
+
+
+class SubsetRetriever(BaseRetriever):
+    """
+    Retrieve the chunks of a subset of the corpus documents. The index search is restricted to
+    the labels of their chunks, instead of filtering the neighbours found in the whole corpus,
+    so its cost does not depend on the share of the corpus the subset holds.
+    """
+
+    vector_store: Any
+    labels: Any  # the sorted int64 labels of the subset
+    search_type: str = "similarity"
+    k: int = 4
+    fetch_k: int = 20
+    lambda_mult: float = 0.5
+
+    def _search(self, embedding: List[float]) -> List[Document]:
+        if len(self.labels) == 0:
+            return []
+        index = self.vector_store.index
+        selector = faiss.IDSelectorBatch(self.labels)
+        ivf = faiss.try_extract_index_ivf(index)
+        if ivf is not None:
+            params = faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nprobe)
+        else:
+            params = faiss.SearchParameters(sel=selector)
+        query = np.array([embedding], dtype=np.float32)
+        k = self.fetch_k if self.search_type == "mmr" else self.k
+        _, labels = index.search(query, min(k, len(self.labels)), params=params)
+        labels = [label for label in labels[0].tolist() if label >= 0]
+        if self.search_type == "mmr" and labels:
+            selected = maximal_marginal_relevance(
+                query[0],
+                [index.reconstruct(label) for label in labels],
+                lambda_mult=self.lambda_mult,
+                k=self.k,
+            )
+            labels = [labels[i] for i in selected]
+        return _documents(self.vector_store, labels)
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        if len(self.labels) == 0:
+            return []
+        return self._search(self.vector_store.embedding_function.embed_query(query))
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        if len(self.labels) == 0:
+            return []
+        embedding = await self.vector_store.embedding_function.aembed_query(query)
+        return await asyncio.to_thread(self._search, embedding)
+
+
+class CorpusIndex:
+    """
+    Single vector store holding the chunks of every document, each tagged with its doc_id
+    (the file hash), source path and page. The whole corpus, or a subset of documents,
+    is searched with one vectorized search.
+
+    The index starts flat and is retrained into the configured index type once the corpus
+    holds enough vectors to train it.
+
+    Added documents go to the index in memory and to the docstore in place, and their vectors and
+    chunk ids are appended to a log replayed on load. The whole index is only saved again, as a new
+    generation with an empty log, once the log holds a share of the corpus or after a delete or a
+    retraining, so adding a document costs about the same at 10 or 10,000 documents. Worker processes
+    sharing the corpus update it under a file lock, and catch up on the changes of the others before
+    updating or searching it.
+    """
+
+    def __init__(
+        self,
+        embedding_function: Embeddings,
+        settings: StoreSettings = StoreSettings(index_type=CORPUS_INDEX_TYPE),
+        path: str = None,
+        snapshot_min_vectors: int = CORPUS_SNAPSHOT_MIN_VECTORS,
+        snapshot_growth: float = CORPUS_SNAPSHOT_GROWTH,
+    ):
+        if settings.index_type == "hnsw":
+            raise ValueError("The corpus index needs an index type supporting deletes")
+        self.embedding_function = embedding_function
+        self.settings = settings
+        self.path = path or os.path.join(
+            embedding_folder, f"corpus_{embedding_backend(embedding_function)}"
+        )
+        self.snapshot_min_vectors = snapshot_min_vectors
+        self.snapshot_growth = snapshot_growth
+        os.makedirs(self.path, exist_ok=True)
+        self._lock = threading.RLock()
+        self._file_lock = FileLock(os.path.join(self.path, LOCK_FILE))
+        self._store: FAISS | None = None
+        self._metadata: Dict[str, Any] = {}
+        self._chunk_ids: Dict[str, List[str]] = {}  # doc_id -> chunk ids
+        self._labels: Dict[str, List[int]] = {}  # doc_id -> index labels
+        self._doc_ids: Dict[str, str] = {}  # source path -> doc_id
+        self._generation = 0  # number of times the whole index was saved
+        self._saved_vectors = 0  # vectors in the saved index, the others are in the log
+        self._log_offset = 0  # bytes of the log applied to the index
+        self._disk_state: Tuple | None = None
+
+    def _log_path(self) -> str:
+        return os.path.join(self.path, f"{LOG_PREFIX}{self._generation}{LOG_SUFFIX}")
+
+    def _log_dtype(self) -> np.dtype:
+        return np.dtype(
+            [
+                ("chunk_id", f"S{CHUNK_ID_BYTES}"),
+                ("vector", np.float32, self._store.index.d),
+            ]
+        )
+
+    def _disk_signature(self) -> Tuple:
+        # Changes whenever a process saves the whole index or appends to the log
+        signature = []
+        for path in (os.path.join(self.path, STORE_METADATA_FILE), self._log_path()):
+            try:
+                stat = os.stat(path)
+                signature.append((stat.st_ino, stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                signature.append(None)
+        return tuple(signature)
+
+    def _register(self, chunk_id: str, label: int, metadata: Dict[str, Any]):
+        doc_id = metadata["doc_id"]
+        self._chunk_ids.setdefault(doc_id, []).append(chunk_id)
+        self._labels.setdefault(doc_id, []).append(label)
+        self._doc_ids[os.path.normpath(metadata["source"])] = doc_id
+
+    def _sync(self):
+        """
+        Catch up with the corpus on disk, under the file lock: load it again if another process
+        saved a new generation, otherwise apply the vectors they logged since the last sync
+        """
+
+        if is_vector_store(self.path):
+            if (
+                self._store is None
+                or load_store_metadata(self.path).get("generation", 0)
+                != self._generation
+            ):
+                self._load()
+            else:
+                self._replay_log()
+        self._disk_state = self._disk_signature()
+
+    def _load(self):
+        # The corpus is updated in place, so its vectors are loaded in memory
+        self._store = load_vector_store(self.path, self.embedding_function, mmap=False)
+        self._metadata = load_store_metadata(self.path)
+        self._generation = self._metadata.get("generation", 0)
+        self._saved_vectors = self._store.index.ntotal
+        self._log_offset = 0
+        self._replay_log(register=False)
+
+        self._chunk_ids, self._labels, self._doc_ids = {}, {}, {}
+        labels = {
+            chunk_id: label
+            for label, chunk_id in self._store.index_to_docstore_id.items()
+        }
+        orphans = []
+        for chunk_id, metadata in self._store.docstore.metadata_items():
+            if chunk_id in labels:
+                self._register(chunk_id, labels[chunk_id], metadata)
+            else:
+                orphans.append(chunk_id)
+        if orphans:
+            # Stored by a process that stopped before logging their vectors
+            self._store.docstore.delete(orphans)
+
+    def _replay_log(self, register: bool = True):
+        """
+        Add the vectors logged since the last replay to the index
+
+        Args:
+            register (bool): Whether to register the documents of the vectors, reading their
+                metadata from the docstore
+        """
+
+        try:
+            with open(self._log_path(), "rb") as f:
+                f.seek(self._log_offset)
+                data = f.read()
+        except FileNotFoundError:
+            return
+        dtype = self._log_dtype()
+        # A record cut short by a crash is ignored, and overwritten by the next append
+        data = data[: len(data) - len(data) % dtype.itemsize]
+        if not data:
+            return
+        records = np.frombuffer(data, dtype=dtype)
+        chunk_ids = [chunk_id.decode("ascii") for chunk_id in records["chunk_id"]]
+        start = self._store.index.ntotal
+        self._store.index.add(np.ascontiguousarray(records["vector"]))
+        self._store.index_to_docstore_id.update(
+            {start + i: chunk_id for i, chunk_id in enumerate(chunk_ids)}
+        )
+        self._log_offset += len(data)
+        if register:
+            chunks = self._store.docstore.mget(chunk_ids)
+            for i, chunk_id in enumerate(chunk_ids):
+                if chunk_id in chunks:
+                    self._register(chunk_id, start + i, chunks[chunk_id].metadata)
+
+    def _append_log(self, chunk_ids: List[str], vectors: np.ndarray):
+        records = np.empty(len(chunk_ids), dtype=self._log_dtype())
+        records["chunk_id"] = [chunk_id.encode("ascii") for chunk_id in chunk_ids]
+        records["vector"] = vectors
+        with open(self._log_path(), "ab") as f:
+            f.truncate(self._log_offset)
+            f.write(records.tobytes())
+        self._log_offset += records.nbytes
+        self._disk_state = self._disk_signature()
+
+    def add_document(self, file_path: str) -> str:
+        """
+        Add the chunks of a PDF to the corpus, replacing the previous version of the same path
+
+        Args:
+            file_path (str): The path to the PDF
+
+        Returns:
+            str: The doc_id of the document
+        """
+
+        doc_id = file_manifest.get_hash(file_path)
+        with self._lock, self._file_lock:
+            self._sync()
+            if doc_id in self._chunk_ids:
+                return doc_id
+
+        chunks, vectors = embed_pdf_chunks(file_path, self.embedding_function)
+        self.add_chunks(doc_id, file_path, chunks, vectors)
+        return doc_id
+
+    def add_chunks(
+        self,
+        doc_id: str,
+        file_path: str,
+        chunks: List[Document],
+        vectors: List[List[float]],
+    ):
+        """
+        Add the embedded chunks of a document to the corpus, replacing the previous version of the
+        same path. Nothing is added if the document is already in the corpus.
+
+        Args:
+            doc_id (str): The doc_id of the document
+            file_path (str): The path to the document
+            chunks (List[Document]): The chunks
+            vectors (List[List[float]]): The embeddings of the chunks
+        """
+
+        source = os.path.normpath(file_path)
+        texts = [chunk.page_content for chunk in chunks]
+        metadatas = [{**chunk.metadata, "doc_id": doc_id} for chunk in chunks]
+        ids = [str(uuid4()) for _ in chunks]
+        vectors = np.asarray(vectors, dtype=np.float32)
+
+        with self._lock, self._file_lock:
+            self._sync()
+            if doc_id in self._chunk_ids:
+                return
+            replaced = self._doc_ids.get(source)
+            created = self._store is None
+            if created:
+                index, self._metadata = build_index(vectors, self.settings)
+                docstore_path = os.path.join(self.path, DOCSTORE_FILE)
+                if os.path.exists(docstore_path):
+                    os.remove(docstore_path)  # left over by an interrupted first save
+                self._store = FAISS(
+                    embedding_function=self.embedding_function,
+                    index=index,
+                    docstore=SQLiteDocstore(docstore_path),
+                    index_to_docstore_id={},
+                )
+            start = self._store.index.ntotal
+            self._store.add_embeddings(
+                text_embeddings=list(zip(texts, vectors)), metadatas=metadatas, ids=ids
+            )
+            for i, (chunk_id, metadata) in enumerate(zip(ids, metadatas)):
+                self._register(chunk_id, start + i, metadata)
+            if replaced is not None:
+                self._delete(replaced)
+            retrained = self._maybe_retrain()
+            logged = self._store.index.ntotal - self._saved_vectors
+            if (
+                created
+                or retrained
+                or replaced is not None
+                or logged
+                > max(
+                    self.snapshot_min_vectors,
+                    self.snapshot_growth * self._saved_vectors,
+                )
+            ):
+                self._save()
+            else:
+                self._append_log(ids, vectors)
+
+    def _maybe_retrain(self) -> bool:
+        """
+        Rebuild the index into a more scalable type once the corpus holds enough vectors to train it,
+        or with more inverted lists once the corpus outgrew the ones it was trained with
+
+        Returns:
+            bool: Whether the index was rebuilt
+        """
+
+        index = self._store.index
+        target = effective_index_type(self.settings.index_type, index.ntotal)
+        current = self._metadata.get("effective_index_type", "flat")
+        ivf = faiss.try_extract_index_ivf(index)
+        outgrown = (
+            ivf is not None
+            and _ivf_lists(index.ntotal) >= CORPUS_RETRAIN_LIST_GROWTH * ivf.nlist
+        )
+        if (
+            CORPUS_INDEX_UPGRADES.index(target) <= CORPUS_INDEX_UPGRADES.index(current)
+            and not outgrown
+        ):
+            return False
+
+        print(f"Retraining the corpus index as {target} on {index.ntotal} vectors")
+        vectors = index.reconstruct_n(0, index.ntotal)
+        new_index, self._metadata = build_index(vectors, self.settings)
+        new_index.add(vectors)
+        self._store.index = new_index
+        return True
+
+    def _save(self):
+        """
+        Save the whole index as a new generation, whose log starts empty
+        """
+
+        self._generation += 1
+        self._metadata["num_vectors"] = self._store.index.ntotal
+        self._metadata["generation"] = self._generation
+        save_vector_store(self._store, self.path, self._metadata)
+        self._saved_vectors = self._store.index.ntotal
+        self._log_offset = 0
+        for name in os.listdir(self.path):
+            if (
+                name.startswith(LOG_PREFIX)
+                and name.endswith(LOG_SUFFIX)
+                and os.path.join(self.path, name) != self._log_path()
+            ):
+                os.remove(os.path.join(self.path, name))
+        self._disk_state = self._disk_signature()
+
+    def delete_document(self, file_path: str) -> bool:
+        """
+        Remove the chunks of a PDF from the corpus
+
+        Args:
+            file_path (str): The path to the PDF
+
+        Returns:
+            bool: Whether the document was in the corpus
+        """
+
+        with self._lock, self._file_lock:
+            self._sync()
+            doc_id = self._doc_ids.get(os.path.normpath(file_path))
+            if doc_id is None:
+                return False
+            self._delete(doc_id)
+            self._save()
+            return True
+
+    def _delete(self, doc_id: str):
+        removed = set(self._chunk_ids.pop(doc_id))
+        del self._labels[doc_id]
+        index = self._store.index
+        labels = sorted(self._store.index_to_docstore_id)
+        kept = [i for i in labels if self._store.index_to_docstore_id[i] not in removed]
+        if faiss.try_extract_index_ivf(index) is not None:
+            # IVF indexes keep the labels of the remaining vectors on removal, so rebuild the lists
+            # to keep labels contiguous as index_to_docstore_id expects
+            vectors = [index.reconstruct(i) for i in kept]
+            index.reset()
+            if vectors:
+                index.add(np.vstack(vectors))
+        else:
+            removed_labels = sorted(set(labels) - set(kept))
+            index.remove_ids(np.array(removed_labels, dtype=np.int64))
+        self._store.docstore.delete(list(removed))
+        self._store.index_to_docstore_id = {
+            new_label: self._store.index_to_docstore_id[old_label]
+            for new_label, old_label in enumerate(kept)
+        }
+        self._doc_ids = {
+            source: other for source, other in self._doc_ids.items() if other != doc_id
+        }
+        # The remaining vectors were relabelled
+        chunk_docs = {
+            chunk_id: other
+            for other, chunk_ids in self._chunk_ids.items()
+            for chunk_id in chunk_ids
+        }
+        self._labels = {}
+        for label, chunk_id in self._store.index_to_docstore_id.items():
+            self._labels.setdefault(chunk_docs[chunk_id], []).append(label)
+
+    def as_retriever(
+        self, search_type: str, k: int, file_paths: List[str] = None
+    ) -> BaseRetriever:
+        """
+        Get a retriever over the whole corpus, or over a subset of its documents
+
+        Args:
+            search_type (str): The search type to use
+            k (int): The number of chunks to retrieve
+            file_paths (List[str]): The paths of the documents to search in, None to search the whole corpus
+
+        Returns:
+            BaseRetriever: The retriever object, searching only the labels of the subset if given
+        """
+
+        with self._lock:
+            if self._store is None or self._disk_signature() != self._disk_state:
+                with self._file_lock:
+                    self._sync()
+            store = self._store
+            if store is None:
+                raise ValueError("The corpus index is empty")
+            if file_paths is None:
+                return store.as_retriever(
+                    search_type=search_type, search_kwargs={"k": k}
+                )
+            doc_ids = {
+                self._doc_ids[source]
+                for source in map(os.path.normpath, file_paths)
+                if source in self._doc_ids
+            }
+            labels = [label for doc_id in doc_ids for label in self._labels[doc_id]]
+            return SubsetRetriever(
+                vector_store=store,
+                labels=np.array(sorted(labels), dtype=np.int64),
+                search_type=search_type,
+                k=k,
+            )
+
+
+_corpus_indexes: Dict[str, CorpusIndex] = {}
+_corpus_indexes_lock = threading.Lock()
+
+
+def get_corpus_index(embedding_function: Embeddings) -> CorpusIndex:
+    """
+    Get the process-wide corpus index of an embedding backend
+
+    Args:
+        embedding_function (Embeddings): The embedding function of the corpus
+
+    Returns:
+        CorpusIndex: The corpus index
+    """
+
+    with _corpus_indexes_lock:
+        backend = embedding_backend(embedding_function)
+        if backend not in _corpus_indexes:
+            _corpus_indexes[backend] = CorpusIndex(embedding_function)
+        return _corpus_indexes[backend]
@@ -0,0 +1,156 @@
+import json
+import os
+import sqlite3
+import threading
+import zlib
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_core.documents import Document
+from typing import Dict, Iterator, List, Tuple
+from .config import DOCSTORE_COMPRESSION_LEVEL
+
+SQLITE_MAX_VARIABLES = 500
+
+
+class SQLiteDocstore(Docstore, AddableMixin):
+    """
+    Docstore keeping the chunks of a vector store in a SQLite file instead of in memory.
+    Chunks are only read when a search returns them, and their text is optionally zlib-compressed.
+    Unlike the pickled InMemoryDocstore, loading it never deserializes arbitrary objects.
+    """
+
+    def __init__(self, path: str, compression_level: int = DOCSTORE_COMPRESSION_LEVEL):
+        self.path = path
+        self.compression_level = compression_level
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connection() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS chunks ("
+                "id TEXT PRIMARY KEY, content BLOB NOT NULL, compressed INTEGER NOT NULL, "
+                "metadata TEXT NOT NULL)"
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        # SQLite connections cannot be shared across threads, so keep one per thread
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            self._local.connection = connection
+        return connection
+
+    def _encode(self, text: str) -> Tuple[bytes, int]:
+        content = text.encode("utf-8")
+        if self.compression_level > 0:
+            return zlib.compress(content, self.compression_level), 1
+        return content, 0
+
+    @staticmethod
+    def _decode(content: bytes, compressed: int, metadata: str) -> Document:
+        if compressed:
+            content = zlib.decompress(content)
+        return Document(
+            page_content=content.decode("utf-8"), metadata=json.loads(metadata)
+        )
+
+    def search(self, search: str) -> str | Document:
+        """
+        Get a chunk by id
+
+        Args:
+            search (str): The id of the chunk
+
+        Returns:
+            str | Document: The chunk, or an error message if it does not exist
+        """
+
+        row = (
+            self._connection()
+            .execute(
+                "SELECT content, compressed, metadata FROM chunks WHERE id = ?",
+                (search,),
+            )
+            .fetchone()
+        )
+        if row is None:
+            return f"ID {search} not found."
+        return self._decode(*row)
+
+    def mget(self, ids: List[str]) -> Dict[str, Document]:
+        """
+        Get several chunks by id in one query
+
+        Args:
+            ids (List[str]): The ids of the chunks
+
+        Returns:
+            Dict[str, Document]: The chunks found, by id
+        """
+
+        found = {}
+        for i in range(0, len(ids), SQLITE_MAX_VARIABLES):
+            batch = ids[i : i + SQLITE_MAX_VARIABLES]
+            rows = self._connection().execute(
+                "SELECT id, content, compressed, metadata FROM chunks "
+                f"WHERE id IN ({','.join('?' * len(batch))})",
+                batch,
+            )
+            for chunk_id, *row in rows:
+                found[chunk_id] = self._decode(*row)
+        return found
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        """
+        Add chunks to the docstore
+
+        Args:
+            texts (Dict[str, Document]): The chunks, by id
+        """
+
+        rows = [
+            (chunk_id, *self._encode(doc.page_content), json.dumps(doc.metadata))
+            for chunk_id, doc in texts.items()
+        ]
+        with self._lock, self._connection() as connection:
+            try:
+                connection.executemany(
+                    "INSERT INTO chunks (id, content, compressed, metadata) VALUES (?, ?, ?, ?)",
+                    rows,
+                )
+            except sqlite3.IntegrityError:
+                raise ValueError("Tried to add ids that already exist")
+
+    def delete(self, ids: List) -> None:
+        """
+        Remove chunks from the docstore
+
+        Args:
+            ids (List): The ids of the chunks
+        """
+
+        with self._lock, self._connection() as connection:
+            connection.executemany(
+                "DELETE FROM chunks WHERE id = ?", [(chunk_id,) for chunk_id in ids]
+            )
+
+    def metadata_items(self) -> Iterator[Tuple[str, Dict]]:
+        """
+        Iterate over the ids and metadata of every chunk, without reading their text
+
+        Returns:
+            Iterator[Tuple[str, Dict]]: The (id, metadata) pairs
+        """
+
+        for chunk_id, metadata in self._connection().execute(
+            "SELECT id, metadata FROM chunks"
+        ):
+            yield chunk_id, json.loads(metadata)
+
+    def close(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def __len__(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
@@ -1,20 +1,132 @@
 from langchain_core import embeddings
+import asyncio
+import queue
 import requests
-from typing import Dict, List
-from ..config import base_url, openwebui_api_key, embedding_model
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from typing import Any, Dict, List, Tuple
+from .config import (
+    base_url,
+    openwebui_api_key,
+    embedding_model,
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_MAX_CONCURRENCY,
+    EMBEDDING_TIMEOUT,
+    EMBEDDING_MAX_RETRIES,
+    LOCAL_EMBEDDING_MODEL,
+    LOCAL_EMBEDDING_BATCH_SIZE,
+    LOCAL_EMBEDDING_THREADS,
+    LOCAL_EMBEDDING_QUANTIZE,
+    LOCAL_EMBEDDING_BATCH_WAIT,
+    EMBEDDING_BACKEND,
+)
+from .index_factory import truncate_embeddings
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
 
 
 class My_embeddings(embeddings.Embeddings):
-    def __init__(self, model: str = "mxbai-embed-large:latest"):
+    """
+    Embeddings served by an Ollama endpoint.
+
+    Requests go through a pooled keep-alive session and are retried with exponential backoff.
+    With batch_size > 1, texts are sent in batches to the batched `/api/embed` route,
+    otherwise one by one to the legacy `/api/embeddings` route.
+    Up to max_concurrency batches are in flight at the same time.
+    """
+
+    def __init__(
+        self,
+        model: str = "mxbai-embed-large:latest",
+        base_url: str = base_url,
+        api_key: str = openwebui_api_key,
+        batch_size: int = EMBEDDING_BATCH_SIZE,
+        max_concurrency: int = EMBEDDING_MAX_CONCURRENCY,
+        timeout: float = EMBEDDING_TIMEOUT,
+        max_retries: int = EMBEDDING_MAX_RETRIES,
+        backoff_factor: float = 0.5,
+    ):
         self.model = model
+        self.base_url = base_url
+        self.batch_size = max(batch_size, 1)
+        self.max_concurrency = max(max_concurrency, 1)
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.batch_timings = deque(maxlen=1000)
+
+        self.session = requests.Session()
+        self.session.headers.update({"Authorization": f"Bearer {api_key}"})
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _post(self, route: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Post a payload to the endpoint, retrying on connection errors and transient status codes
+
+        Args:
+            route (str): The API route, e.g. "/api/embed"
+            payload (Dict[str, Any]): The JSON payload
+
+        Returns:
+            Dict[str, Any]: The JSON response
+        """
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.session.post(
+                    url=self.base_url + route, json=payload, timeout=self.timeout
+                )
+                if (
+                    response.status_code in RETRY_STATUS_CODES
+                    and attempt < self.max_retries
+                ):
+                    time.sleep(self.backoff_factor * 2**attempt)
+                    continue
+                response.raise_for_status()
+                return response.json()
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(self.backoff_factor * 2**attempt)
 
     def get_embeddings_from_text(self, text: str) -> Dict[str, List[float]]:
-        response = requests.post(
-            url=base_url + "/api/embeddings",
-            headers={"Authorization": f"Bearer {openwebui_api_key}"},
-            json={"model": self.model, "prompt": text},
+        return self._post("/api/embeddings", {"model": self.model, "prompt": text})
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed a single batch of texts and record how long it took
+
+        Args:
+            texts: Texts to embed.
+
+        Returns:
+            List of embeddings.
+        """
+
+        start = time.perf_counter()
+        if self.batch_size > 1:
+            vectors = self._post("/api/embed", {"model": self.model, "input": texts})[
+                "embeddings"
+            ]
+        else:
+            vectors = [
+                self.get_embeddings_from_text(text)["embedding"] for text in texts
+            ]
+        self.batch_timings.append(
+            {"size": len(texts), "seconds": time.perf_counter() - start}
         )
-        return response.json()
+        return vectors
+
+    def _batches(self, texts: List[str]) -> List[List[str]]:
+        return [
+            texts[i : i + self.batch_size]
+            for i in range(0, len(texts), self.batch_size)
+        ]
 
     def embed_query(self, text: str) -> List[float]:
         """Embed query text.
@@ -25,10 +137,38 @@ class My_embeddings(embeddings.Embeddings):
         Returns:
             Embedding.
         """
-        return self.get_embeddings_from_text(text)["embedding"]
+        return self._embed_batch([text])[0]
 
     def embed_documents(self, texts: List[str]) -> List[List[float]]:
-        """Embed search docs.
+        """Embed search docs, running up to max_concurrency batches in a thread pool.
+
+        Args:
+            texts: List of text to embed.
+
+        Returns:
+            List of embeddings.
+        """
+        batches = self._batches(texts)
+        if self.max_concurrency == 1 or len(batches) <= 1:
+            results = [self._embed_batch(batch) for batch in batches]
+        else:
+            with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+                results = list(executor.map(self._embed_batch, batches))
+        return [vector for batch in results for vector in batch]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """Asynchronous embed query text.
+
+        Args:
+            text: Text to embed.
+
+        Returns:
+            Embedding.
+        """
+        return (await asyncio.to_thread(self._embed_batch, [text]))[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Asynchronous embed search docs, with up to max_concurrency batches in flight.
 
         Args:
             texts: List of text to embed.
@@ -36,10 +176,228 @@ class My_embeddings(embeddings.Embeddings):
         Returns:
             List of embeddings.
         """
-        embeddings = []
-        for text in texts:
-            embeddings.append(self.get_embeddings_from_text(text)["embedding"])
-        return embeddings
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def embed_batch(batch: List[str]) -> List[List[float]]:
+            async with semaphore:
+                return await asyncio.to_thread(self._embed_batch, batch)
+
+        results = await asyncio.gather(
+            *(embed_batch(batch) for batch in self._batches(texts))
+        )
+        return [vector for batch in results for vector in batch]
+
+
+class LocalEmbeddings(embeddings.Embeddings):
+    """
+    Embeddings computed in process, on CPU, by a sentence-transformers model.
+
+    The model is only loaded on first use, with torch limited to num_threads threads and, with quantize,
+    its linear layers quantized to int8 by torch dynamic quantization. Documents are encoded in batches
+    of batch_size texts, which sentence-transformers sorts by length to limit padding. Queries are
+    batched dynamically: a background thread waits up to batch_wait seconds for concurrent queries
+    and encodes them together.
+    """
+
+    def __init__(
+        self,
+        model: str = LOCAL_EMBEDDING_MODEL,
+        batch_size: int = LOCAL_EMBEDDING_BATCH_SIZE,
+        num_threads: int = LOCAL_EMBEDDING_THREADS,
+        quantize: bool = LOCAL_EMBEDDING_QUANTIZE,
+        batch_wait: float = LOCAL_EMBEDDING_BATCH_WAIT,
+    ):
+        self.model = model
+        self.batch_size = max(batch_size, 1)
+        self.num_threads = max(num_threads, 1)
+        self.quantize = quantize
+        self.batch_wait = batch_wait
+        self.batch_timings = deque(maxlen=1000)
+        self._encoder = None
+        self._lock = threading.Lock()
+        self._queries: queue.Queue[Tuple[str, Future]] = queue.Queue()
+        self._batcher: threading.Thread | None = None
+
+    @property
+    def encoder(self):
+        if self._encoder is None:
+            with self._lock:
+                if self._encoder is None:
+                    self._encoder = self._load()
+        return self._encoder
+
+    def _load(self):
+        # Imported here so that the API runs without torch when the local backend is not used
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        start = time.perf_counter()
+        torch.set_num_threads(self.num_threads)
+        encoder = SentenceTransformer(self.model, device="cpu")
+        if self.quantize:
+            encoder = torch.quantization.quantize_dynamic(
+                encoder, {torch.nn.Linear}, dtype=torch.qint8
+            )
+        print(
+            f"Loaded {self.model}{' (int8)' if self.quantize else ''} "
+            f"in {time.perf_counter() - start:.1f}s"
+        )
+        return encoder
+
+    def _encode(self, texts: List[str]) -> List[List[float]]:
+        start = time.perf_counter()
+        vectors = self.encoder.encode(
+            texts,
+            batch_size=self.batch_size,
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+            show_progress_bar=False,
+        )
+        self.batch_timings.append(
+            {"size": len(texts), "seconds": time.perf_counter() - start}
+        )
+        return vectors.tolist()
+
+    def _batch_queries(self):
+        # Never exits: if the thread died, every later query would wait forever
+        while True:
+            try:
+                self._encode_query_batch()
+            except Exception as e:
+                print(f"Local embedding batcher error: {e}")
+
+    def _encode_query_batch(self):
+        batch = [self._queries.get()]
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(
+                    self._queries.get(timeout=max(deadline - time.monotonic(), 0))
+                )
+            except queue.Empty:
+                break
+
+        # Skip the queries whose caller was cancelled or timed out, the others can no longer be cancelled
+        batch = [
+            (text, future)
+            for text, future in batch
+            if future.set_running_or_notify_cancel()
+        ]
+        if not batch:
+            return
+        try:
+            vectors = self._encode([text for text, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, future), vector in zip(batch, vectors):
+            future.set_result(vector)
+
+    def _submit_query(self, text: str) -> Future:
+        with self._lock:
+            if self._batcher is None:
+                self._batcher = threading.Thread(
+                    target=self._batch_queries, name="local-embeddings", daemon=True
+                )
+                self._batcher.start()
+        future = Future()
+        self._queries.put((text, future))
+        return future
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed query text, in a batch with the queries received at the same time.
+
+        Args:
+            text: Text to embed.
+
+        Returns:
+            Embedding.
+        """
+        return self._submit_query(text).result()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed search docs in batches of batch_size texts.
+
+        Args:
+            texts: List of text to embed.
+
+        Returns:
+            List of embeddings.
+        """
+        return self._encode(texts) if texts else []
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """Asynchronous embed query text, without blocking the event loop while it waits for its batch.
+
+        Args:
+            text: Text to embed.
+
+        Returns:
+            Embedding.
+        """
+        return await asyncio.wrap_future(self._submit_query(text))
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Asynchronous embed search docs, encoded in a worker thread.
+
+        Args:
+            texts: List of text to embed.
+
+        Returns:
+            List of embeddings.
+        """
+        return await asyncio.to_thread(self.embed_documents, texts)
+
+
+class TruncatedEmbeddings(embeddings.Embeddings):
+    """
+    Wraps an embedding function to keep only the first dimensions of its (Matryoshka) embeddings,
+    re-normalized, so that queries match stores built with truncated vectors.
+    """
+
+    def __init__(self, underlying: embeddings.Embeddings, dimensions: int):
+        self.underlying = underlying
+        self.dimensions = dimensions
+
+    def _truncate(self, vectors: List[List[float]]) -> List[List[float]]:
+        return truncate_embeddings(vectors, self.dimensions).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._truncate([self.underlying.embed_query(text)])[0]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._truncate(self.underlying.embed_documents(texts))
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return self._truncate([await self.underlying.aembed_query(text)])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._truncate(await self.underlying.aembed_documents(texts))
 
 
 my_embeddings = My_embeddings(model=embedding_model)
+local_embeddings = LocalEmbeddings()
+
+
+def get_embedding_function(backend: str = EMBEDDING_BACKEND) -> embeddings.Embeddings:
+    """
+    Get the embedding function of a backend
+
+    Args:
+        backend (str): "openai" for text-embedding-3-large, "custom" for the Ollama endpoint,
+            "local" for the in-process sentence-transformers model
+
+    Returns:
+        Embeddings: The embedding function
+    """
+
+    if backend == "openai":
+        from langchain_openai import OpenAIEmbeddings
+
+        return OpenAIEmbeddings(model="text-embedding-3-large")
+    if backend == "custom":
+        return my_embeddings
+    if backend == "local":
+        return local_embeddings
+    raise ValueError(f"Unknown embedding backend {backend}")
@@ -0,0 +1,208 @@
+"""
+Compare the chunk throughput and query latency of the embedding backends.
+The remote backends are replaced by stubs that reproduce their request latency and batching, so the
+benchmark runs offline and costs nothing. The local backend runs the real model.
+
+Usage:
+    python -m src.embedding_benchmark [--backends openai custom local] [--chunks 512] [--queries 32]
+                                      [--concurrency 8] [--openai-latency 0.4] [--ollama-latency 0.15]
+                                      [pdf_path]
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.embeddings import Embeddings
+from typing import Any, Dict, List
+from .config import EMBEDDING_BATCH_SIZE, EMBEDDING_MAX_CONCURRENCY
+from .embedding import LocalEmbeddings
+from .ingestion import iter_pdf_chunks
+
+SAMPLE_QUERIES = [
+    "What is the response rate of capmatinib in MET exon 14 skipping NSCLC?",
+    "Which resistance mechanisms to MET inhibitors are described?",
+    "When was this article published?",
+    "Describe the use of the term MET in this article.",
+]
+
+
+class RemoteEmbeddingsStub(Embeddings):
+    """
+    Stands in for a remote embedding endpoint: each request sleeps for a fixed round-trip latency plus
+    a per-text latency and returns random vectors. Texts are sent in batches of batch_size, with up to
+    max_concurrency requests in flight, like the real client. Queries can also be embedded
+    asynchronously, like with the real clients.
+    """
+
+    def __init__(
+        self,
+        dimensions: int,
+        request_latency: float,
+        text_latency: float,
+        batch_size: int,
+        max_concurrency: int = 1,
+    ):
+        self.dimensions = dimensions
+        self.request_latency = request_latency
+        self.text_latency = text_latency
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.rng = np.random.default_rng(0)
+
+    def _request(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(self.request_latency + self.text_latency * len(texts))
+        return self.rng.standard_normal((len(texts), self.dimensions)).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        batches = [
+            texts[i : i + self.batch_size]
+            for i in range(0, len(texts), self.batch_size)
+        ]
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            return [
+                vector
+                for batch in executor.map(self._request, batches)
+                for vector in batch
+            ]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._request([text])[0]
+
+    async def _arequest(self, texts: List[str]) -> List[List[float]]:
+        await asyncio.sleep(self.request_latency + self.text_latency * len(texts))
+        return self.rng.standard_normal((len(texts), self.dimensions)).tolist()
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self._arequest([text]))[0]
+
+
+def sample_texts(file_path: str | None, num_chunks: int) -> List[str]:
+    """
+    Get the chunks to embed: those of a PDF, repeated as needed, or synthetic chunks
+
+    Args:
+        file_path (str | None): The path to a PDF, None for synthetic chunks
+        num_chunks (int): The number of chunks
+
+    Returns:
+        List[str]: The chunks
+    """
+
+    if file_path is not None:
+        chunks = [chunk.page_content for chunk in iter_pdf_chunks(file_path)]
+    else:
+        rng = np.random.default_rng(0)
+        words = " ".join(SAMPLE_QUERIES).split()
+        chunks = [" ".join(rng.choice(words, size=160)) for _ in range(num_chunks)]
+    return [chunks[i % len(chunks)] for i in range(num_chunks)]
+
+
+def benchmark_backend(
+    embedding_function: Embeddings,
+    texts: List[str],
+    num_queries: int,
+    concurrency: int,
+) -> Dict[str, Any]:
+    """
+    Measure the chunk throughput, the latency of sequential queries and the throughput of concurrent queries
+
+    Args:
+        embedding_function (Embeddings): The embedding function
+        texts (List[str]): The chunks to embed
+        num_queries (int): The number of queries
+        concurrency (int): The number of queries sent at the same time for the concurrent measure
+
+    Returns:
+        Dict[str, Any]: The measures
+    """
+
+    queries = [SAMPLE_QUERIES[i % len(SAMPLE_QUERIES)] for i in range(num_queries)]
+    embedding_function.embed_query(queries[0])  # warm-up, e.g. to load a local model
+
+    start = time.perf_counter()
+    embedding_function.embed_documents(texts)
+    chunks_seconds = time.perf_counter() - start
+
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        embedding_function.embed_query(query)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(embedding_function.embed_query, queries))
+    concurrent_seconds = time.perf_counter() - start
+
+    return {
+        "chunks_per_second": len(texts) / chunks_seconds,
+        "query_p50_ms": statistics.median(latencies) * 1000,
+        "query_p95_ms": float(np.percentile(latencies, 95)) * 1000,
+        "concurrent_queries_per_second": len(queries) / concurrent_seconds,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("pdf_path", nargs="?", help="PDF to take the chunks from")
+    parser.add_argument(
+        "--backends",
+        nargs="+",
+        choices=["openai", "custom", "local", "local-int8"],
+        default=["openai", "custom", "local", "local-int8"],
+    )
+    parser.add_argument("--chunks", type=int, default=512)
+    parser.add_argument("--queries", type=int, default=32)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument(
+        "--openai-latency",
+        type=float,
+        default=0.4,
+        help="Round-trip latency of an OpenAI request, in seconds",
+    )
+    parser.add_argument(
+        "--ollama-latency",
+        type=float,
+        default=0.15,
+        help="Round-trip latency of an Ollama request, in seconds",
+    )
+    args = parser.parse_args()
+
+    backends = {
+        # OpenAIEmbeddings sends up to 1000 texts per request, one request at a time
+        "openai": lambda: RemoteEmbeddingsStub(3072, args.openai_latency, 0.0005, 1000),
+        "custom": lambda: RemoteEmbeddingsStub(
+            1024,
+            args.ollama_latency,
+            0.01,
+            EMBEDDING_BATCH_SIZE,
+            EMBEDDING_MAX_CONCURRENCY,
+        ),
+        "local": lambda: LocalEmbeddings(quantize=False),
+        "local-int8": lambda: LocalEmbeddings(quantize=True),
+    }
+
+    texts = sample_texts(args.pdf_path, args.chunks)
+    print(
+        f"{'backend':<12}{'chunks/s':>10}{'query p50 ms':>14}{'query p95 ms':>14}"
+        f"{'concurrent q/s':>16}"
+    )
+    for name in args.backends:
+        try:
+            results = benchmark_backend(
+                backends[name](), texts, args.queries, args.concurrency
+            )
+        except ImportError as e:
+            print(f"{name:<12}skipped: {e}")
+            continue
+        print(
+            f"{name:<12}{results['chunks_per_second']:>10.1f}{results['query_p50_ms']:>14.1f}"
+            f"{results['query_p95_ms']:>14.1f}{results['concurrent_queries_per_second']:>16.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
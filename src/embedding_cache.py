@@ -0,0 +1,362 @@
+import asyncio
+import csv
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from typing import Dict, List, Tuple
+from .config import (
+    embedding_cache_path,
+    EMBEDDING_MAX_CONCURRENCY,
+    prompts_csv_path,
+    QUERY_EMBEDDING_CACHE_MAX_ENTRIES,
+    QUERY_EMBEDDING_CACHE_PERSISTENT,
+)
+
+SQLITE_MAX_VARIABLES = 500
+EMBEDDING_PROGRESS_BATCH_SIZE = 256  # chunks embedded between two progress updates
+
+
+def hash_text(text: str) -> str:
+    """
+    Get the SHA-256 hash of a text, used as its content address in the cache
+
+    Args:
+        text (str): The text to hash
+
+    Returns:
+        str: The hex digest of the text
+    """
+
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def embedding_model_name(embedding_function: Embeddings) -> str:
+    """
+    Get a name identifying the model behind an embedding function, used to key the cache
+
+    Args:
+        embedding_function (Embeddings): The embedding function
+
+    Returns:
+        str: The model name, suffixed with the output dimensions when they are set
+    """
+
+    name = (
+        getattr(embedding_function, "model", None) or type(embedding_function).__name__
+    )
+    dimensions = getattr(embedding_function, "dimensions", None)
+    return f"{name}:{dimensions}" if dimensions else name
+
+
+class EmbeddingCache:
+    """
+    Persistent cache from (model, sha256 of a chunk text) to its embedding, stored in SQLite
+    as float32 blobs. It is shared across documents, so identical chunks are only embedded once.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "model TEXT NOT NULL, text_hash TEXT NOT NULL, vector BLOB NOT NULL, "
+                "PRIMARY KEY (model, text_hash))"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get_many(self, model: str, text_hashes: List[str]) -> Dict[str, List[float]]:
+        """
+        Get the cached embeddings of several texts
+
+        Args:
+            model (str): The model name
+            text_hashes (List[str]): The hashes of the texts
+
+        Returns:
+            Dict[str, List[float]]: The embeddings found, by text hash
+        """
+
+        found = {}
+        with self._connect() as connection:
+            for i in range(0, len(text_hashes), SQLITE_MAX_VARIABLES):
+                batch = text_hashes[i : i + SQLITE_MAX_VARIABLES]
+                rows = connection.execute(
+                    "SELECT text_hash, vector FROM embeddings WHERE model = ? "
+                    f"AND text_hash IN ({','.join('?' * len(batch))})",
+                    [model, *batch],
+                )
+                for text_hash, vector in rows:
+                    found[text_hash] = np.frombuffer(vector, dtype=np.float32).tolist()
+        return found
+
+    def put_many(self, model: str, vectors: Dict[str, List[float]]):
+        """
+        Add several embeddings to the cache
+
+        Args:
+            model (str): The model name
+            vectors (Dict[str, List[float]]): The embeddings, by text hash
+        """
+
+        with self._lock, self._connect() as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector) VALUES (?, ?, ?)",
+                [
+                    (model, text_hash, np.asarray(vector, dtype=np.float32).tobytes())
+                    for text_hash, vector in vectors.items()
+                ],
+            )
+
+
+embedding_cache = EmbeddingCache(embedding_cache_path)
+
+
+def log_cache_stats(stats: Dict[str, int | float]):
+    """
+    Print the embedding cache statistics of a build
+
+    Args:
+        stats (Dict[str, int | float]): The number of chunks, cache hits and chunks embedded
+    """
+
+    hit_ratio = stats["cache_hits"] / stats["chunks"] if stats["chunks"] else 0.0
+    print(
+        f"Embedding cache: {stats['cache_hits']}/{stats['chunks']} chunks cached "
+        f"({hit_ratio:.0%}), {stats['embedded']} embedding calls made"
+    )
+
+
+def embed_with_cache(
+    texts: List[str],
+    embedding_function: Embeddings,
+    cache: EmbeddingCache = embedding_cache,
+    progress: Dict[str, int] = None,
+    verbose: bool = True,
+) -> Tuple[List[List[float]], Dict[str, int | float]]:
+    """
+    Embed texts, only calling the embedding function for the texts that are not cached yet
+
+    Args:
+        texts (List[str]): The texts to embed
+        embedding_function (Embeddings): The embedding function to use for the cache misses
+        cache (EmbeddingCache): The embedding cache
+        progress (Dict[str, int]): Optional dictionary updated in place with the number of
+            chunks to embed and chunks embedded so far
+        verbose (bool): Whether to print the cache statistics
+
+    Returns:
+        Tuple[List[List[float]], Dict[str, int | float]]: The embeddings, in the order of the texts,
+        and the cache statistics of the build
+    """
+
+    model = embedding_model_name(embedding_function)
+    text_hashes = [hash_text(text) for text in texts]
+    unique_texts = dict(zip(text_hashes, texts))
+
+    progress = progress if progress is not None else {}
+
+    vectors = cache.get_many(model, list(unique_texts))
+    missing = [text_hash for text_hash in unique_texts if text_hash not in vectors]
+    progress["chunks_total"] = len(unique_texts)
+    progress["chunks_embedded"] = len(vectors)
+
+    for i in range(0, len(missing), EMBEDDING_PROGRESS_BATCH_SIZE):
+        batch = missing[i : i + EMBEDDING_PROGRESS_BATCH_SIZE]
+        new_vectors = embedding_function.embed_documents(
+            [unique_texts[text_hash] for text_hash in batch]
+        )
+        new_vectors = dict(zip(batch, new_vectors))
+        cache.put_many(model, new_vectors)
+        vectors.update(new_vectors)
+        progress["chunks_embedded"] += len(batch)
+
+    stats = {
+        "chunks": len(texts),
+        "cache_hits": len(texts) - len(missing),
+        "embedded": len(missing),
+        "hit_ratio": (len(texts) - len(missing)) / len(texts) if texts else 0.0,
+    }
+    if verbose:
+        log_cache_stats(stats)
+    return [vectors[text_hash] for text_hash in text_hashes], stats
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """
+    Wraps an embedding function to memoize its query embeddings, keyed on the model and the exact text,
+    in an in-memory LRU backed by the persistent embedding cache. Questions asked again, e.g. the same
+    resume prompts for every article, are then embedded without a round-trip to the embedding endpoint.
+    Documents are embedded by the underlying function, chunks being cached by embed_with_cache.
+    """
+
+    def __init__(
+        self,
+        underlying: Embeddings,
+        max_entries: int = QUERY_EMBEDDING_CACHE_MAX_ENTRIES,
+        cache: EmbeddingCache | None = embedding_cache,
+    ):
+        self.underlying = underlying
+        self.max_entries = max_entries
+        self.cache = cache
+        self.memory_hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def model(self) -> str:
+        return embedding_model_name(self.underlying)
+
+    @property
+    def _cache_model(self) -> str:
+        # Queries may be embedded differently from documents, so they get their own cache entries
+        return f"{self.model}:query"
+
+    def _remember(self, text_hash: str, vector: List[float]):
+        with self._lock:
+            self._entries[text_hash] = vector
+            self._entries.move_to_end(text_hash)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _from_memory(self, text_hash: str) -> List[float] | None:
+        with self._lock:
+            vector = self._entries.get(text_hash)
+            if vector is not None:
+                self._entries.move_to_end(text_hash)
+                self.memory_hits += 1
+        return vector
+
+    def _from_cache(self, text_hash: str) -> List[float] | None:
+        if self.cache is None:
+            return None
+        vector = self.cache.get_many(self._cache_model, [text_hash]).get(text_hash)
+        if vector is not None:
+            self._remember(text_hash, vector)
+            self.persistent_hits += 1
+        return vector
+
+    def _lookup(self, text: str) -> Tuple[str, List[float] | None]:
+        text_hash = hash_text(text)
+        vector = self._from_memory(text_hash)
+        if vector is None:
+            vector = self._from_cache(text_hash)
+        if vector is None:
+            self.misses += 1
+        return text_hash, vector
+
+    def _to_cache(self, text_hash: str, vector: List[float]):
+        if self.cache is not None:
+            self.cache.put_many(self._cache_model, {text_hash: vector})
+
+    def _store(self, text_hash: str, vector: List[float]) -> List[float]:
+        self._remember(text_hash, vector)
+        self._to_cache(text_hash, vector)
+        return vector
+
+    def embed_query(self, text: str) -> List[float]:
+        text_hash, vector = self._lookup(text)
+        if vector is not None:
+            return vector
+        return self._store(text_hash, self.underlying.embed_query(text))
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.underlying.embed_documents(texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        # Same as embed_query, with the SQLite reads and writes off the event loop
+        text_hash = hash_text(text)
+        vector = self._from_memory(text_hash)
+        if vector is None and self.cache is not None:
+            vector = await asyncio.to_thread(self._from_cache, text_hash)
+        if vector is not None:
+            return vector
+        self.misses += 1
+        vector = await self.underlying.aembed_query(text)
+        self._remember(text_hash, vector)
+        if self.cache is not None:
+            await asyncio.to_thread(self._to_cache, text_hash, vector)
+        return vector
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.underlying.aembed_documents(texts)
+
+    def warm_up(self, texts: List[str]) -> int:
+        """
+        Pre-embed queries that are not cached yet, several at a time. They are embedded as queries, since
+        some models embed queries differently from documents and they are stored as query embeddings.
+
+        Args:
+            texts (List[str]): The queries
+
+        Returns:
+            int: The number of queries that had to be embedded
+        """
+
+        missing = {}
+        for text in texts:
+            text_hash, vector = self._lookup(text)
+            if vector is None:
+                missing[text_hash] = text
+        if missing:
+            with ThreadPoolExecutor(max_workers=EMBEDDING_MAX_CONCURRENCY) as executor:
+                vectors = executor.map(self.underlying.embed_query, missing.values())
+                for text_hash, vector in zip(missing, vectors):
+                    self._store(text_hash, vector)
+        return len(missing)
+
+    def stats(self) -> Dict[str, int | float]:
+        lookups = self.memory_hits + self.persistent_hits + self.misses
+        return {
+            "model": self.model,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "memory_hits": self.memory_hits,
+            "persistent_hits": self.persistent_hits,
+            "misses": self.misses,
+            "hit_ratio": (
+                (self.memory_hits + self.persistent_hits) / lookups if lookups else 0.0
+            ),
+        }
+
+
+def cached_query_embeddings(embedding_function: Embeddings) -> CachedQueryEmbeddings:
+    """
+    Wrap an embedding function in a query embedding cache, persistent unless disabled in the config
+
+    Args:
+        embedding_function (Embeddings): The embedding function
+
+    Returns:
+        CachedQueryEmbeddings: The embedding function with its query embeddings cached
+    """
+
+    return CachedQueryEmbeddings(
+        embedding_function,
+        cache=embedding_cache if QUERY_EMBEDDING_CACHE_PERSISTENT else None,
+    )
+
+
+def read_prompts(path: str = prompts_csv_path) -> List[str]:
+    """
+    Read the resume prompts
+
+    Args:
+        path (str): The path to the prompts CSV, with a "prompts" column
+
+    Returns:
+        List[str]: The prompts
+    """
+
+    with open(path, newline="", encoding="utf-8") as f:
+        return [row["prompts"] for row in csv.DictReader(f)]
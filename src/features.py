@@ -0,0 +1,436 @@
+"""
+Extract the article, cancer and treatment features of the uploaded PDFs into the dataset of the Trends page.
+Each document is checkpointed once extracted, so a run only processes new or changed PDFs and resumes
+where a failed run stopped.
+
+Usage:
+    python -m src.features [--backend openai|custom|local] [--max-concurrency 4] [--force] [pdf_path ...]
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import time
+import pandas as pd
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.output_parsers import PydanticOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+from pydantic import BaseModel, Field
+from typing import Any, Dict, List, Literal
+from uuid import uuid4
+from .chains import format_docs, generation_model, model_name
+from .config import (
+    EMBEDDING_BACKENDS,
+    EMBEDDING_BACKEND,
+    features_path,
+    features_csv_path,
+    features_checkpoint_folder,
+    FEATURES_MAX_CONCURRENCY,
+    FEATURES_TOP_K,
+)
+from .embedding import get_embedding_function
+from .file_manifest import file_manifest
+from .index_factory import StoreSettings
+from .reindex import list_uploaded_pdfs
+from .trends import (
+    FEATURE_COLUMNS,
+    features_file_version,
+    save_trend_aggregates,
+    write_features_table,
+)
+from .vector_store import aget_retriever
+
+SENTIMENTS = ["Positive", "Optimistic", "Neutral", "Cautious", "Pessimistic"]
+
+# Questions used to retrieve the chunks the features are extracted from
+FEATURE_QUERIES = [
+    "Is this article a review, a research article or a clinical trial?",
+    "When was this article published?",
+    "Which cancer types or diseases does this article focus on?",
+    "Which treatments, drugs or therapies targeting MET are studied?",
+    "What are the results, efficacy and conclusions about these treatments?",
+]
+
+
+class Treatment(BaseModel):
+    name: str = Field(..., description="The name of the treatment, e.g. the drug name")
+    description: str = Field(
+        ..., description="One sentence on how the treatment is used in the article"
+    )
+    sentiment: Literal[tuple(SENTIMENTS)] = Field(
+        ..., description="How the article judges the treatment"
+    )
+
+
+class ArticleFeatures(BaseModel):
+    article_type: Literal["Review", "Research Article", "Clinical Trial", "Other"]
+    article_date: str | None = Field(
+        None, description="The publication year, e.g. 2021, or null if unknown"
+    )
+    cancer_types: List[str] = Field(
+        default_factory=list, description="The cancer types the article focuses on"
+    )
+    treatments: List[Treatment] = Field(
+        default_factory=list, description="The treatments the article mentions"
+    )
+
+
+features_parser = PydanticOutputParser(pydantic_object=ArticleFeatures)
+
+features_prompt = ChatPromptTemplate.from_messages(
+    [
+        (
+            "system",
+            "You extract structured features from excerpts of a biomedical article about MET. "
+            "Only use the information in the excerpts.\n{format_instructions}",
+        ),
+        ("human", "Excerpts of the article:\n\n{context}"),
+    ]
+).partial(format_instructions=features_parser.get_format_instructions())
+
+
+def features_version() -> str:
+    """
+    Identify the prompt, queries and model that produce the features, so that checkpoints written by
+    another version are extracted again
+
+    Returns:
+        str: A short hash of the extraction setup
+    """
+
+    setup = json.dumps(
+        {
+            "prompt": features_prompt.pretty_repr(),
+            "queries": FEATURE_QUERIES,
+            "top_k": FEATURES_TOP_K,
+            "model": model_name(generation_model),
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(setup.encode("utf-8")).hexdigest()[:16]
+
+
+def features_to_rows(article_name: str, features: ArticleFeatures) -> List[Dict]:
+    """
+    Flatten the features of an article into one row per treatment, or a single row without treatment
+
+    Args:
+        article_name (str): The name of the article
+        features (ArticleFeatures): The extracted features
+
+    Returns:
+        List[Dict]: The rows, with the FEATURE_COLUMNS keys
+    """
+
+    article = {
+        "article_name": article_name,
+        "article_type": features.article_type,
+        "article_date": features.article_date,
+        "cancer_types": features.cancer_types,
+    }
+    if not features.treatments:
+        return [
+            {
+                **article,
+                "treatment_name": None,
+                "treatment_description": None,
+                "treatment_sentiment": None,
+            }
+        ]
+    return [
+        {
+            **article,
+            "treatment_name": treatment.name,
+            "treatment_description": treatment.description,
+            "treatment_sentiment": treatment.sentiment,
+        }
+        for treatment in features.treatments
+    ]
+
+
+class FeatureCheckpoints:
+    """
+    One JSON file per extracted document, named after its file hash, holding its feature rows.
+    A checkpoint is only valid for the extraction version that wrote it.
+    """
+
+    def __init__(self, folder: str, version: str):
+        self.folder = folder
+        self.version = version
+        os.makedirs(folder, exist_ok=True)
+
+    def _path(self, file_hash: str) -> str:
+        return os.path.join(self.folder, f"{file_hash}.json")
+
+    def get(self, file_hash: str) -> Dict[str, Any] | None:
+        try:
+            with open(self._path(file_hash), encoding="utf-8") as f:
+                checkpoint = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        return checkpoint if checkpoint.get("version") == self.version else None
+
+    def put(self, file_hash: str, checkpoint: Dict[str, Any]):
+        path = self._path(file_hash)
+        temp_path = path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({**checkpoint, "version": self.version}, f)
+        os.replace(temp_path, path)
+
+
+async def extract_document_features(
+    file_path: str, embedding_function: Embeddings, settings: StoreSettings = None
+) -> Dict[str, Any]:
+    """
+    Extract the features of a PDF from the chunks retrieved for the feature queries, in a single model call
+
+    Args:
+        file_path (str): The path to the PDF
+        embedding_function (Embeddings): The embedding function to use
+        settings (StoreSettings): The store settings, the defaults if not set
+
+    Returns:
+        Dict[str, Any]: The feature rows, the number of tokens used and the time taken
+    """
+
+    start = time.perf_counter()
+    retriever = await aget_retriever(
+        "similarity", {"k": FEATURES_TOP_K}, file_path, embedding_function, settings
+    )
+    results = await asyncio.gather(
+        *(retriever.ainvoke(query) for query in FEATURE_QUERIES)
+    )
+
+    # Chunks retrieved by several queries are only sent once, in document order
+    chunks: Dict[tuple, Document] = {}
+    for doc in (doc for docs in results for doc in docs):
+        key = (doc.metadata.get("page"), doc.metadata.get("start_index"))
+        chunks.setdefault(key, doc)
+    docs = [
+        chunks[key]
+        for key in sorted(chunks, key=lambda key: (key[0] or 0, key[1] or 0))
+    ]
+
+    message = await (features_prompt | generation_model).ainvoke(
+        {"context": format_docs(docs)}
+    )
+    features = features_parser.parse(message.content)
+    article_name = os.path.splitext(os.path.basename(file_path))[0]
+    return {
+        "pdf_path": file_path,
+        "rows": features_to_rows(article_name, features),
+        "tokens": (message.usage_metadata or {}).get("total_tokens", 0),
+        "seconds": time.perf_counter() - start,
+    }
+
+
+def write_features(
+    rows: List[Dict], path: str = features_path, csv_path: str = features_csv_path
+):
+    """
+    Write the feature rows to a Parquet file and precompute the aggregates of the Trends page.
+    The rows are also exported to CSV, with the lists as their Python repr.
+
+    Args:
+        rows (List[Dict]): The feature rows
+        path (str): The path to the Parquet file
+        csv_path (str): The path to the CSV file, None to skip it
+    """
+
+    features_df = pd.DataFrame(rows, columns=FEATURE_COLUMNS)
+    write_features_table(features_df, path)
+    if csv_path is not None:
+        features_df.assign(cancer_types=features_df["cancer_types"].map(str)).to_csv(
+            csv_path + ".tmp", index=False
+        )
+        os.replace(csv_path + ".tmp", csv_path)
+    save_trend_aggregates(features_df, features_file_version(path, csv_path))
+
+
+async def extract_corpus_features(
+    file_paths: List[str],
+    embedding_function: Embeddings,
+    settings: StoreSettings = None,
+    max_concurrency: int = FEATURES_MAX_CONCURRENCY,
+    force: bool = False,
+    progress: Dict[str, Any] = None,
+) -> Dict[str, Any]:
+    """
+    Extract the features of several PDFs, with a bounded number of documents in flight, then write the
+    dataset of all the uploaded PDFs extracted so far. Documents with a checkpoint for their current content are not extracted again,
+    and failed documents are retried on the next run.
+
+    Args:
+        file_paths (List[str]): The paths of the PDFs
+        embedding_function (Embeddings): The embedding function to use
+        settings (StoreSettings): The store settings, the defaults if not set
+        max_concurrency (int): The maximum number of documents extracted at the same time
+        force (bool): Extract every document again, even if it is checkpointed
+        progress (Dict[str, Any]): Optional dictionary updated in place with the number of documents
+            to extract, extracted and failed so far
+
+    Returns:
+        Dict[str, Any]: The run summary, with its throughput in documents and tokens per minute
+    """
+
+    progress = progress if progress is not None else {}
+    checkpoints = FeatureCheckpoints(features_checkpoint_folder, features_version())
+    file_hashes = {
+        file_path: await asyncio.to_thread(file_manifest.get_hash, file_path)
+        for file_path in file_paths
+    }
+    # Copies of the same PDF are extracted once
+    pending = list(
+        {
+            file_hash: file_path
+            for file_path, file_hash in file_hashes.items()
+            if force or checkpoints.get(file_hash) is None
+        }.values()
+    )
+    progress.update(
+        documents_total=len(file_paths),
+        documents_checkpointed=len(file_paths) - len(pending),
+        documents_pending=len(pending),
+        documents_extracted=0,
+        documents_failed=0,
+        tokens=0,
+    )
+    errors = {}
+    semaphore = asyncio.Semaphore(max_concurrency)
+    start = time.perf_counter()
+
+    async def extract(file_path: str):
+        async with semaphore:
+            try:
+                result = await extract_document_features(
+                    file_path, embedding_function, settings
+                )
+            except Exception as e:
+                errors[file_path] = str(e)
+                progress["documents_failed"] += 1
+                print(f"Feature extraction failed for {file_path}: {e}")
+                return
+        checkpoints.put(file_hashes[file_path], result)
+        progress["documents_extracted"] += 1
+        progress["tokens"] += result["tokens"]
+        print(
+            f"Extracted {len(result['rows'])} feature rows from {file_path} "
+            f"in {result['seconds']:.1f}s ({result['tokens']} tokens)"
+        )
+
+    await asyncio.gather(*(extract(file_path) for file_path in pending))
+    seconds = time.perf_counter() - start
+
+    # The dataset covers every uploaded PDF with a checkpoint, not only those of this run
+    run_paths = {os.path.normpath(file_path) for file_path in file_hashes}
+    dataset_hashes = {
+        file_path: await asyncio.to_thread(file_manifest.get_hash, file_path)
+        for file_path in await asyncio.to_thread(list_uploaded_pdfs)
+        if os.path.normpath(file_path) not in run_paths
+    }
+    dataset_hashes.update(file_hashes)
+    rows = []
+    for file_path, file_hash in dataset_hashes.items():
+        checkpoint = checkpoints.get(file_hash)
+        if checkpoint is not None:
+            article_name = os.path.splitext(os.path.basename(file_path))[0]
+            rows.extend(
+                {**row, "article_name": article_name} for row in checkpoint["rows"]
+            )
+    await asyncio.to_thread(write_features, rows)
+
+    minutes = seconds / 60
+    return {
+        "documents": len(file_paths),
+        "checkpointed": progress["documents_checkpointed"],
+        "extracted": progress["documents_extracted"],
+        "failed": progress["documents_failed"],
+        "errors": errors,
+        "rows": len(rows),
+        "seconds": seconds,
+        "tokens": progress["tokens"],
+        "documents_per_minute": (
+            progress["documents_extracted"] / minutes if minutes else 0.0
+        ),
+        "tokens_per_minute": progress["tokens"] / minutes if minutes else 0.0,
+        "output": features_path,
+    }
+
+
+class FeatureExtractionJob:
+    """
+    A background run of extract_corpus_features
+    """
+
+    def __init__(self, file_paths: List[str]):
+        self.job_id = str(uuid4())
+        self.file_paths = file_paths
+        self.status = "queued"
+        self.progress: Dict[str, Any] = {}
+        self.result: Dict[str, Any] | None = None
+        self.error: str | None = None
+        self.created_at = time.time()
+        self.finished_at: float | None = None
+        self.task: asyncio.Task | None = None
+
+    async def run(self, embedding_function: Embeddings, **kwargs):
+        self.status = "running"
+        try:
+            self.result = await extract_corpus_features(
+                self.file_paths, embedding_function, progress=self.progress, **kwargs
+            )
+            self.status = "done"
+        except Exception as e:
+            self.status = "failed"
+            self.error = str(e)
+        finally:
+            self.finished_at = time.time()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "progress": self.progress,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("pdf_paths", nargs="*", help="PDFs to extract, all by default")
+    parser.add_argument(
+        "--backend", choices=EMBEDDING_BACKENDS, default=EMBEDDING_BACKEND
+    )
+    parser.add_argument("--max-concurrency", type=int, default=FEATURES_MAX_CONCURRENCY)
+    parser.add_argument(
+        "--force", action="store_true", help="Extract checkpointed documents again"
+    )
+    args = parser.parse_args()
+
+    embedding_function = get_embedding_function(args.backend)
+
+    summary = asyncio.run(
+        extract_corpus_features(
+            args.pdf_paths or list_uploaded_pdfs(),
+            embedding_function,
+            max_concurrency=args.max_concurrency,
+            force=args.force,
+        )
+    )
+    print(
+        f"Extracted {summary['extracted']}/{summary['documents']} documents "
+        f"({summary['checkpointed']} already checkpointed, {summary['failed']} failed) "
+        f"in {summary['seconds']:.1f}s: {summary['documents_per_minute']:.1f} documents/min, "
+        f"{summary['tokens_per_minute']:.0f} tokens/min. "
+        f"{summary['rows']} rows written to {summary['output']}"
+    )
+
+
+if __name__ == "__main__":
+    main()
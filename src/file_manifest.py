@@ -0,0 +1,145 @@
+import hashlib
+import json
+import os
+import threading
+from filelock import FileLock
+from typing import Dict, Tuple
+from .config import manifest_path, HASH_BLOCK_SIZE
+
+
+def calculate_file_hash(file_path: str, block_size: int = HASH_BLOCK_SIZE) -> str:
+    """
+    Calculate the SHA-256 hash of a file, streaming it in fixed-size blocks
+
+    Args:
+        file_path (str): The path to the file
+        block_size (int): The number of bytes to read at a time
+
+    Returns:
+        str: The hex digest of the file content
+    """
+
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+class FileManifest:
+    """
+    Persistent manifest mapping file paths to their stat (size, mtime, inode) and SHA-256 hash.
+    A file is only re-hashed when its stat changes.
+    Several processes can share the manifest: each write re-reads it and merges its entry under a file
+    lock, and reads reload it when another process changed it.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file_lock = FileLock(path + ".lock")
+        self._entries: Dict[str, Dict[str, int | str]] = {}
+        self._disk_state: Tuple | None = None
+        self._load()
+
+    def _disk_signature(self) -> Tuple | None:
+        # Changes whenever a process rewrites the manifest, as it is replaced by a new file
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _load(self):
+        signature = self._disk_signature()
+        if signature is None or signature == self._disk_state:
+            return
+        try:
+            with open(self.path, "r") as f:
+                self._entries = json.load(f)
+        except (OSError, ValueError):
+            print(
+                f"Could not read the file manifest {self.path}, starting from scratch"
+            )
+        self._disk_state = signature
+
+    @staticmethod
+    def _key(file_path: str) -> str:
+        return os.path.normpath(file_path)
+
+    @staticmethod
+    def _stat(file_path: str) -> Dict[str, int]:
+        stat = os.stat(file_path)
+        return {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "inode": stat.st_ino,
+        }
+
+    def get_hash(self, file_path: str) -> str:
+        """
+        Get the hash of a file, from the manifest if its stat did not change
+
+        Args:
+            file_path (str): The path to the file
+
+        Returns:
+            str: The SHA-256 hash of the file
+        """
+
+        stat = self._stat(file_path)
+        with self._lock:
+            self._load()
+            entry = self._entries.get(self._key(file_path))
+        if entry is not None and all(entry.get(k) == v for k, v in stat.items()):
+            return entry["sha256"]
+        return self.record(file_path)
+
+    def record(self, file_path: str, file_hash: str = None) -> str:
+        """
+        Record the current stat and hash of a file in the manifest
+
+        Args:
+            file_path (str): The path to the file
+            file_hash (str): The hash of the file if already known, otherwise it is computed
+
+        Returns:
+            str: The SHA-256 hash of the file
+        """
+
+        stat = self._stat(file_path)
+        if file_hash is None:
+            file_hash = calculate_file_hash(file_path)
+        with self._lock, self._file_lock:
+            # Merge with the entries other processes recorded since the last read
+            self._load()
+            self._entries[self._key(file_path)] = {**stat, "sha256": file_hash}
+            self._save()
+        return file_hash
+
+    def lookup(self, file_path: str) -> str | None:
+        """
+        Get the last recorded hash of a file without checking its stat
+
+        Args:
+            file_path (str): The path to the file
+
+        Returns:
+            str | None: The recorded hash, or None if the file is not in the manifest
+        """
+
+        with self._lock:
+            self._load()
+            entry = self._entries.get(self._key(file_path))
+        return entry["sha256"] if entry is not None else None
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._entries, f)
+        os.replace(tmp_path, self.path)
+        self._disk_state = self._disk_signature()
+
+
+file_manifest = FileManifest(manifest_path)
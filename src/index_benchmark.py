@@ -0,0 +1,127 @@
+"""
+Compare the FAISS index types a store can be built with: build time, recall@k against an exact search,
+query latency and the memory the index takes.
+Vectors are synthetic, drawn around random centroids like the chunks of a corpus of articles, so the
+benchmark runs offline. Index types that cannot be trained on the number of vectors fall back to a
+cheaper type, which the effective column shows.
+
+Usage:
+    python -m src.index_benchmark [--vectors 1000 10000 100000] [--dimensions 256]
+                                  [--index-types flat ivf_flat hnsw ivf_pq] [--precision float32]
+                                  [--queries 200] [--top-k 4]
+"""
+
+import argparse
+import statistics
+import time
+import faiss
+import numpy as np
+from typing import Any, Dict
+from .index_factory import INDEX_TYPES, PRECISIONS, StoreSettings, build_index
+
+
+def clustered_vectors(
+    num_vectors: int, dimensions: int, num_clusters: int = 100, seed: int = 0
+) -> np.ndarray:
+    """
+    Draw normalized vectors around random centroids
+
+    Args:
+        num_vectors (int): The number of vectors
+        dimensions (int): The dimensions of the vectors
+        num_clusters (int): The number of centroids
+        seed (int): The random seed
+
+    Returns:
+        np.ndarray: The float32 vectors, one per row
+    """
+
+    rng = np.random.default_rng(seed)
+    centroids = rng.standard_normal((num_clusters, dimensions), dtype=np.float32)
+    vectors = centroids[rng.integers(num_clusters, size=num_vectors)]
+    vectors += 0.5 * rng.standard_normal((num_vectors, dimensions), dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def benchmark_index(
+    vectors: np.ndarray, queries: np.ndarray, settings: StoreSettings, top_k: int
+) -> Dict[str, Any]:
+    """
+    Build an index over the vectors and measure it against an exact search
+
+    Args:
+        vectors (np.ndarray): The vectors indexed
+        queries (np.ndarray): The queries, one per row
+        settings (StoreSettings): The store settings
+        top_k (int): The number of neighbours retrieved per query
+
+    Returns:
+        Dict[str, Any]: The measures
+    """
+
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, expected = exact.search(queries, top_k)
+
+    start = time.perf_counter()
+    index, metadata = build_index(vectors, settings)
+    index.add(vectors)
+    build_seconds = time.perf_counter() - start
+
+    labels = []
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        _, found = index.search(query[np.newaxis], top_k)
+        latencies.append(time.perf_counter() - start)
+        labels.append(found[0])
+    recall = np.mean(
+        [len(set(found) & set(truth)) / top_k for found, truth in zip(labels, expected)]
+    )
+
+    return {
+        "effective": metadata["effective_index_type"],
+        "build_seconds": build_seconds,
+        "recall": float(recall),
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": float(np.percentile(latencies, 95)) * 1000,
+        "memory_mb": len(faiss.serialize_index(index)) / 2**20,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--vectors", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--dimensions", type=int, default=256)
+    parser.add_argument(
+        "--index-types", nargs="+", choices=INDEX_TYPES, default=INDEX_TYPES
+    )
+    parser.add_argument("--precision", choices=PRECISIONS, default="float32")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=4)
+    args = parser.parse_args()
+
+    print(
+        f"{'index':<10}{'vectors':>9}{'effective':>11}{'build s':>9}{'recall':>8}"
+        f"{'p50 ms':>8}{'p95 ms':>8}{'MB':>8}"
+    )
+    for num_vectors in args.vectors:
+        vectors = clustered_vectors(num_vectors, args.dimensions)
+        # Queries are perturbed corpus vectors, as questions are close to the chunks answering them
+        queries = vectors[: args.queries] + 0.1 * clustered_vectors(
+            min(args.queries, num_vectors), args.dimensions, seed=1
+        )
+        for index_type in args.index_types:
+            settings = StoreSettings(
+                index_type=index_type, dimensions=None, precision=args.precision
+            )
+            result = benchmark_index(vectors, queries, settings, args.top_k)
+            print(
+                f"{index_type:<10}{num_vectors:>9}{result['effective']:>11}"
+                f"{result['build_seconds']:>9.2f}{result['recall']:>8.3f}"
+                f"{result['p50_ms']:>8.2f}{result['p95_ms']:>8.2f}{result['memory_mb']:>8.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
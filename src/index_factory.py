@@ -0,0 +1,243 @@
+import faiss
+import json
+import os
+import numpy as np
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Tuple
+from .config import (
+    DEFAULT_INDEX_TYPE,
+    DEFAULT_EMBEDDING_DIMENSIONS,
+    DEFAULT_PRECISION,
+    IVF_MIN_POINTS_PER_LIST,
+    IVF_MAX_LISTS,
+    IVF_NPROBE,
+    HNSW_M,
+    HNSW_EF_SEARCH,
+    PQ_DIMS_PER_SUBQUANTIZER,
+)
+
+INDEX_TYPES = ["flat", "ivf_flat", "hnsw", "ivf_pq"]
+PRECISIONS = ["float32", "float16", "int8"]
+SCALAR_QUANTIZERS = {
+    "float16": faiss.ScalarQuantizer.QT_fp16,
+    "int8": faiss.ScalarQuantizer.QT_8bit,
+}
+PQ_NBITS = 8
+STORE_METADATA_FILE = "store_meta.json"
+
+
+@dataclass(frozen=True)
+class StoreSettings:
+    """
+    Per-store options. They are part of the key of a store on disk and in the vector store cache.
+
+    Attributes:
+        index_type (str): The FAISS index type, one of INDEX_TYPES
+        dimensions (int | None): Keep only the first dimensions of the embeddings (Matryoshka-style
+            truncation, re-normalized), None to keep them all
+        precision (str): How vectors are stored: "float32", "float16", or "int8" scalar quantization.
+            Ignored by ivf_pq indexes, which already compress the vectors.
+    """
+
+    index_type: str = DEFAULT_INDEX_TYPE
+    dimensions: int | None = DEFAULT_EMBEDDING_DIMENSIONS
+    precision: str = DEFAULT_PRECISION
+
+    def __post_init__(self):
+        if self.index_type not in INDEX_TYPES:
+            raise ValueError(f"index_type must be one of {INDEX_TYPES}")
+        if self.precision not in PRECISIONS:
+            raise ValueError(f"precision must be one of {PRECISIONS}")
+        if self.dimensions is not None and self.dimensions < 1:
+            raise ValueError("dimensions must be positive")
+
+    @property
+    def key(self) -> str:
+        """
+        Suffix identifying the settings in the store path, empty for the default full-precision
+        flat stores so that existing stores keep their path
+        """
+
+        key = "" if self.index_type == "flat" else f"_{self.index_type}"
+        if self.dimensions is not None:
+            key += f"_d{self.dimensions}"
+        if self.precision != "float32":
+            key += f"_{self.precision}"
+        return key
+
+
+def truncate_embeddings(vectors: np.ndarray, dimensions: int | None) -> np.ndarray:
+    """
+    Keep the first dimensions of Matryoshka embeddings and L2-normalize them again
+
+    Args:
+        vectors (np.ndarray): The embeddings, one per row
+        dimensions (int | None): The number of dimensions to keep, None to keep them all
+
+    Returns:
+        np.ndarray: The truncated float32 embeddings
+    """
+
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if dimensions is None or dimensions >= vectors.shape[-1]:
+        return vectors
+    vectors = np.ascontiguousarray(vectors[..., :dimensions])
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def index_bytes_per_vector(index) -> int:
+    """
+    Get the number of bytes an index uses to store one vector
+
+    Args:
+        index: The FAISS index
+
+    Returns:
+        int: The code size of a vector, plus the graph links for HNSW indexes
+    """
+
+    try:
+        return index.sa_code_size()
+    except (RuntimeError, AttributeError):
+        if hasattr(index, "hnsw"):
+            return index_bytes_per_vector(index.storage) + 2 * HNSW_M * 4
+        return index.d * 4
+
+
+def _ivf_lists(num_vectors: int) -> int:
+    return min(
+        IVF_MAX_LISTS, int(np.sqrt(num_vectors)), num_vectors // IVF_MIN_POINTS_PER_LIST
+    )
+
+
+def _pq_subquantizers(dimension: int) -> int:
+    m = max(dimension // PQ_DIMS_PER_SUBQUANTIZER, 1)
+    while dimension % m:
+        m -= 1
+    return m
+
+
+def effective_index_type(index_type: str, num_vectors: int) -> str:
+    """
+    Get the index type that can actually be trained with a given number of vectors.
+    IVF indexes need enough vectors per inverted list and PQ codebooks need enough vectors per
+    centroid, otherwise the store falls back to a cheaper type until it grows.
+
+    Args:
+        index_type (str): The requested index type
+        num_vectors (int): The number of vectors available for training
+
+    Returns:
+        str: The index type to build
+    """
+
+    if index_type == "ivf_pq" and num_vectors < 2**PQ_NBITS * IVF_MIN_POINTS_PER_LIST:
+        index_type = "ivf_flat"
+    if index_type == "ivf_flat" and _ivf_lists(num_vectors) < 2:
+        index_type = "flat"
+    return index_type
+
+
+def enable_reconstruction(index: faiss.Index):
+    """
+    Attach a direct map to IVF indexes so their vectors can be reconstructed by id, as MMR search does.
+    Array maps do not support remove_ids, so IVF indexes are rebuilt rather than removed from.
+
+    Args:
+        index (faiss.Index): The FAISS index
+    """
+
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None and ivf.direct_map.type == faiss.DirectMap.NoMap:
+        ivf.set_direct_map_type(faiss.DirectMap.Array)
+
+
+def build_index(
+    vectors: np.ndarray, settings: StoreSettings
+) -> Tuple[faiss.Index, Dict[str, Any]]:
+    """
+    Build an empty FAISS index for the given settings, trained on the vectors if needed
+
+    Args:
+        vectors (np.ndarray): The float32 vectors that will be added to the index, already truncated
+        settings (StoreSettings): The store settings
+
+    Returns:
+        Tuple[faiss.Index, Dict[str, Any]]: The index and the metadata describing it
+    """
+
+    num_vectors, dimension = vectors.shape
+    index_type = effective_index_type(settings.index_type, num_vectors)
+
+    quantizer_type = SCALAR_QUANTIZERS.get(settings.precision)
+
+    if index_type == "flat":
+        if quantizer_type is None:
+            index = faiss.IndexFlatL2(dimension)
+        else:
+            index = faiss.IndexScalarQuantizer(dimension, quantizer_type)
+    elif index_type == "hnsw":
+        if quantizer_type is None:
+            index = faiss.IndexHNSWFlat(dimension, HNSW_M)
+        else:
+            index = faiss.IndexHNSWSQ(dimension, quantizer_type, HNSW_M)
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+    else:
+        nlist = _ivf_lists(num_vectors)
+        quantizer = faiss.IndexFlatL2(dimension)
+        if index_type == "ivf_pq":
+            index = faiss.IndexIVFPQ(
+                quantizer, dimension, nlist, _pq_subquantizers(dimension), PQ_NBITS
+            )
+        elif quantizer_type is None:
+            index = faiss.IndexIVFFlat(quantizer, dimension, nlist)
+        else:
+            index = faiss.IndexIVFScalarQuantizer(
+                quantizer, dimension, nlist, quantizer_type
+            )
+        index.nprobe = min(IVF_NPROBE, nlist)
+
+    if not index.is_trained:
+        index.train(vectors)
+    enable_reconstruction(index)
+
+    metadata = {
+        **asdict(settings),
+        "effective_index_type": index_type,
+        "dimension": dimension,
+        "bytes_per_vector": index_bytes_per_vector(index),
+        "num_vectors": num_vectors,
+    }
+    return index, metadata
+
+
+def save_store_metadata(path: str, metadata: Dict[str, Any]):
+    """
+    Record the metadata of a store next to its index
+
+    Args:
+        path (str): The directory of the store
+        metadata (Dict[str, Any]): The metadata
+    """
+
+    with open(os.path.join(path, STORE_METADATA_FILE), "w") as f:
+        json.dump(metadata, f, indent=2)
+
+
+def load_store_metadata(path: str) -> Dict[str, Any]:
+    """
+    Read the metadata of a store. Stores saved before the metadata existed are flat stores.
+
+    Args:
+        path (str): The directory of the store
+
+    Returns:
+        Dict[str, Any]: The metadata
+    """
+
+    metadata_path = os.path.join(path, STORE_METADATA_FILE)
+    if not os.path.exists(metadata_path):
+        return {"index_type": "flat", "effective_index_type": "flat"}
+    with open(metadata_path, "r") as f:
+        return json.load(f)
@@ -0,0 +1,233 @@
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from langchain.schema import Document
+from langchain_core.embeddings import Embeddings
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from pypdf import PdfReader
+from typing import Dict, Iterator, List, Tuple
+from .config import (
+    INGESTION_EXTRACT_WORKERS,
+    INGESTION_PARALLEL_MIN_PAGES,
+    INGESTION_PAGES_PER_TASK,
+    INGESTION_QUEUE_MAX_CHUNKS,
+    INGESTION_EMBED_BATCH_SIZE,
+)
+from .embedding_cache import embed_with_cache, log_cache_stats
+from .file_manifest import file_manifest
+from .text_cache import TextCache, text_cache
+from .text_cleaning import clean_scientific_text
+
+# PyPDFLoader.load_and_split splits pages with the default splitter before they are cleaned
+PAGE_SPLITTER = RecursiveCharacterTextSplitter()
+CHUNK_SPLITTER = RecursiveCharacterTextSplitter(
+    chunk_size=1000, chunk_overlap=200, add_start_index=True
+)
+
+
+def _clean_page(file_path: str, page_number: int, text: str) -> List[Document]:
+    page = Document(
+        page_content=text, metadata={"source": file_path, "page": page_number}
+    )
+    return [clean_scientific_text(doc) for doc in PAGE_SPLITTER.split_documents([page])]
+
+
+def process_pages(file_path: str, start: int, stop: int) -> List[List[Document]]:
+    """
+    Extract and clean a range of pages of a PDF, as PyPDFLoader.load_and_split and the cleaner would
+
+    Args:
+        file_path (str): The path to the PDF
+        start (int): The first page
+        stop (int): The page after the last one
+
+    Returns:
+        List[List[Document]]: The cleaned sections of each page
+    """
+
+    reader = PdfReader(file_path)
+    return [
+        _clean_page(file_path, n, reader.pages[n].extract_text(extraction_mode="plain"))
+        for n in range(start, stop)
+    ]
+
+
+def _parse_pages(
+    file_path: str, num_pages: int, max_workers: int
+) -> Iterator[List[Document]]:
+    if max_workers <= 1 or num_pages < INGESTION_PARALLEL_MIN_PAGES:
+        reader = PdfReader(file_path)
+        for n, page in enumerate(reader.pages):
+            yield _clean_page(file_path, n, page.extract_text(extraction_mode="plain"))
+        return
+
+    ranges = deque(
+        (start, min(start + INGESTION_PAGES_PER_TASK, num_pages))
+        for start in range(0, num_pages, INGESTION_PAGES_PER_TASK)
+    )
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        in_flight = deque()
+        while ranges or in_flight:
+            while ranges and len(in_flight) < 2 * max_workers:
+                in_flight.append(
+                    executor.submit(process_pages, file_path, *ranges.popleft())
+                )
+            yield from in_flight.popleft().result()
+
+
+def iter_clean_pages(
+    file_path: str,
+    progress: Dict[str, int] = None,
+    max_workers: int = INGESTION_EXTRACT_WORKERS,
+    cache: TextCache = text_cache,
+) -> Iterator[List[Document]]:
+    """
+    Yield the cleaned sections of each page of a PDF, in page order, as soon as they are parsed.
+    The cleaned text is read from the text cache when the document was already parsed, otherwise it
+    is cached once the whole document is parsed.
+    Large documents are parsed by a process pool, with a bounded number of page ranges in flight.
+
+    Args:
+        file_path (str): The path to the PDF
+        progress (Dict[str, int]): Optional dictionary updated in place with the number of pages
+            of the document and of pages parsed so far
+        max_workers (int): The number of processes to use, 1 to parse in the current process
+        cache (TextCache): The extracted text cache
+
+    Returns:
+        Iterator[List[Document]]: The cleaned sections of each page
+    """
+
+    progress = progress if progress is not None else {}
+    file_hash = file_manifest.get_hash(file_path)
+    cached_pages = cache.get(file_hash)
+
+    if cached_pages is not None:
+        progress["pages_total"] = len(cached_pages)
+        progress["pages_parsed"] = 0
+        progress["text_cached"] = True
+        for n, sections in enumerate(cached_pages):
+            yield [
+                Document(page_content=text, metadata={"source": file_path, "page": n})
+                for text in sections
+            ]
+            progress["pages_parsed"] += 1
+        return
+
+    num_pages = len(PdfReader(file_path).pages)
+    progress["pages_total"] = num_pages
+    progress["pages_parsed"] = 0
+    progress["text_cached"] = False
+    pages = []
+    for page in _parse_pages(file_path, num_pages, max_workers):
+        pages.append([doc.page_content for doc in page])
+        yield page
+        progress["pages_parsed"] += 1
+    cache.put(file_hash, pages)
+
+
+def iter_pdf_chunks(
+    file_path: str, progress: Dict[str, int] = None
+) -> Iterator[Document]:
+    """
+    Parse, clean and split a PDF into chunks, page by page
+
+    Args:
+        file_path (str): The path to the PDF
+        progress (Dict[str, int]): Optional dictionary updated in place with the number of pages parsed
+
+    Returns:
+        Iterator[Document]: The chunks, with their source, page and start index as metadata
+    """
+
+    for page in iter_clean_pages(file_path, progress):
+        yield from CHUNK_SPLITTER.split_documents(page)
+
+
+def embed_pdf_chunks(
+    file_path: str, embedding_function: Embeddings, progress: Dict[str, int] = None
+) -> Tuple[List[Document], List[List[float]]]:
+    """
+    Parse, clean, split and embed a PDF as a pipeline: a background thread parses the pages and
+    queues their chunks while batches of chunks are embedded, so that parsing and embedding overlap.
+    The queue is bounded, so parsing pauses when the embedding endpoint falls behind.
+
+    Args:
+        file_path (str): The path to the PDF
+        embedding_function (Embeddings): The embedding function to use
+        progress (Dict[str, int]): Optional dictionary updated in place with the number of pages
+            parsed, chunks found so far and chunks embedded
+
+    Returns:
+        Tuple[List[Document], List[List[float]]]: The chunks and their embeddings
+    """
+
+    progress = progress if progress is not None else {}
+    progress["chunks_total"] = 0
+    progress["chunks_embedded"] = 0
+    chunks_queue = queue.Queue(maxsize=INGESTION_QUEUE_MAX_CHUNKS)
+    stop = threading.Event()
+    done = object()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                chunks_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def parse():
+        try:
+            for chunk in iter_pdf_chunks(file_path, progress):
+                progress["chunks_total"] += 1
+                if not put(chunk):
+                    return
+            put(done)
+        except Exception as e:
+            put(e)
+
+    parser = threading.Thread(target=parse, name="ingestion-parser", daemon=True)
+    parser.start()
+
+    chunks, vectors, stats = [], [], []
+    batch = []
+
+    def embed_batch():
+        batch_vectors, batch_stats = embed_with_cache(
+            [chunk.page_content for chunk in batch], embedding_function, verbose=False
+        )
+        chunks.extend(batch)
+        vectors.extend(batch_vectors)
+        stats.append(batch_stats)
+        progress["chunks_embedded"] += len(batch)
+        batch.clear()
+
+    try:
+        while True:
+            item = chunks_queue.get()
+            if isinstance(item, Exception):
+                raise item
+            if item is done:
+                break
+            batch.append(item)
+            if len(batch) >= INGESTION_EMBED_BATCH_SIZE:
+                embed_batch()
+        if batch:
+            embed_batch()
+    finally:
+        stop.set()
+        parser.join()
+
+    if not chunks:
+        raise ValueError(f"No text could be extracted from {file_path}")
+    log_cache_stats(
+        {
+            "chunks": sum(s["chunks"] for s in stats),
+            "cache_hits": sum(s["cache_hits"] for s in stats),
+            "embedded": sum(s["embedded"] for s in stats),
+        }
+    )
+    return chunks, vectors
@@ -0,0 +1,184 @@
+"""
+Measure the ingestion throughput of a PDF: parsing and cleaning serially or with the process pool, and
+the whole ingestion staged, as it was before the pipeline (load_and_split, clean, split, then embed every
+chunk), or pipelined, as it is now, against a simulated embedding endpoint.
+Each run ingests a new synthetic PDF, so the text and embedding caches never hit.
+
+Usage:
+    python -m src.ingestion_benchmark [--pages 10 100 300] [--workers 4]
+                                      [--request-latency 0.5] [--text-latency 0.0005]
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+from langchain_community.document_loaders import PyPDFLoader
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from pypdf import PdfWriter
+from pypdf.generic import DictionaryObject, NameObject, StreamObject
+from typing import List
+from . import ingestion
+from .config import INGESTION_EXTRACT_WORKERS
+from .embedding_benchmark import RemoteEmbeddingsStub
+from .embedding_cache import embed_with_cache
+from .ingestion import CHUNK_SPLITTER, embed_pdf_chunks, iter_clean_pages
+from .text_cache import TextCache
+from .text_cleaning import clean_scientific_text
+
+WORDS = (
+    "patients treated with osimertinib showed a median progression free survival of months "
+    "compared with the control arm hazard ratio confidence interval EGFR mutation tumour response "
+    "Vol. 38 Page 12 DOI: 10.1200/JCO.2019 adverse events were grade"
+).split()
+
+
+def write_sample_pdf(
+    path: str, num_pages: int, lines_per_page: int = 50, seed: int = 0
+):
+    """
+    Write a PDF of synthetic article text, one line of words per text line
+
+    Args:
+        path (str): The path of the PDF
+        num_pages (int): The number of pages
+        lines_per_page (int): The number of text lines per page
+        seed (int): The random seed of the words
+    """
+
+    rng = random.Random(seed)
+    writer = PdfWriter()
+    font = DictionaryObject(
+        {
+            NameObject("/Type"): NameObject("/Font"),
+            NameObject("/Subtype"): NameObject("/Type1"),
+            NameObject("/BaseFont"): NameObject("/Helvetica"),
+        }
+    )
+    resources = DictionaryObject(
+        {NameObject("/Font"): DictionaryObject({NameObject("/F1"): font})}
+    )
+    for _ in range(num_pages):
+        lines = [" ".join(rng.choices(WORDS, k=14)) for _ in range(lines_per_page)]
+        text = " Tj T* ".join(f"({line})" for line in lines)
+        contents = StreamObject()
+        contents.set_data(f"BT /F1 9 Tf 11 TL 40 760 Td {text} Tj ET".encode())
+        page = writer.add_blank_page(612, 792)
+        page[NameObject("/Resources")] = resources
+        page[NameObject("/Contents")] = writer._add_object(contents)
+    with open(path, "wb") as f:
+        writer.write(f)
+
+
+def staged_pdf_chunks(file_path: str) -> List[Document]:
+    """
+    Parse, clean and split a PDF in stages over the whole document, as before the pipeline
+
+    Args:
+        file_path (str): The path to the PDF
+
+    Returns:
+        List[Document]: The chunks
+    """
+
+    pages = PyPDFLoader(file_path).load_and_split()
+    return CHUNK_SPLITTER.split_documents([clean_scientific_text(p) for p in pages])
+
+
+def parse_pages_per_second(
+    file_path: str, num_pages: int, max_workers: int, cache_path: str
+) -> float:
+    """
+    Measure the pages parsed and cleaned per second, with the text cache empty
+
+    Args:
+        file_path (str): The path to the PDF
+        num_pages (int): The number of pages of the PDF
+        max_workers (int): The number of processes, 1 to parse serially
+        cache_path (str): A path for an empty text cache
+
+    Returns:
+        float: The number of pages per second
+    """
+
+    start = time.perf_counter()
+    for _ in iter_clean_pages(
+        file_path, max_workers=max_workers, cache=TextCache(cache_path)
+    ):
+        pass
+    return num_pages / (time.perf_counter() - start)
+
+
+def ingest_staged(file_path: str, embedding_function: Embeddings) -> int:
+    chunks = staged_pdf_chunks(file_path)
+    embed_with_cache(
+        [chunk.page_content for chunk in chunks], embedding_function, verbose=False
+    )
+    return len(chunks)
+
+
+def ingest_pipelined(file_path: str, embedding_function: Embeddings) -> int:
+    chunks, _ = embed_pdf_chunks(file_path, embedding_function)
+    return len(chunks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--pages", type=int, nargs="+", default=[10, 100, 300])
+    parser.add_argument("--workers", type=int, default=INGESTION_EXTRACT_WORKERS)
+    parser.add_argument(
+        "--request-latency",
+        type=float,
+        default=0.5,
+        help="Round-trip latency of an embedding request, in seconds",
+    )
+    parser.add_argument(
+        "--text-latency",
+        type=float,
+        default=0.0005,
+        help="Latency added per text embedded, in seconds",
+    )
+    args = parser.parse_args()
+
+    embedding_function = RemoteEmbeddingsStub(
+        256, args.request_latency, args.text_latency, 128
+    )
+    # Documents of any size go through the pool when it is measured
+    ingestion.INGESTION_PARALLEL_MIN_PAGES = 1
+
+    print(
+        f"{'pages':>6}{'chunks':>8}{'serial p/s':>12}{'pool p/s':>10}"
+        f"{'staged s':>10}{'pipelined s':>13}{'pipelined p/s':>15}"
+    )
+    with tempfile.TemporaryDirectory() as path:
+        seed = 0
+        for num_pages in args.pages:
+            rates = []
+            for max_workers in (1, args.workers):
+                seed += 1
+                pdf = os.path.join(path, f"sample_{seed}.pdf")
+                write_sample_pdf(pdf, num_pages, seed=seed)
+                cache_path = os.path.join(path, f"text_cache_{seed}.sqlite")
+                rates.append(
+                    parse_pages_per_second(pdf, num_pages, max_workers, cache_path)
+                )
+
+            seconds = []
+            for ingest in (ingest_staged, ingest_pipelined):
+                seed += 1
+                pdf = os.path.join(path, f"sample_{seed}.pdf")
+                write_sample_pdf(pdf, num_pages, seed=seed)
+                start = time.perf_counter()
+                num_chunks = ingest(pdf, embedding_function)
+                seconds.append(time.perf_counter() - start)
+
+            print(
+                f"{num_pages:>6}{num_chunks:>8}{rates[0]:>12.0f}{rates[1]:>10.0f}"
+                f"{seconds[0]:>10.2f}{seconds[1]:>13.2f}{num_pages / seconds[1]:>15.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from langchain_core.embeddings import Embeddings
+from typing import Any, Dict, Tuple
+from uuid import uuid4
+from .config import (
+    INGESTION_MAX_WORKERS,
+    INGESTION_MAX_PENDING,
+    ENABLE_CORPUS_INDEX,
+    JOB_FINISHED_TTL,
+    JOB_MAX_FINISHED,
+)
+from .corpus_index import get_corpus_index
+from .file_manifest import file_manifest
+from .index_factory import StoreSettings
+from .vector_store import load_or_create_vector_store
+
+
+def evict_finished_jobs(
+    jobs: Dict[str, Any],
+    ttl: float = JOB_FINISHED_TTL,
+    max_finished: int = JOB_MAX_FINISHED,
+):
+    """
+    Drop the jobs that finished more than ttl seconds ago, then the oldest finished jobs beyond
+    max_finished. Unfinished jobs are always kept.
+
+    Args:
+        jobs (Dict[str, Any]): The jobs by id, with their finished_at time, modified in place
+        ttl (float): The number of seconds a finished job is kept
+        max_finished (int): The number of finished jobs kept
+    """
+
+    now = time.time()
+    finished = sorted(
+        (job for job in jobs.values() if job.finished_at is not None),
+        key=lambda job: job.finished_at,
+    )
+    expired = [job for job in finished if now - job.finished_at > ttl]
+    kept = finished[len(expired) :]
+    for job in expired + kept[: max(0, len(kept) - max_finished)]:
+        del jobs[job.job_id]
+
+
+class IngestionJob:
+    """
+    A background job parsing, cleaning, splitting and embedding a PDF into its vector store
+    """
+
+    def __init__(self, file_path: str):
+        self.job_id = str(uuid4())
+        self.file_path = file_path
+        self.status = "queued"
+        self.progress: Dict[str, int] = {}
+        self.error: str | None = None
+        self.created_at = time.time()
+        self.started_at: float | None = None
+        self.finished_at: float | None = None
+        self.future: Future | None = None
+
+    def run(
+        self,
+        embedding_function: Embeddings,
+        settings: StoreSettings = None,
+        rebuild: bool = False,
+    ):
+        self.status = "running"
+        self.started_at = time.time()
+        try:
+            load_or_create_vector_store(
+                self.file_path,
+                embedding_function,
+                settings,
+                progress=self.progress,
+                rebuild=rebuild,
+            )
+            if ENABLE_CORPUS_INDEX:
+                get_corpus_index(embedding_function).add_document(self.file_path)
+            self.status = "done"
+        except Exception as e:
+            self.status = "failed"
+            self.error = str(e)
+            raise
+        finally:
+            self.finished_at = time.time()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "file_path": self.file_path,
+            "status": self.status,
+            "progress": self.progress,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class IngestionJobManager:
+    """
+    Runs ingestion jobs on a bounded pool of background workers.
+    Submitting a file that already has an unfinished job for the same content, settings and rebuild flag
+    returns that job instead of queuing another one. Finished jobs are dropped after finished_ttl seconds,
+    or when more than max_finished have finished.
+    """
+
+    def __init__(
+        self,
+        max_workers: int,
+        max_pending: int,
+        finished_ttl: float = JOB_FINISHED_TTL,
+        max_finished: int = JOB_MAX_FINISHED,
+    ):
+        self.max_pending = max_pending
+        self.finished_ttl = finished_ttl
+        self.max_finished = max_finished
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="ingestion"
+        )
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, IngestionJob] = {}
+        self._active: Dict[Tuple[str, str, str, bool], IngestionJob] = {}
+
+    def submit(
+        self,
+        file_path: str,
+        embedding_function: Embeddings,
+        settings: StoreSettings = None,
+        rebuild: bool = False,
+        file_hash: str = None,
+    ) -> IngestionJob:
+        """
+        Queue the ingestion of a PDF
+
+        Args:
+            file_path (str): The path to the PDF
+            embedding_function (Embeddings): The embedding function to use
+            settings (StoreSettings): The store settings, the defaults if not set
+            rebuild (bool): Build the vector store again even if it exists
+            file_hash (str): The hash of the PDF if already known, otherwise it is read from the manifest
+
+        Returns:
+            IngestionJob: The queued job, or the unfinished job already running for the same request
+        """
+
+        settings = settings or StoreSettings()
+        if file_hash is None:
+            file_hash = file_manifest.get_hash(file_path)
+        key = (os.path.normpath(file_path), file_hash, settings.key, rebuild)
+        with self._lock:
+            self._active = {
+                active_key: job
+                for active_key, job in self._active.items()
+                if not job.future.done()
+            }
+            job = self._active.get(key)
+            if job is not None:
+                return job
+            pending = len(self._active)
+            if pending >= self.max_pending:
+                raise RuntimeError(
+                    f"Too many ingestion jobs pending ({pending}), try again later"
+                )
+
+            evict_finished_jobs(self._jobs, self.finished_ttl, self.max_finished)
+            job = IngestionJob(file_path)
+            self._jobs[job.job_id] = job
+            self._active[key] = job
+            job.future = self._executor.submit(
+                job.run, embedding_function, settings, rebuild
+            )
+            return job
+
+    def get(self, job_id: str) -> IngestionJob | None:
+        """
+        Get a job by id
+
+        Args:
+            job_id (str): The id of the job
+
+        Returns:
+            IngestionJob | None: The job, or None if it does not exist
+        """
+
+        with self._lock:
+            return self._jobs.get(job_id)
+
+
+ingestion_jobs = IngestionJobManager(
+    max_workers=INGESTION_MAX_WORKERS, max_pending=INGESTION_MAX_PENDING
+)
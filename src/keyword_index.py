@@ -0,0 +1,302 @@
+import asyncio
+import math
+import os
+import re
+from collections import Counter
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForRetrieverRun,
+    CallbackManagerForRetrieverRun,
+)
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from typing import Any, Dict, List, Tuple
+from .config import BM25_K1, BM25_B, RRF_K, HYBRID_MIN_CANDIDATES
+
+KEYWORD_INDEX_FILE = "keyword_index.npz"
+
+TOKEN_PATTERN = re.compile(r"\w+")
+STOP_WORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this "
+    "to was were which with what when where who how does do did".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split a text into lowercase word tokens, without stop words. Tokens such as "MET", "14"
+    or "capmatinib" are kept as they are, so that they are matched exactly.
+
+    Args:
+        text (str): The text
+
+    Returns:
+        List[str]: The tokens
+    """
+
+    return [
+        token
+        for token in TOKEN_PATTERN.findall(text.lower())
+        if token not in STOP_WORDS
+    ]
+
+
+class BM25Index:
+    """
+    Compact BM25 inverted index over the chunks of a vector store, in the order of the FAISS labels.
+    The postings are stored as flat numpy arrays: the chunk labels and term frequencies of each term
+    are the slice between two consecutive offsets.
+    """
+
+    def __init__(
+        self,
+        terms: np.ndarray,
+        offsets: np.ndarray,
+        postings: np.ndarray,
+        frequencies: np.ndarray,
+        lengths: np.ndarray,
+    ):
+        self.terms = terms
+        self.offsets = offsets
+        self.postings = postings
+        self.frequencies = frequencies
+        self.lengths = lengths
+        self.vocabulary = {term: i for i, term in enumerate(terms.tolist())}
+        self.average_length = float(lengths.mean()) if len(lengths) else 0.0
+
+    @property
+    def nbytes(self) -> int:
+        return sum(
+            array.nbytes
+            for array in (
+                self.terms,
+                self.offsets,
+                self.postings,
+                self.frequencies,
+                self.lengths,
+            )
+        )
+
+    @classmethod
+    def build(cls, texts: List[str]) -> "BM25Index":
+        """
+        Build the index of a list of chunks
+
+        Args:
+            texts (List[str]): The chunk texts, in the order of their labels
+
+        Returns:
+            BM25Index: The index
+        """
+
+        term_postings: Dict[str, List[Tuple[int, int]]] = {}
+        lengths = np.zeros(len(texts), dtype=np.int32)
+        for label, text in enumerate(texts):
+            tokens = tokenize(text)
+            lengths[label] = len(tokens)
+            for term, frequency in Counter(tokens).items():
+                term_postings.setdefault(term, []).append((label, frequency))
+
+        terms = sorted(term_postings)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(term_postings[term]) for term in terms])
+        pairs = np.array(
+            [pair for term in terms for pair in term_postings[term]], dtype=np.int64
+        ).reshape(-1, 2)
+        return cls(
+            np.array(terms, dtype=np.str_),
+            offsets,
+            pairs[:, 0].astype(np.int32),
+            np.minimum(pairs[:, 1], np.iinfo(np.uint16).max).astype(np.uint16),
+            lengths,
+        )
+
+    def search(self, query: str, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Get the k chunks with the best BM25 score for a query
+
+        Args:
+            query (str): The query
+            k (int): The number of chunks
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: The labels of the chunks matching at least one query term,
+            best first, and their scores
+        """
+
+        scores = np.zeros(len(self.lengths), dtype=np.float32)
+        for term in set(tokenize(query)):
+            i = self.vocabulary.get(term)
+            if i is None:
+                continue
+            labels = self.postings[self.offsets[i] : self.offsets[i + 1]]
+            frequencies = self.frequencies[self.offsets[i] : self.offsets[i + 1]]
+            idf = math.log(
+                1 + (len(self.lengths) - len(labels) + 0.5) / (len(labels) + 0.5)
+            )
+            norms = BM25_K1 * (
+                1 - BM25_B + BM25_B * self.lengths[labels] / self.average_length
+            )
+            scores[labels] += idf * frequencies * (BM25_K1 + 1) / (frequencies + norms)
+
+        matches = np.flatnonzero(scores)
+        if len(matches) > k:
+            matches = matches[np.argpartition(-scores[matches], k - 1)[:k]]
+        matches = matches[np.argsort(-scores[matches], kind="stable")]
+        return matches, scores[matches]
+
+    def save(self, path: str):
+        """
+        Save the index in the directory of its vector store
+
+        Args:
+            path (str): The directory of the store
+        """
+
+        temp_path = os.path.join(path, KEYWORD_INDEX_FILE + ".tmp")
+        with open(temp_path, "wb") as f:
+            np.savez(
+                f,
+                terms=self.terms,
+                offsets=self.offsets,
+                postings=self.postings,
+                frequencies=self.frequencies,
+                lengths=self.lengths,
+            )
+        os.replace(temp_path, os.path.join(path, KEYWORD_INDEX_FILE))
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index | None":
+        """
+        Load the index saved with a vector store
+
+        Args:
+            path (str): The directory of the store
+
+        Returns:
+            BM25Index | None: The index, or None if the store has none
+        """
+
+        index_path = os.path.join(path, KEYWORD_INDEX_FILE)
+        if not os.path.exists(index_path):
+            return None
+        with np.load(index_path) as arrays:
+            return cls(
+                arrays["terms"],
+                arrays["offsets"],
+                arrays["postings"],
+                arrays["frequencies"],
+                arrays["lengths"],
+            )
+
+
+def build_keyword_index(vector_store: FAISS) -> BM25Index:
+    """
+    Build the keyword index of a vector store from the chunks of its docstore
+
+    Args:
+        vector_store (FAISS): The vector store
+
+    Returns:
+        BM25Index: The index
+    """
+
+    ids = [
+        vector_store.index_to_docstore_id[label]
+        for label in range(len(vector_store.index_to_docstore_id))
+    ]
+    if hasattr(vector_store.docstore, "mget"):
+        documents = vector_store.docstore.mget(ids)
+    else:
+        documents = {
+            chunk_id: vector_store.docstore.search(chunk_id) for chunk_id in ids
+        }
+    return BM25Index.build([documents[chunk_id].page_content for chunk_id in ids])
+
+
+def _documents(vector_store: FAISS, labels: List[int]) -> List[Document]:
+    documents = []
+    for label in labels:
+        doc = vector_store.docstore.search(vector_store.index_to_docstore_id[label])
+        if isinstance(doc, Document):
+            documents.append(doc)
+    return documents
+
+
+def reciprocal_rank_fusion(rankings: List[List[int]], k: int) -> List[int]:
+    """
+    Fuse several rankings, each label scoring 1 / (RRF_K + rank) in every ranking it appears in
+
+    Args:
+        rankings (List[List[int]]): The rankings, best first
+        k (int): The number of labels to keep
+
+    Returns:
+        List[int]: The k labels with the best fused score, best first
+    """
+
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, label in enumerate(ranking):
+            scores[label] = scores.get(label, 0.0) + 1 / (RRF_K + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)[:k]
+
+
+class KeywordRetriever(BaseRetriever):
+    """
+    Retrieve the chunks of a vector store by BM25 score, without embedding the query
+    """
+
+    vector_store: Any
+    keyword_index: Any
+    k: int = 5
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        labels, _ = self.keyword_index.search(query, self.k)
+        return _documents(self.vector_store, labels.tolist())
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Retrieve the chunks of a vector store by fusing the BM25 and the dense similarity rankings
+    with reciprocal rank fusion
+    """
+
+    vector_store: Any
+    keyword_index: Any
+    k: int = 5
+
+    @property
+    def candidates(self) -> int:
+        return max(4 * self.k, HYBRID_MIN_CANDIDATES)
+
+    def _fuse(self, query: str, embedding: List[float]) -> List[Document]:
+        _, dense_labels = self.vector_store.index.search(
+            np.array([embedding], dtype=np.float32),
+            min(self.candidates, self.vector_store.index.ntotal),
+        )
+        keyword_labels, _ = self.keyword_index.search(query, self.candidates)
+        labels = reciprocal_rank_fusion(
+            [
+                [label for label in dense_labels[0].tolist() if label >= 0],
+                keyword_labels.tolist(),
+            ],
+            self.k,
+        )
+        return _documents(self.vector_store, labels)
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        embedding = self.vector_store.embedding_function.embed_query(query)
+        return self._fuse(query, embedding)
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        embedding = await self.vector_store.embedding_function.aembed_query(query)
+        # The FAISS and BM25 searches are CPU-bound, keep them off the event loop
+        return await asyncio.to_thread(self._fuse, query, embedding)
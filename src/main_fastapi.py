@@ -1,53 +1,378 @@
-from .chains import get_rag_chain
-from .config import pdf_paths, search_types, UPLOAD_DIRECTORY
+from .answer_cache import answer_cache
+from .chains import (
+    aget_rag_chain,
+    aretrieve_and_format,
+    astream_answer,
+    build_rag_chain,
+)
+from .corpus_index import get_corpus_index
+from .config import (
+    pdf_paths,
+    search_types,
+    dense_search_types,
+    UPLOAD_DIRECTORY,
+    RESUME_MAX_CONCURRENCY,
+    RESUME_QUESTIONS_PER_CALL,
+    ENABLE_CORPUS_INDEX,
+    DEFAULT_INDEX_TYPE,
+    DEFAULT_EMBEDDING_DIMENSIONS,
+    DEFAULT_PRECISION,
+    QUERY_EMBEDDING_WARMUP,
+    FEATURES_MAX_CONCURRENCY,
+    EMBEDDING_BACKEND,
+)
+from .embedding import get_embedding_function
+from .embedding_cache import cached_query_embeddings, read_prompts
+from .features import FeatureExtractionJob
+from .file_manifest import file_manifest
+from .index_factory import INDEX_TYPES, PRECISIONS, StoreSettings
+from .jobs import evict_finished_jobs, ingestion_jobs
+from .reindex import list_uploaded_pdfs
+from .resume import aanswer_question_group
+from .text_cache import text_cache
+from .trends import features_file_version, trend_aggregates
+from .vector_store import aget_retriever, invalidate_vector_store, vector_store_cache
 from fastapi import FastAPI, File, UploadFile, HTTPException, Body
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, field_validator, Field
-from typing import Dict, Any, List
-from langchain_openai import OpenAIEmbeddings
+from typing import Dict, Any, List, Literal, Tuple
+from contextlib import asynccontextmanager, suppress
+import asyncio
+import hashlib
+import json
 import os
-import shutil
-import pandas as pd
+import tempfile
+import time
+
+embeddings = cached_query_embeddings(get_embedding_function(EMBEDDING_BACKEND))
+
+
+def warm_up_query_embeddings():
+    """
+    Pre-embed the resume prompts, asked again for every article
+    """
+
+    try:
+        prompts = read_prompts()
+        embedded = embeddings.warm_up(prompts)
+        print(
+            f"Query embedding cache warmed up: {len(prompts) - embedded}/{len(prompts)} prompts already cached"
+        )
+    except Exception as e:
+        print(f"Query embedding cache warm-up failed: {e}")
+
+
+def log_warm_up_failure(task: asyncio.Task):
+    """
+    Report a warm-up task that stopped with an error instead of leaving it unretrieved
+    """
+
+    if not task.cancelled() and task.exception() is not None:
+        print(f"Query embedding cache warm-up failed: {task.exception()}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # In the background, so that the API does not wait for the embedding endpoint to start.
+    # The task is kept on the app so that it is not garbage collected while it runs.
+    app.state.warm_up_task = None
+    if QUERY_EMBEDDING_WARMUP:
+        app.state.warm_up_task = asyncio.create_task(
+            run_in_threadpool(warm_up_query_embeddings)
+        )
+        app.state.warm_up_task.add_done_callback(log_warm_up_failure)
+    yield
+    if app.state.warm_up_task is not None and not app.state.warm_up_task.done():
+        app.state.warm_up_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await app.state.warm_up_task
 
-app = FastAPI()
-embeddings = OpenAIEmbeddings(model="text-embedding-3-large")
 
 MAX_FILE_SIZE = 20 * 1024 * 1024  # 20 MB
+MAX_FILES_PER_UPLOAD = 10
+MULTIPART_OVERHEAD = 64 * 1024  # boundaries and part headers of each file
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1 MB
+
+
+class UploadSizeLimitMiddleware:
+    """
+    Reject upload requests whose body exceeds the size limit of their route before Starlette spools
+    the files to disk. The declared Content-Length is checked first, then the bytes actually received,
+    for chunked requests and clients declaring a wrong length. The per-file limit is still enforced by
+    save_pdf, as a request within its limit can hold a file over it.
+    """
+
+    def __init__(self, app, max_sizes: Dict[str, int]):
+        self.app = app
+        self.max_sizes = max_sizes
+
+    async def __call__(self, scope, receive, send):
+        max_size = (
+            self.max_sizes.get(scope["path"]) if scope["type"] == "http" else None
+        )
+        if max_size is None:
+            await self.app(scope, receive, send)
+            return
+
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None and int(content_length) > max_size:
+            await self.reject(send, max_size)
+            return
+
+        received = 0
+        rejected = False
+
+        async def limited_receive():
+            nonlocal received, rejected
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_size:
+                    # Nothing has been sent yet as the body is still being read. The app sees a
+                    # disconnected client and its own error response is dropped.
+                    rejected = True
+                    await self.reject(send, max_size)
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def limited_send(message):
+            if not rejected:
+                await send(message)
+
+        await self.app(scope, limited_receive, limited_send)
+
+    @staticmethod
+    async def reject(send, max_size: int):
+        body = json.dumps(
+            {"detail": f"Request exceeds the {max_size // (1024 * 1024)} MB limit"}
+        ).encode()
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 413,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    max_sizes={
+        "/upload_pdf": MAX_FILE_SIZE + MULTIPART_OVERHEAD,
+        "/upload_pdfs": MAX_FILES_PER_UPLOAD * (MAX_FILE_SIZE + MULTIPART_OVERHEAD),
+    },
+)
 
 
 @app.get("/list_pdfs")
-def list_pdfs() -> List[str]:
+async def list_pdfs() -> List[str]:
     """
     List all available PDFs
     """
     return pdf_paths
 
 
-@app.post("/upload_pdf")
-def upload_pdf(file: UploadFile = File(..., description="PDF file to upload")):
+def save_pdf(file: UploadFile) -> Tuple[str, str]:
+    """
+    Stream an uploaded PDF to the upload directory in fixed-size chunks and record it in the file manifest.
+    The size limit is enforced while writing, the hash is computed on the fly, and the file is written
+    to a temporary file which is then atomically renamed.
+
+    Args:
+        file (UploadFile): The uploaded file
+
+    Returns:
+        Tuple[str, str]: The path of the written file and its SHA-256 hash
+    """
+
     if not file.filename.lower().endswith(".pdf"):
         raise HTTPException(status_code=400, detail="Only PDF files are allowed")
 
-    file_size = len(file.file.read())
-    file.file.seek(0)  # Reset file pointer to the beginning
+    os.makedirs(UPLOAD_DIRECTORY, exist_ok=True)
+    file_path = os.path.join(UPLOAD_DIRECTORY, os.path.basename(file.filename))
+
+    sha256 = hashlib.sha256()
+    file_size = 0
+    with tempfile.NamedTemporaryFile(
+        dir=UPLOAD_DIRECTORY, suffix=".part", delete=False
+    ) as buffer:
+        try:
+            for chunk in iter(lambda: file.file.read(UPLOAD_CHUNK_SIZE), b""):
+                file_size += len(chunk)
+                if file_size > MAX_FILE_SIZE:
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"{file.filename} exceeds the 20 MB limit",
+                    )
+                sha256.update(chunk)
+                buffer.write(chunk)
+        except BaseException:
+            buffer.close()
+            os.remove(buffer.name)
+            raise
+
+    file_hash = sha256.hexdigest()
+    invalidate_vector_store(file_path)
+    os.replace(buffer.name, file_path)
+    file_manifest.record(file_path, file_hash=file_hash)
+
+    if file_path not in pdf_paths:
+        pdf_paths.append(file_path)
+
+    return file_path, file_hash
 
-    if file_size > MAX_FILE_SIZE:
-        raise HTTPException(status_code=400, detail="File size exceeds the 20 MB limit")
 
+@app.post("/upload_pdf")
+async def upload_pdf(file: UploadFile = File(..., description="PDF file to upload")):
     try:
-        os.makedirs(UPLOAD_DIRECTORY, exist_ok=True)
-        file_path = os.path.join(UPLOAD_DIRECTORY, file.filename)
+        file_path, file_hash = await run_in_threadpool(save_pdf, file)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
 
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+    try:
+        job = ingestion_jobs.submit(file_path, embeddings, file_hash=file_hash)
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
 
-        pdf_paths.append(file_path)
+    return {
+        "message": f"File {file.filename} uploaded successfully",
+        "job_id": job.job_id,
+    }
 
-        return {"message": f"File {file.filename} uploaded successfully"}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
 
+@app.post("/upload_pdfs")
+async def upload_pdfs(
+    files: List[UploadFile] = File(..., description="PDF files to upload"),
+) -> List[Dict[str, Any]]:
+    """
+    Upload several PDFs at once. Each file is streamed to disk and queued for ingestion independently,
+    so a rejected file does not prevent the others from being uploaded.
+    """
+
+    results = []
+    for file in files:
+        try:
+            file_path, file_hash = await run_in_threadpool(save_pdf, file)
+            job = ingestion_jobs.submit(file_path, embeddings, file_hash=file_hash)
+            results.append(
+                {
+                    "filename": file.filename,
+                    "sha256": file_hash,
+                    "job_id": job.job_id,
+                    "error": None,
+                }
+            )
+        except HTTPException as e:
+            results.append({"filename": file.filename, "error": e.detail})
+        except Exception as e:
+            results.append(
+                {"filename": file.filename, "error": f"An error occurred: {str(e)}"}
+            )
+    return results
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str) -> Dict[str, Any]:
+    """
+    Get the status and progress (pages parsed, chunks embedded) of an ingestion job
+    """
+
+    job = ingestion_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job.to_dict()
+
+
+@app.get("/vector_store_cache")
+async def vector_store_cache_stats() -> Dict[str, int | float]:
+    """
+    Get the hit/miss counters and memory usage of the vector store cache
+    """
+    return vector_store_cache.stats()
 
-class ChainParameters(BaseModel):
+
+@app.get("/query_embedding_cache")
+async def query_embedding_cache_stats() -> Dict[str, int | float | str]:
+    """
+    Get the size and hit/miss counters of the query embedding cache
+    """
+    return embeddings.stats()
+
+
+@app.get("/answer_cache")
+async def answer_cache_stats() -> Dict[str, int | float]:
+    """
+    Get the size and hit/miss counters of the answer cache
+    """
+    return answer_cache.stats()
+
+
+@app.delete("/answer_cache")
+async def purge_answer_cache(
+    pdf_path: str | None = None,
+) -> Dict[str, int]:
+    """
+    Remove the cached answers of a PDF, or all the cached answers if no PDF is given
+    """
+
+    if pdf_path is None:
+        return {"removed": await run_in_threadpool(answer_cache.purge)}
+    if pdf_path not in pdf_paths:
+        raise HTTPException(status_code=404, detail=f"PDF {pdf_path} not found")
+    # The answers are keyed on the hash recorded when they were cached, so the file is not hashed again
+    file_hash = await run_in_threadpool(file_manifest.lookup, pdf_path)
+    if file_hash is None:
+        return {"removed": 0}
+    return {"removed": await run_in_threadpool(answer_cache.purge, file_hash)}
+
+
+class StoreParameters(BaseModel):
+    index_type: str = Field(
+        DEFAULT_INDEX_TYPE,
+        description="The vector index type of the article's store",
+        example="flat",
+    )
+    embedding_dimensions: int | None = Field(
+        DEFAULT_EMBEDDING_DIMENSIONS,
+        description="Truncate the embeddings of the article's store to this number of dimensions",
+        ge=1,
+        example=256,
+    )
+    precision: str = Field(
+        DEFAULT_PRECISION,
+        description="The precision of the vectors of the article's store",
+        example="float32",
+    )
+
+    @field_validator("index_type")
+    def validate_index_type(cls, v):
+        if v not in INDEX_TYPES:
+            raise ValueError(f"index_type must be one of {INDEX_TYPES}")
+        return v
+
+    @field_validator("precision")
+    def validate_precision(cls, v):
+        if v not in PRECISIONS:
+            raise ValueError(f"precision must be one of {PRECISIONS}")
+        return v
+
+    def store_settings(self) -> StoreSettings:
+        return StoreSettings(
+            index_type=self.index_type,
+            dimensions=self.embedding_dimensions,
+            precision=self.precision,
+        )
+
+
+class ChainParameters(StoreParameters):
     search_type: str = Field(..., description="The search type to use", example="mmr")
     pdf_path: str = Field(
         ..., description="The path to the PDF file to search in", example="path/to/pdf"
@@ -55,6 +380,11 @@ class ChainParameters(BaseModel):
     top_k: int = Field(
         5, description="The number of chunks to retrieve", ge=1, examples=5
     )
+    use_cache: bool = Field(
+        True,
+        description="Serve cached answers, set to false to generate fresh ones (they still refresh the cache)",
+        example=True,
+    )
 
     @field_validator("search_type")
     def validate_search_type(cls, v):
@@ -69,6 +399,139 @@ class ChainParameters(BaseModel):
         return v
 
 
+class ReindexParameters(StoreParameters):
+    pdf_paths: List[str] | None = Field(
+        None,
+        description="The PDFs to re-index, all the uploaded PDFs if not set",
+        example=["path/to/pdf"],
+    )
+
+    @field_validator("pdf_paths")
+    def validate_pdf_paths(cls, v):
+        if v is not None and any(path not in pdf_paths for path in v):
+            raise ValueError(f"PDFs must be among {pdf_paths}")
+        return v
+
+
+@app.post("/reindex")
+async def reindex(params: ReindexParameters | None = None) -> Dict[str, Any]:
+    """
+    Rebuild the vector stores of the uploaded PDFs in background jobs, e.g. after changing the chunking,
+    the embedding model or the index type. Documents already parsed start from the extracted text cache.
+    """
+
+    params = params or ReindexParameters()
+    file_paths = params.pdf_paths or list_uploaded_pdfs()
+    jobs = []
+    for file_path in file_paths:
+        if not os.path.exists(file_path):
+            jobs.append({"pdf_path": file_path, "error": "File not found"})
+            continue
+        try:
+            job = await run_in_threadpool(
+                ingestion_jobs.submit,
+                file_path,
+                embeddings,
+                params.store_settings(),
+                rebuild=True,
+            )
+            jobs.append({"pdf_path": file_path, "job_id": job.job_id, "error": None})
+        except RuntimeError as e:
+            jobs.append({"pdf_path": file_path, "error": str(e)})
+    return {"jobs": jobs, "text_cache": text_cache.stats()}
+
+
+class FeatureExtractionParameters(BaseModel):
+    pdf_paths: List[str] | None = Field(
+        None,
+        description="The PDFs to extract the features of, all the uploaded PDFs if not set",
+        example=["path/to/pdf"],
+    )
+    force: bool = Field(
+        False, description="Extract the documents already checkpointed again"
+    )
+    max_concurrency: int = Field(
+        FEATURES_MAX_CONCURRENCY,
+        ge=1,
+        description="The maximum number of documents extracted at the same time",
+    )
+
+    @field_validator("pdf_paths")
+    def validate_pdf_paths(cls, v):
+        if v is not None and any(path not in pdf_paths for path in v):
+            raise ValueError(f"PDFs must be among {pdf_paths}")
+        return v
+
+
+feature_extraction_jobs: Dict[str, FeatureExtractionJob] = {}
+
+
+@app.post("/extract_features")
+async def extract_features(
+    params: FeatureExtractionParameters | None = None,
+) -> Dict[str, Any]:
+    """
+    Extract the features of the Trends page from the uploaded PDFs in a background job.
+    Only new or changed documents are extracted, unless force is set. A run already in progress is
+    returned instead of starting another one.
+    """
+
+    for job in feature_extraction_jobs.values():
+        if job.status in ("queued", "running"):
+            return job.to_dict()
+
+    params = params or FeatureExtractionParameters()
+    file_paths = params.pdf_paths or list_uploaded_pdfs()
+    missing = [file_path for file_path in file_paths if not os.path.exists(file_path)]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"PDFs not found: {missing}")
+
+    evict_finished_jobs(feature_extraction_jobs)
+    job = FeatureExtractionJob(file_paths)
+    feature_extraction_jobs[job.job_id] = job
+    job.task = asyncio.create_task(
+        job.run(embeddings, max_concurrency=params.max_concurrency, force=params.force)
+    )
+    return job.to_dict()
+
+
+@app.get("/extract_features/{job_id}")
+async def get_feature_extraction_job(job_id: str) -> Dict[str, Any]:
+    """
+    Get the status, progress and throughput of a feature extraction job
+    """
+
+    job = feature_extraction_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job.to_dict()
+
+
+@app.get("/trends/version")
+async def get_trends_version() -> Dict[str, str | None]:
+    """
+    Get the version of the features behind the Trends aggregates, which changes when the features do
+    """
+    return {"version": features_file_version()}
+
+
+@app.get("/trends")
+async def get_trends() -> Dict[str, Any]:
+    """
+    Get the precomputed aggregates of the Trends page: cancer type, article type, date and treatment counts,
+    the treatment × sentiment matrix and the articles mentioning each treatment.
+    They are recomputed once when the features change.
+    """
+
+    aggregates = await run_in_threadpool(trend_aggregates.get)
+    if aggregates is None:
+        raise HTTPException(
+            status_code=404,
+            detail="No features yet, run the feature extraction first",
+        )
+    return aggregates
+
+
 class DocumentResponse(BaseModel):
     page_content: str
     metadata: Dict[str, Any]
@@ -82,7 +545,7 @@ class QueryArticleResponse(BaseModel):
 
 
 @app.post("/query_article")
-def query_article(
+async def query_article(
     chain_parameters: ChainParameters,
     query: str = Body(
         ..., description="The query to search for", example="AI advancements"
@@ -92,14 +555,16 @@ def query_article(
     Query a given article using the RAG model
     """
 
-    rag_chain = get_rag_chain(
+    rag_chain = await aget_rag_chain(
         search_type=chain_parameters.search_type,
         search_kwargs={"k": chain_parameters.top_k},
         pdf_path=chain_parameters.pdf_path,
         embedding_function=embeddings,
+        settings=chain_parameters.store_settings(),
+        use_cache=chain_parameters.use_cache,
     )
 
-    response = rag_chain.invoke(query)
+    response = await rag_chain.ainvoke(query)
 
     context = [
         DocumentResponse(page_content=doc.page_content, metadata=doc.metadata)
@@ -114,32 +579,281 @@ def query_article(
     )
 
 
+class CorpusQueryParameters(BaseModel):
+    search_type: str = Field(..., description="The search type to use", example="mmr")
+    pdf_paths: List[str] | None = Field(
+        None,
+        description="The paths of the PDF files to search in, all the corpus if not set",
+        example=["path/to/pdf"],
+    )
+    top_k: int = Field(
+        5, description="The number of chunks to retrieve", ge=1, examples=5
+    )
+
+    @field_validator("search_type")
+    def validate_search_type(cls, v):
+        if v not in dense_search_types:
+            raise ValueError(f"search_type must be one of {dense_search_types}")
+        return v
+
+    @field_validator("pdf_paths")
+    def validate_pdf_paths(cls, v):
+        if v is not None and any(path not in pdf_paths for path in v):
+            raise ValueError(f"PDFs must be among {pdf_paths}")
+        return v
+
+
+def get_enabled_corpus_index():
+    if not ENABLE_CORPUS_INDEX:
+        raise HTTPException(
+            status_code=404,
+            detail="The corpus index is disabled, set ENABLE_CORPUS_INDEX=true to enable it",
+        )
+    return get_corpus_index(embeddings)
+
+
+@app.post("/query_corpus")
+async def query_corpus(
+    corpus_parameters: CorpusQueryParameters,
+    query: str = Body(
+        ..., description="The query to search for", example="AI advancements"
+    ),
+) -> QueryArticleResponse:
+    """
+    Query the whole corpus, or a subset of its articles, with a single search using the RAG model
+    """
+
+    corpus_index = get_enabled_corpus_index()
+    try:
+        retriever = await run_in_threadpool(
+            corpus_index.as_retriever,
+            corpus_parameters.search_type,
+            corpus_parameters.top_k,
+            corpus_parameters.pdf_paths,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    response = await build_rag_chain(retriever).ainvoke(query)
+
+    context = [
+        DocumentResponse(page_content=doc.page_content, metadata=doc.metadata)
+        for doc in response["chunks"]
+    ]
+
+    return QueryArticleResponse(
+        question=response["question"],
+        answer=response["llm_response"].content,
+        response_metadata=response["llm_response"].response_metadata,
+        context=context,
+    )
+
+
+@app.delete("/corpus_documents")
+async def delete_corpus_document(pdf_path: str) -> Dict[str, str]:
+    """
+    Remove a PDF from the corpus index
+    """
+
+    corpus_index = get_enabled_corpus_index()
+    if not await run_in_threadpool(corpus_index.delete_document, pdf_path):
+        raise HTTPException(
+            status_code=404, detail=f"{pdf_path} is not in the corpus index"
+        )
+    return {"message": f"{pdf_path} removed from the corpus index"}
+
+
+def ndjson_frame(frame: Dict[str, Any]) -> str:
+    return json.dumps(frame, default=str) + "\n"
+
+
+@app.post("/query_article_stream")
+async def query_article_stream(
+    chain_parameters: ChainParameters,
+    query: str = Body(
+        ..., description="The query to search for", example="AI advancements"
+    ),
+) -> StreamingResponse:
+    """
+    Query a given article using the RAG model, streaming the response as newline-delimited JSON frames:
+    first a "context" frame with the retrieved chunks, then one "token" frame per generated token,
+    and finally a "metadata" frame with the response metadata and timings (or an "error" frame).
+    """
+
+    retriever = await aget_retriever(
+        search_type=chain_parameters.search_type,
+        search_kwargs={"k": chain_parameters.top_k},
+        pdf_path=chain_parameters.pdf_path,
+        embedding_function=embeddings,
+        settings=chain_parameters.store_settings(),
+    )
+
+    async def frames():
+        start = time.perf_counter()
+        try:
+            context_and_chunks = await aretrieve_and_format(query, retriever)
+            yield ndjson_frame(
+                {
+                    "type": "context",
+                    "context": [
+                        DocumentResponse(
+                            page_content=doc.page_content, metadata=doc.metadata
+                        ).model_dump()
+                        for doc in context_and_chunks["chunks"]
+                    ],
+                }
+            )
+
+            message = None
+            time_to_first_token = None
+            async for chunk in astream_answer(context_and_chunks["context"], query):
+                if time_to_first_token is None:
+                    time_to_first_token = time.perf_counter() - start
+                message = chunk if message is None else message + chunk
+                if chunk.content:
+                    yield ndjson_frame({"type": "token", "content": chunk.content})
+
+            yield ndjson_frame(
+                {
+                    "type": "metadata",
+                    "question": query,
+                    "response_metadata": {
+                        **(message.response_metadata if message is not None else {}),
+                        **context_and_chunks["context_stats"],
+                    },
+                    "time_to_first_token": time_to_first_token,
+                    "total_time": time.perf_counter() - start,
+                }
+            )
+        except Exception as e:
+            yield ndjson_frame(
+                {"type": "error", "detail": f"An error occurred: {str(e)}"}
+            )
+
+    return StreamingResponse(frames(), media_type="application/x-ndjson")
+
+
+class ResumeArticleResponse(BaseModel):
+    prompts: List[str]
+    answers: List[str]
+    errors: List[str | None]
+    durations: List[float]
+    total_time: float
+    total_tokens: int = 0
+
+
+async def answer_prompt(
+    rag_chain, prompt: str, semaphore: asyncio.Semaphore
+) -> Tuple[str, str | None, float, int]:
+    """
+    Answer a single prompt with the RAG chain, isolating its errors from the other prompts
+
+    Args:
+        rag_chain: The RAG chain to use
+        prompt (str): The prompt to answer
+        semaphore (asyncio.Semaphore): The semaphore bounding the number of prompts answered at the same time
+
+    Returns:
+        Tuple[str, str | None, float, int]: The answer, the error message if it failed, the wall time in seconds
+        and the number of tokens used
+    """
+
+    async with semaphore:
+        start = time.perf_counter()
+        try:
+            response = await rag_chain.ainvoke(prompt)
+            answer, error = response["llm_response"].content, None
+            tokens = (response["llm_response"].usage_metadata or {}).get(
+                "total_tokens", 0
+            )
+        except Exception as e:
+            answer, error, tokens = "", f"An error occurred: {str(e)}", 0
+        return answer, error, time.perf_counter() - start, tokens
+
+
+async def answer_question_group(
+    retriever, questions: List[str], semaphore: asyncio.Semaphore
+) -> Dict[str, Any]:
+    async with semaphore:
+        return await aanswer_question_group(retriever, questions)
+
+
 @app.post("/resume_article_from_prompts")
-def resume_article_from_prompts(
+async def resume_article_from_prompts(
     chain_parameters: ChainParameters,
     prompts: List[str] = Body(
         ...,
         example=["AI advancements"],
         description="A list of prompts to resume the article from",
     ),
-) -> Dict[str, List[str]]:
+    max_concurrency: int = Body(
+        RESUME_MAX_CONCURRENCY,
+        ge=1,
+        description="The maximum number of prompts, or groups of prompts, answered at the same time",
+    ),
+    mode: Literal["per_prompt", "grouped"] = Body(
+        "per_prompt",
+        description="per_prompt answers each prompt with its own RAG call. grouped retrieves the chunks "
+        "of a group of prompts once and answers them in a single model call, without the answer cache",
+    ),
+    questions_per_call: int = Body(
+        RESUME_QUESTIONS_PER_CALL,
+        ge=1,
+        description="The number of prompts answered by each model call in grouped mode",
+    ),
+) -> ResumeArticleResponse:
     """
-    Resume an article from a list of prompts using the RAG model
+    Resume an article from a list of prompts using the RAG model.
+    The prompts, or groups of prompts, are answered concurrently and the answers are returned in the order of the prompts.
     """
 
-    rag_chain = get_rag_chain(
+    start = time.perf_counter()
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    if mode == "grouped":
+        retriever = await aget_retriever(
+            search_type=chain_parameters.search_type,
+            search_kwargs={"k": chain_parameters.top_k},
+            pdf_path=chain_parameters.pdf_path,
+            embedding_function=embeddings,
+            settings=chain_parameters.store_settings(),
+        )
+        groups = [
+            prompts[i : i + questions_per_call]
+            for i in range(0, len(prompts), questions_per_call)
+        ]
+        results = await asyncio.gather(
+            *(answer_question_group(retriever, group, semaphore) for group in groups)
+        )
+        return ResumeArticleResponse(
+            prompts=prompts,
+            answers=[answer for result in results for answer in result["answers"]],
+            errors=[error for result in results for error in result["errors"]],
+            durations=[
+                result["seconds"] for result in results for _ in result["answers"]
+            ],
+            total_time=time.perf_counter() - start,
+            total_tokens=sum(result["tokens"] for result in results),
+        )
+
+    rag_chain = await aget_rag_chain(
         search_type=chain_parameters.search_type,
         search_kwargs={"k": chain_parameters.top_k},
         pdf_path=chain_parameters.pdf_path,
         embedding_function=embeddings,
+        settings=chain_parameters.store_settings(),
+        use_cache=chain_parameters.use_cache,
     )
 
-    answers = []
-    for prompt in prompts:
-        response = rag_chain.invoke(prompt)
-        answer = response["llm_response"].content
-        answers.append(answer)
-
-    response_df = pd.DataFrame({"prompts": prompts, "answers": answers})
+    results = await asyncio.gather(
+        *(answer_prompt(rag_chain, prompt, semaphore) for prompt in prompts)
+    )
 
-    return response_df.to_dict(orient="list")
+    return ResumeArticleResponse(
+        prompts=prompts,
+        answers=[answer for answer, _, _, _ in results],
+        errors=[error for _, error, _, _ in results],
+        durations=[duration for _, _, duration, _ in results],
+        total_time=time.perf_counter() - start,
+        total_tokens=sum(tokens for _, _, _, tokens in results),
+    )
@@ -0,0 +1,173 @@
+"""
+Compare loading a flat vector store in memory in each worker, as it was before memory-mapped stores,
+with memory-mapping its vectors: cold load time, first query latency and the memory each worker takes.
+The store files are evicted from the page cache before each run, so the workers load them cold.
+Workers are separate processes, like uvicorn workers, and report their resident memory (RSS) and their
+proportional share of it (PSS), which splits the pages shared through the page cache between them.
+
+Usage:
+    python -m src.mmap_benchmark [--vectors 200000] [--dimensions 1024] [--precision float32]
+                                 [--workers 4]
+"""
+
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from typing import Any, Dict, List
+from .embedding_benchmark import RemoteEmbeddingsStub
+from .index_factory import StoreSettings, build_index
+from .persistence import load_vector_store, save_vector_store
+
+
+def build_store(path: str, num_vectors: int, dimensions: int, precision: str):
+    """
+    Save a flat store of random vectors
+
+    Args:
+        path (str): The directory of the store
+        num_vectors (int): The number of vectors
+        dimensions (int): The dimensions of the vectors
+        precision (str): The precision of the stored vectors, float32 or float16
+    """
+
+    vectors = np.random.default_rng(0).standard_normal(
+        (num_vectors, dimensions), dtype=np.float32
+    )
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    settings = StoreSettings(index_type="flat", dimensions=None, precision=precision)
+    index, metadata = build_index(vectors, settings)
+    store = FAISS(
+        embedding_function=RemoteEmbeddingsStub(dimensions, 0.0, 0.0, 1000),
+        index=index,
+        docstore=InMemoryDocstore(),
+        index_to_docstore_id={},
+    )
+    store.add_embeddings(
+        text_embeddings=[(f"chunk {i}", vector) for i, vector in enumerate(vectors)]
+    )
+    save_vector_store(store, path, metadata)
+
+
+def evict_page_cache(path: str):
+    """
+    Ask the OS to drop the cached pages of the files of a store, so that the next load reads the disk
+
+    Args:
+        path (str): The directory of the store
+    """
+
+    for name in os.listdir(path):
+        fd = os.open(os.path.join(path, name), os.O_RDONLY)
+        try:
+            os.fsync(fd)
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+
+def memory_kb() -> Dict[str, int]:
+    """
+    Read the resident and proportional set sizes of the current process
+
+    Returns:
+        Dict[str, int]: The RSS and PSS, in kB
+    """
+
+    memory = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            name, _, value = line.partition(":")
+            if name in ("Rss", "Pss"):
+                memory[name.lower()] = int(value.split()[0])
+    return memory
+
+
+def worker(path: str, mmap: bool, dimensions: int, barrier, results):
+    # Runs in a worker process: load the store, search it once and report the measures
+    start = time.perf_counter()
+    embedding_function = RemoteEmbeddingsStub(dimensions, 0.0, 0.0, 1000)
+    store = load_vector_store(path, embedding_function, mmap=mmap)
+    loaded = time.perf_counter()
+    query = np.random.default_rng(os.getpid()).standard_normal(
+        (1, dimensions), dtype=np.float32
+    )
+    store.index.search(query, 4)
+    searched = time.perf_counter()
+    # Every worker holds the store when the memory is read, so the shared pages are split between them
+    barrier.wait()
+    results.put(
+        {
+            "load_ms": (loaded - start) * 1000,
+            "query_ms": (searched - loaded) * 1000,
+            **memory_kb(),
+        }
+    )
+    barrier.wait()
+
+
+def benchmark_workers(
+    path: str, mmap: bool, num_workers: int, dimensions: int
+) -> List[Dict[str, Any]]:
+    """
+    Load the store in worker processes started together, from a cold page cache
+
+    Args:
+        path (str): The directory of the store
+        mmap (bool): Whether the workers memory-map the vectors
+        num_workers (int): The number of worker processes
+        dimensions (int): The dimensions of the vectors
+
+    Returns:
+        List[Dict[str, Any]]: The measures of each worker, from the fastest load
+    """
+
+    evict_page_cache(path)
+    barrier = multiprocessing.Barrier(num_workers + 1)
+    results = multiprocessing.Queue()
+    processes = []
+    for _ in range(num_workers):
+        process = multiprocessing.Process(
+            target=worker, args=(path, mmap, dimensions, barrier, results)
+        )
+        process.start()
+        processes.append(process)
+    barrier.wait()
+    measures = [results.get() for _ in processes]
+    barrier.wait()
+    for process in processes:
+        process.join()
+    return sorted(measures, key=lambda measure: measure["load_ms"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--vectors", type=int, default=200000)
+    parser.add_argument("--dimensions", type=int, default=1024)
+    parser.add_argument(
+        "--precision", choices=["float32", "float16"], default="float32"
+    )
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as path:
+        build_store(path, args.vectors, args.dimensions, args.precision)
+        print(
+            f"{'load':<8}{'worker':>8}{'load ms':>10}{'query ms':>10}{'RSS MB':>10}{'PSS MB':>10}"
+        )
+        for mmap in (False, True):
+            measures = benchmark_workers(path, mmap, args.workers, args.dimensions)
+            for i, measure in enumerate(measures):
+                print(
+                    f"{'mmap' if mmap else 'memory':<8}{i:>8}{measure['load_ms']:>10.0f}"
+                    f"{measure['query_ms']:>10.1f}{measure['rss'] / 1024:>10.0f}"
+                    f"{measure['pss'] / 1024:>10.0f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
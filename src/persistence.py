@@ -0,0 +1,367 @@
+import faiss
+import json
+import os
+import pickle
+import shutil
+import time
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import Embeddings
+from typing import Any, Dict, Tuple
+from uuid import uuid4
+from .config import (
+    VECTOR_STORE_MMAP,
+    MMAP_SEARCH_BLOCK_SIZE,
+    STORE_VERSION_RETENTION,
+)
+from .docstore import SQLiteDocstore
+from .index_factory import (
+    enable_reconstruction,
+    load_store_metadata,
+    save_store_metadata,
+)
+from .keyword_index import BM25Index
+
+INDEX_FILE = "index.faiss"
+DOCSTORE_FILE = "docstore.sqlite"
+IDS_FILE = "index_to_docstore_id.json"
+LEGACY_DOCSTORE_FILE = "index.pkl"  # pickled by FAISS.save_local
+VECTORS_FILE = "vectors.npy"
+NORMS_FILE = "norms.npy"
+CURRENT_FILE = "CURRENT"  # names the directory of the current version of a store
+VERSION_PREFIX = "v"
+
+
+class NumpyFlatIndex:
+    """
+    Read-only exact L2 index over a numpy array of vectors, usually memory-mapped from disk so that
+    every worker process shares the same pages through the OS page cache.
+    It implements the part of the faiss.IndexFlatL2 interface used by the FAISS vector store.
+    """
+
+    is_trained = True
+
+    def __init__(self, vectors: np.ndarray, norms: np.ndarray):
+        self.vectors = vectors
+        self.norms = norms
+        self.ntotal, self.d = vectors.shape
+
+    def search(self, x: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Search the k nearest neighbours of each query, scanning the vectors block by block
+
+        Args:
+            x (np.ndarray): The queries, one per row
+            k (int): The number of neighbours
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: The squared L2 distances and the labels, padded with -1
+        """
+
+        x = np.asarray(x, dtype=np.float32)
+        distances = np.empty((len(x), self.ntotal), dtype=np.float32)
+        for start in range(0, self.ntotal, MMAP_SEARCH_BLOCK_SIZE):
+            block = np.asarray(
+                self.vectors[start : start + MMAP_SEARCH_BLOCK_SIZE], dtype=np.float32
+            )
+            distances[:, start : start + len(block)] = (
+                self.norms[start : start + len(block)] - 2 * x @ block.T
+            )
+        distances += (x**2).sum(axis=1, keepdims=True)
+
+        k_found = min(k, self.ntotal)
+        labels = np.argpartition(distances, k_found - 1, axis=1)[:, :k_found]
+        scores = np.take_along_axis(distances, labels, axis=1)
+        order = np.argsort(scores, axis=1)
+        labels = np.take_along_axis(labels, order, axis=1)
+        scores = np.take_along_axis(scores, order, axis=1)
+
+        padded_scores = np.full((len(x), k), np.inf, dtype=np.float32)
+        padded_labels = np.full((len(x), k), -1, dtype=np.int64)
+        padded_scores[:, :k_found] = np.maximum(scores, 0)
+        padded_labels[:, :k_found] = labels
+        return padded_scores, padded_labels
+
+    def reconstruct(self, i: int) -> np.ndarray:
+        return np.asarray(self.vectors[i], dtype=np.float32)
+
+    def sa_code_size(self) -> int:
+        return self.d * self.vectors.dtype.itemsize
+
+    def add(self, x: np.ndarray):
+        raise RuntimeError("Memory-mapped indexes are read-only")
+
+    def remove_ids(self, ids: np.ndarray):
+        raise RuntimeError("Memory-mapped indexes are read-only")
+
+
+def _is_mappable(metadata: Dict[str, Any]) -> bool:
+    # Flat float32 and float16 stores can be scanned directly from a numpy array
+    return metadata.get("effective_index_type") == "flat" and metadata.get(
+        "precision", "float32"
+    ) in ("float32", "float16")
+
+
+def _write_vectors(index, path: str, precision: str):
+    vectors = index.reconstruct_n(0, index.ntotal)
+    norms = (vectors**2).sum(axis=1).astype(np.float32)
+    _replace_file(
+        os.path.join(path, VECTORS_FILE),
+        lambda f: np.save(f, vectors.astype(precision)),
+    )
+    _replace_file(os.path.join(path, NORMS_FILE), lambda f: np.save(f, norms))
+
+
+def _replace_file(path: str, write):
+    # Files are replaced rather than overwritten, since other workers may have them memory-mapped
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as f:
+        write(f)
+    os.replace(temp_path, path)
+
+
+def _write_docstore(docstore, index_to_docstore_id: Dict[int, str], path: str):
+    docstore_path = os.path.join(path, DOCSTORE_FILE)
+    if (
+        isinstance(docstore, SQLiteDocstore)
+        and os.path.exists(docstore_path)
+        and os.path.samefile(docstore.path, docstore_path)
+    ):
+        return  # already written in place
+
+    if isinstance(docstore, SQLiteDocstore):
+        documents = docstore.mget(list(index_to_docstore_id.values()))
+    else:
+        documents = docstore._dict
+    temp_path = docstore_path + ".tmp"
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+    new_docstore = SQLiteDocstore(temp_path)
+    new_docstore.add(dict(documents))
+    new_docstore.close()
+    os.replace(temp_path, docstore_path)
+
+
+def _write_ids(index_to_docstore_id: Dict[int, str], path: str):
+    temp_path = os.path.join(path, IDS_FILE + ".tmp")
+    with open(temp_path, "w") as f:
+        json.dump(index_to_docstore_id, f)
+    os.replace(temp_path, os.path.join(path, IDS_FILE))
+
+
+def save_vector_store(vector_store: FAISS, path: str, metadata: Dict[str, Any]):
+    """
+    Save a vector store with its metadata: the FAISS index, the chunks in a SQLite docstore,
+    their keyword index and the mapping from index labels to chunk ids as JSON. Flat float stores also get their
+    vectors saved as a numpy array, so that they can be memory-mapped when loaded.
+
+    Args:
+        vector_store (FAISS): The vector store
+        path (str): The directory of the store
+        metadata (Dict[str, Any]): The metadata describing the store
+    """
+
+    os.makedirs(path, exist_ok=True)
+    _replace_file(
+        os.path.join(path, INDEX_FILE),
+        lambda f: f.write(faiss.serialize_index(vector_store.index).tobytes()),
+    )
+    save_store_metadata(path, metadata)
+    if _is_mappable(metadata):
+        _write_vectors(vector_store.index, path, metadata.get("precision", "float32"))
+    _write_docstore(vector_store.docstore, vector_store.index_to_docstore_id, path)
+    if getattr(vector_store, "keyword_index", None) is not None:
+        vector_store.keyword_index.save(path)
+    # Written last, the mapping marks the store as complete
+    _write_ids(vector_store.index_to_docstore_id, path)
+
+
+def current_store_version(path: str) -> str:
+    """
+    Get the directory holding the current version of a store
+
+    Args:
+        path (str): The directory of the store
+
+    Returns:
+        str: The version directory named by its CURRENT file, or the store directory itself for
+        stores saved in place
+    """
+
+    try:
+        with open(os.path.join(path, CURRENT_FILE), "r") as f:
+            return os.path.join(path, f.read().strip())
+    except FileNotFoundError:
+        return path
+
+
+def is_current_version(vector_store: FAISS) -> bool:
+    """
+    Check whether a loaded vector store is still the current version of its store, which another
+    worker process may have rebuilt since
+
+    Args:
+        vector_store (FAISS): The vector store
+
+    Returns:
+        bool: Whether the store is current, always True for stores that were never saved
+    """
+
+    store_path = getattr(vector_store, "store_path", None)
+    if store_path is None:
+        return True
+    return current_store_version(store_path) == vector_store.store_version
+
+
+def _version_time(name: str) -> int:
+    return int(name[len(VERSION_PREFIX) :].split("-")[0])
+
+
+def remove_stale_versions(path: str, retention: float = STORE_VERSION_RETENTION):
+    """
+    Remove the versions of a store older than the current one, once it has been current for
+    retention seconds: until then, other workers may still be answering requests from them.
+    Versions newer than the current one are being written and are kept.
+
+    Args:
+        path (str): The directory of the store
+        retention (float): The number of seconds a replaced version is kept
+    """
+
+    current = current_store_version(path)
+    if current == path:
+        return
+    if time.time() - os.path.getmtime(os.path.join(path, CURRENT_FILE)) < retention:
+        return
+    current_time = _version_time(os.path.basename(current))
+    for name in os.listdir(path):
+        entry = os.path.join(path, name)
+        if name.startswith(VERSION_PREFIX) and os.path.isdir(entry):
+            if _version_time(name) < current_time:
+                shutil.rmtree(entry, ignore_errors=True)
+        elif (
+            os.path.isfile(entry) and name != CURRENT_FILE and not name.endswith(".tmp")
+        ):
+            # Files of the store saved in place before it had versions
+            try:
+                os.remove(entry)
+            except FileNotFoundError:
+                pass
+
+
+def publish_vector_store(
+    vector_store: FAISS, path: str, metadata: Dict[str, Any]
+) -> str:
+    """
+    Save a vector store as a new version of a store and make it the current one. The version is
+    written to its own directory, then the CURRENT file is atomically replaced to point to it, so
+    workers never read a mix of the old and the new files.
+
+    Args:
+        vector_store (FAISS): The vector store
+        path (str): The directory of the store
+        metadata (Dict[str, Any]): The metadata describing the store
+
+    Returns:
+        str: The directory of the new version
+    """
+
+    version = f"{VERSION_PREFIX}{time.time_ns()}-{uuid4().hex[:8]}"
+    version_path = os.path.join(path, version)
+    save_vector_store(vector_store, version_path, metadata)
+    _replace_file(
+        os.path.join(path, CURRENT_FILE), lambda f: f.write(version.encode("utf-8"))
+    )
+    vector_store.store_path = path
+    vector_store.store_version = version_path
+    remove_stale_versions(path)
+    return version_path
+
+
+def is_vector_store(path: str) -> bool:
+    """
+    Check whether a directory holds a complete vector store, in the current or the legacy format
+
+    Args:
+        path (str): The directory of the store
+
+    Returns:
+        bool: Whether the store can be loaded
+    """
+
+    version_path = current_store_version(path)
+    return os.path.exists(os.path.join(version_path, IDS_FILE)) or os.path.exists(
+        os.path.join(version_path, LEGACY_DOCSTORE_FILE)
+    )
+
+
+def _migrate_legacy_docstore(path: str):
+    # Stores saved by FAISS.save_local are converted once, the pickle is trusted since we wrote it
+    with open(os.path.join(path, LEGACY_DOCSTORE_FILE), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    _write_docstore(docstore, index_to_docstore_id, path)
+    _write_ids(index_to_docstore_id, path)
+    os.remove(os.path.join(path, LEGACY_DOCSTORE_FILE))
+
+
+def load_vector_store(
+    path: str, embedding_function: Embeddings, mmap: bool = VECTOR_STORE_MMAP
+) -> FAISS:
+    """
+    Load the current version of a vector store saved by publish_vector_store or save_vector_store,
+    or by FAISS.save_local in which case it is converted first. Chunks stay on disk and are only
+    read for the search results.
+
+    With mmap, flat float stores are scanned from memory-mapped numpy arrays and IVF stores are read
+    with their inverted lists memory-mapped, so the vectors are shared across worker processes instead
+    of being copied into each one. Other stores are loaded in memory.
+
+    Args:
+        path (str): The directory of the store
+        embedding_function (Embeddings): The embedding function of the store
+        mmap (bool): Whether to memory-map the vectors when the store supports it
+
+    Returns:
+        FAISS: The vector store, with the directory of its store and version as store_path and store_version
+    """
+
+    store_path, path = path, current_store_version(path)
+    if not os.path.exists(os.path.join(path, IDS_FILE)):
+        _migrate_legacy_docstore(path)
+    metadata = load_store_metadata(path)
+    with open(os.path.join(path, IDS_FILE), "r") as f:
+        index_to_docstore_id = {
+            int(label): chunk_id for label, chunk_id in json.load(f).items()
+        }
+
+    if mmap and _is_mappable(metadata):
+        if not os.path.exists(os.path.join(path, VECTORS_FILE)):
+            # Stores saved before vectors were exported as numpy arrays
+            _write_vectors(
+                faiss.read_index(os.path.join(path, INDEX_FILE)),
+                path,
+                metadata.get("precision", "float32"),
+            )
+        index = NumpyFlatIndex(
+            np.load(os.path.join(path, VECTORS_FILE), mmap_mode="r"),
+            np.load(os.path.join(path, NORMS_FILE), mmap_mode="r"),
+        )
+    else:
+        if mmap and metadata.get("effective_index_type", "").startswith("ivf"):
+            flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+        else:
+            flags = 0
+        index = faiss.read_index(os.path.join(path, INDEX_FILE), flags)
+        enable_reconstruction(index)
+
+    vector_store = FAISS(
+        embedding_function=embedding_function,
+        index=index,
+        docstore=SQLiteDocstore(os.path.join(path, DOCSTORE_FILE)),
+        index_to_docstore_id=index_to_docstore_id,
+    )
+    vector_store.keyword_index = BM25Index.load(path)
+    vector_store.store_path = store_path
+    vector_store.store_version = path
+    remove_stale_versions(store_path)
+    return vector_store
@@ -0,0 +1,165 @@
+"""
+Compare the storage options of a vector store: embeddings truncated to fewer dimensions, and vectors
+stored as float32, float16 or int8. For each combination the store is saved and loaded again, and the
+benchmark reports the size of its index on disk, its load time and its recall@k against the full
+float32 store.
+Truncation only keeps the neighbours of Matryoshka embeddings, such as text-embedding-3. By default the
+vectors are synthetic, clustered with most of their norm in the leading dimensions like Matryoshka
+embeddings. Pass real embeddings saved with numpy.save to measure the quality on an actual corpus.
+
+Usage:
+    python -m src.quantization_benchmark [--embeddings embeddings.npy] [--vectors 20000]
+                                         [--dimensions 1024] [--truncate 1024 512 256]
+                                         [--precisions float32 float16 int8]
+                                         [--queries 200] [--top-k 4]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from typing import Any, Dict
+from .embedding_benchmark import RemoteEmbeddingsStub
+from .index_benchmark import clustered_vectors
+from .index_factory import PRECISIONS, StoreSettings, build_index, truncate_embeddings
+from .persistence import (
+    INDEX_FILE,
+    NORMS_FILE,
+    VECTORS_FILE,
+    load_vector_store,
+    save_vector_store,
+)
+
+
+def matryoshka_vectors(num_vectors: int, dimensions: int) -> np.ndarray:
+    """
+    Draw clustered vectors whose norm decreases along their dimensions, like Matryoshka embeddings
+
+    Args:
+        num_vectors (int): The number of vectors
+        dimensions (int): The dimensions of the vectors
+
+    Returns:
+        np.ndarray: The normalized float32 vectors, one per row
+    """
+
+    vectors = clustered_vectors(num_vectors, dimensions)
+    vectors *= (1 + np.arange(dimensions, dtype=np.float32)) ** -0.5
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def benchmark_store(
+    vectors: np.ndarray,
+    queries: np.ndarray,
+    expected: np.ndarray,
+    settings: StoreSettings,
+    top_k: int,
+) -> Dict[str, Any]:
+    """
+    Save and load a flat store of the vectors with the given settings and measure it
+
+    Args:
+        vectors (np.ndarray): The full float32 vectors
+        queries (np.ndarray): The full float32 queries, one per row
+        expected (np.ndarray): The labels of the exact top_k neighbours of each query
+        settings (StoreSettings): The store settings
+        top_k (int): The number of neighbours retrieved per query
+
+    Returns:
+        Dict[str, Any]: The measures
+    """
+
+    vectors = truncate_embeddings(vectors, settings.dimensions)
+    index, metadata = build_index(vectors, settings)
+    embedding_function = RemoteEmbeddingsStub(vectors.shape[1], 0.0, 0.0, 1000)
+    store = FAISS(
+        embedding_function=embedding_function,
+        index=index,
+        docstore=InMemoryDocstore(),
+        index_to_docstore_id={},
+    )
+    store.add_embeddings(
+        text_embeddings=[(f"chunk {i}", vector) for i, vector in enumerate(vectors)]
+    )
+
+    with tempfile.TemporaryDirectory() as path:
+        save_vector_store(store, path, metadata)
+        size = sum(
+            os.path.getsize(os.path.join(path, name))
+            for name in (INDEX_FILE, VECTORS_FILE, NORMS_FILE)
+            if os.path.exists(os.path.join(path, name))
+        )
+        start = time.perf_counter()
+        loaded = load_vector_store(path, embedding_function, mmap=False)
+        load_seconds = time.perf_counter() - start
+        _, labels = loaded.index.search(
+            truncate_embeddings(queries, settings.dimensions), top_k
+        )
+        loaded.docstore.close()
+
+    recall = np.mean(
+        [len(set(found) & set(truth)) / top_k for found, truth in zip(labels, expected)]
+    )
+    return {
+        "bytes_per_vector": metadata["bytes_per_vector"],
+        "size_mb": size / 2**20,
+        "load_ms": load_seconds * 1000,
+        "recall": float(recall),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument(
+        "--embeddings",
+        default=None,
+        help="A .npy file of real embeddings, one per row, instead of synthetic vectors",
+    )
+    parser.add_argument("--vectors", type=int, default=20000)
+    parser.add_argument("--dimensions", type=int, default=1024)
+    parser.add_argument("--truncate", type=int, nargs="+", default=[1024, 512, 256])
+    parser.add_argument(
+        "--precisions", nargs="+", choices=PRECISIONS, default=PRECISIONS
+    )
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=4)
+    args = parser.parse_args()
+
+    if args.embeddings:
+        vectors = truncate_embeddings(np.load(args.embeddings), None)
+    else:
+        vectors = matryoshka_vectors(args.vectors, args.dimensions)
+    # Queries are perturbed corpus vectors, as questions are close to the chunks answering them
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.choice(len(vectors), args.queries, replace=False)]
+    queries = queries + 0.05 * rng.standard_normal(queries.shape, dtype=np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    reference = build_index(
+        vectors, StoreSettings(index_type="flat", dimensions=None, precision="float32")
+    )[0]
+    reference.add(vectors)
+    _, expected = reference.search(queries, args.top_k)
+
+    print(
+        f"{'dimensions':>10}{'precision':>10}{'bytes/vec':>11}{'size MB':>9}{'load ms':>9}"
+        f"{'recall':>8}"
+    )
+    for dimensions in args.truncate:
+        for precision in args.precisions:
+            settings = StoreSettings(
+                index_type="flat",
+                dimensions=dimensions if dimensions < vectors.shape[1] else None,
+                precision=precision,
+            )
+            result = benchmark_store(vectors, queries, expected, settings, args.top_k)
+            print(
+                f"{dimensions:>10}{precision:>10}{result['bytes_per_vector']:>11}"
+                f"{result['size_mb']:>9.1f}{result['load_ms']:>9.0f}{result['recall']:>8.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Re-index uploaded PDFs in bulk, e.g. after changing the chunking, the embedding model or the index type.
+Documents that were already parsed start from the extracted text cache instead of the PDF.
+
+Usage:
+    python -m src.reindex [--backend openai|custom|local] [--index-type flat] [--dimensions 256]
+                          [--precision float32] [--purge-stale-text] [pdf_path ...]
+"""
+
+import argparse
+import os
+import time
+from langchain_core.embeddings import Embeddings
+from typing import Any, Dict, List
+from .config import (
+    EMBEDDING_BACKENDS,
+    EMBEDDING_BACKEND,
+    UPLOAD_DIRECTORY,
+    DEFAULT_INDEX_TYPE,
+    DEFAULT_EMBEDDING_DIMENSIONS,
+    DEFAULT_PRECISION,
+)
+from .embedding import get_embedding_function
+from .index_factory import INDEX_TYPES, PRECISIONS, StoreSettings
+from .text_cache import text_cache
+from .vector_store import load_or_create_vector_store
+
+
+def list_uploaded_pdfs(directory: str = UPLOAD_DIRECTORY) -> List[str]:
+    """
+    List the PDFs currently in the upload directory
+
+    Args:
+        directory (str): The upload directory
+
+    Returns:
+        List[str]: The paths of the PDFs
+    """
+
+    return sorted(
+        os.path.join(directory, name)
+        for name in os.listdir(directory)
+        if name.lower().endswith(".pdf")
+    )
+
+
+def reindex_documents(
+    file_paths: List[str],
+    embedding_function: Embeddings,
+    settings: StoreSettings = None,
+) -> List[Dict[str, Any]]:
+    """
+    Rebuild the vector stores of several PDFs one after the other
+
+    Args:
+        file_paths (List[str]): The paths of the PDFs
+        embedding_function (Embeddings): The embedding function to use
+        settings (StoreSettings): The store settings, the defaults if not set
+
+    Returns:
+        List[Dict[str, Any]]: For each PDF, the time taken, whether its text was cached, the number
+        of chunks embedded, or the error that stopped it
+    """
+
+    results = []
+    for file_path in file_paths:
+        progress = {}
+        start = time.perf_counter()
+        try:
+            load_or_create_vector_store(
+                file_path, embedding_function, settings, progress, rebuild=True
+            )
+            error = None
+        except Exception as e:
+            error = str(e)
+        results.append(
+            {
+                "pdf_path": file_path,
+                "seconds": time.perf_counter() - start,
+                "text_cached": progress.get("text_cached", False),
+                "chunks": progress.get("chunks_embedded", 0),
+                "error": error,
+            }
+        )
+        print(
+            f"Re-indexed {file_path} in {results[-1]['seconds']:.1f}s "
+            f"({'cached text' if results[-1]['text_cached'] else 'parsed'}, "
+            f"{results[-1]['chunks']} chunks)" + (f": {error}" if error else "")
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("pdf_paths", nargs="*", help="PDFs to re-index, all by default")
+    parser.add_argument(
+        "--backend", choices=EMBEDDING_BACKENDS, default=EMBEDDING_BACKEND
+    )
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default=DEFAULT_INDEX_TYPE)
+    parser.add_argument("--dimensions", type=int, default=DEFAULT_EMBEDDING_DIMENSIONS)
+    parser.add_argument("--precision", choices=PRECISIONS, default=DEFAULT_PRECISION)
+    parser.add_argument(
+        "--purge-stale-text",
+        action="store_true",
+        help="Remove text cached by older versions of the parser or cleaner",
+    )
+    args = parser.parse_args()
+
+    embedding_function = get_embedding_function(args.backend)
+
+    settings = StoreSettings(
+        index_type=args.index_type, dimensions=args.dimensions, precision=args.precision
+    )
+
+    if args.purge_stale_text:
+        print(f"Purged {text_cache.purge_stale()} stale text cache entries")
+
+    start = time.perf_counter()
+    results = reindex_documents(
+        args.pdf_paths or list_uploaded_pdfs(), embedding_function, settings
+    )
+    failed = [result for result in results if result["error"]]
+    print(
+        f"Re-indexed {len(results) - len(failed)}/{len(results)} documents "
+        f"in {time.perf_counter() - start:.1f}s, "
+        f"{sum(result['text_cached'] for result in results)} from cached text"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Answer the resume prompts of an article with one model call per group of questions instead of one
+call per question: the chunks retrieved for the questions of a group are sent once, de-duplicated,
+and the model returns the answers of every question as structured output.
+"""
+
+import asyncio
+import time
+from langchain_core.documents import Document
+from langchain_core.output_parsers import PydanticOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.vectorstores import VectorStoreRetriever
+from pydantic import BaseModel, Field
+from typing import Any, Dict, List
+from .chains import generation_model
+from .config import system_prompt, RESUME_CONTEXT_MAX_TOKENS
+from .context_assembly import assemble_context
+
+
+class QuestionAnswer(BaseModel):
+    question: int = Field(..., description="The number of the question")
+    answer: str = Field(..., description="The answer to the question")
+
+
+class ResumeAnswers(BaseModel):
+    answers: List[QuestionAnswer] = Field(
+        ..., description="One answer per question, in the order of the questions"
+    )
+
+
+resume_parser = PydanticOutputParser(pydantic_object=ResumeAnswers)
+
+resume_prompt = ChatPromptTemplate.from_messages(
+    [
+        ("system", system_prompt),
+        (
+            "human",
+            "Answer each of the following questions separately, from the context only.\n\n"
+            "{questions}\n\n{format_instructions}",
+        ),
+    ]
+).partial(format_instructions=resume_parser.get_format_instructions())
+
+
+async def aretrieve_union(
+    retriever: VectorStoreRetriever, questions: List[str]
+) -> List[Document]:
+    """
+    Retrieve the chunks of several questions and merge them without duplicates, interleaving the
+    rankings so that the best chunks of every question come first
+
+    Args:
+        retriever (VectorStoreRetriever): The retriever object to use
+        questions (List[str]): The questions
+
+    Returns:
+        List[Document]: The chunks
+    """
+
+    rankings = await asyncio.gather(*(retriever.ainvoke(q) for q in questions))
+    chunks: Dict[tuple, Document] = {}
+    for rank in range(max(map(len, rankings), default=0)):
+        for docs in rankings:
+            if rank < len(docs):
+                doc = docs[rank]
+                chunks.setdefault((doc.metadata.get("source"), doc.page_content), doc)
+    return list(chunks.values())
+
+
+async def aanswer_question_group(
+    retriever: VectorStoreRetriever,
+    questions: List[str],
+    max_tokens: int = RESUME_CONTEXT_MAX_TOKENS,
+) -> Dict[str, Any]:
+    """
+    Answer a group of questions with a single retrieval pass and a single model call
+
+    Args:
+        retriever (VectorStoreRetriever): The retriever object to use
+        questions (List[str]): The questions
+        max_tokens (int): The token budget of the shared context
+
+    Returns:
+        Dict[str, Any]: The answer and error of each question, the number of tokens used and the
+        wall time in seconds
+    """
+
+    start = time.perf_counter()
+    answers: List[str] = [""] * len(questions)
+    errors: List[str | None] = [None] * len(questions)
+    tokens = 0
+    try:
+        context = assemble_context(
+            await aretrieve_union(retriever, questions), max_tokens
+        )
+        message = await (resume_prompt | generation_model).ainvoke(
+            {
+                "context": context["context"],
+                "questions": "\n".join(
+                    f"{number}. {question}"
+                    for number, question in enumerate(questions, start=1)
+                ),
+            }
+        )
+        tokens = (message.usage_metadata or {}).get("total_tokens", 0)
+        answer_map = {
+            item.question: item.answer
+            for item in resume_parser.parse(message.content).answers
+        }
+        for i in range(len(questions)):
+            if i + 1 in answer_map:
+                answers[i] = answer_map[i + 1]
+            else:
+                errors[i] = "No answer returned for this question"
+    except Exception as e:
+        errors = [f"An error occurred: {str(e)}"] * len(questions)
+
+    return {
+        "answers": answers,
+        "errors": errors,
+        "tokens": tokens,
+        "seconds": time.perf_counter() - start,
+    }
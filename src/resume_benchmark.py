@@ -0,0 +1,217 @@
+"""
+Compare answering the resume prompts of an article with one RAG call per prompt, and with the grouped
+mode, which retrieves the chunks of a group of prompts once and answers them in a single model call.
+The generation model is a stub that sleeps for a latency per call and per output token and counts the
+tokens of its prompts, and the embedding endpoint is a stub that sleeps for its latency, so the
+benchmark runs offline and costs nothing.
+
+Usage:
+    python -m src.resume_benchmark [--prompts 20] [--questions-per-call 1 5 10 20]
+                                   [--max-concurrency 4] [--call-latency 1.0]
+                                   [--token-latency 0.01] [--embedding-latency 0.05]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import time
+from langchain_community.vectorstores import FAISS
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from typing import Any, Dict, List
+from . import chains, resume
+from .context_assembly import count_tokens
+from .embedding_benchmark import RemoteEmbeddingsStub, sample_texts
+
+QUESTION_PATTERN = re.compile(r"^(\d+)\. (.+)$", re.MULTILINE)
+
+
+class ResumeChatModelStub(BaseChatModel):
+    """
+    Stands in for the generation model. Grouped prompts, whose questions are numbered, are answered
+    with the structured output the resume parser expects, other prompts with plain text. Questions
+    containing "unanswered" are left out of the structured answers. Usage metadata counts the tokens
+    of the prompt and of the answer.
+    """
+
+    call_latency: float = 0.0
+    token_latency: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "resume-stub"
+
+    def _answer(self, messages) -> AIMessage:
+        question = messages[-1].content
+        numbered = QUESTION_PATTERN.findall(question)
+        if numbered:
+            content = json.dumps(
+                {
+                    "answers": [
+                        {"question": int(number), "answer": f"Answer to {text}"}
+                        for number, text in numbered
+                        if "unanswered" not in text
+                    ]
+                }
+            )
+        else:
+            content = f"Answer to {question}"
+        input_tokens = sum(count_tokens(message.content) for message in messages)
+        output_tokens = count_tokens(content)
+        return AIMessage(
+            content=content,
+            usage_metadata={
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens,
+            },
+        )
+
+    def _latency(self, message: AIMessage) -> float:
+        return (
+            self.call_latency
+            + self.token_latency * message.usage_metadata["output_tokens"]
+        )
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        message = self._answer(messages)
+        time.sleep(self._latency(message))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        message = self._answer(messages)
+        await asyncio.sleep(self._latency(message))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+async def resume_per_prompt(
+    retriever, prompts: List[str], max_concurrency: int
+) -> Dict[str, Any]:
+    """
+    Answer each prompt with its own RAG call
+
+    Args:
+        retriever: The retriever of the article
+        prompts (List[str]): The prompts
+        max_concurrency (int): The number of prompts answered at the same time
+
+    Returns:
+        Dict[str, Any]: The number of model calls and the tokens used
+    """
+
+    rag_chain = chains.build_rag_chain(retriever)
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def answer(prompt: str) -> int:
+        async with semaphore:
+            response = await rag_chain.ainvoke(prompt)
+            return response["llm_response"].usage_metadata["total_tokens"]
+
+    tokens = await asyncio.gather(*(answer(prompt) for prompt in prompts))
+    return {"calls": len(prompts), "tokens": sum(tokens)}
+
+
+async def resume_grouped(
+    retriever, prompts: List[str], questions_per_call: int, max_concurrency: int
+) -> Dict[str, Any]:
+    """
+    Answer the prompts in groups, one model call per group
+
+    Args:
+        retriever: The retriever of the article
+        prompts (List[str]): The prompts
+        questions_per_call (int): The number of prompts per group
+        max_concurrency (int): The number of groups answered at the same time
+
+    Returns:
+        Dict[str, Any]: The number of model calls and the tokens used
+    """
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+    groups = [
+        prompts[i : i + questions_per_call]
+        for i in range(0, len(prompts), questions_per_call)
+    ]
+
+    async def answer(group: List[str]) -> Dict[str, Any]:
+        async with semaphore:
+            return await resume.aanswer_question_group(retriever, group)
+
+    results = await asyncio.gather(*(answer(group) for group in groups))
+    if any(error for result in results for error in result["errors"]):
+        raise RuntimeError("A grouped answer failed")
+    return {"calls": len(groups), "tokens": sum(result["tokens"] for result in results)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--prompts", type=int, default=20)
+    parser.add_argument(
+        "--questions-per-call",
+        type=int,
+        nargs="+",
+        default=[1, 5, 10, 20],
+        help="1 answers each prompt with its own RAG call, as the per_prompt mode",
+    )
+    parser.add_argument("--max-concurrency", type=int, default=4)
+    parser.add_argument(
+        "--call-latency",
+        type=float,
+        default=1.0,
+        help="Latency of a generation call before its first token, in seconds",
+    )
+    parser.add_argument(
+        "--token-latency",
+        type=float,
+        default=0.01,
+        help="Latency of each generated token, in seconds",
+    )
+    parser.add_argument(
+        "--embedding-latency",
+        type=float,
+        default=0.05,
+        help="Round-trip latency of a query embedding request, in seconds",
+    )
+    parser.add_argument("--top-k", type=int, default=5)
+    args = parser.parse_args()
+
+    # The config turns LangSmith tracing on, which would add its uploads to the measures
+    os.environ["LANGCHAIN_TRACING_V2"] = "false"
+    embedding_function = RemoteEmbeddingsStub(256, args.embedding_latency, 0.0, 1000)
+    vector_store = FAISS.from_texts(sample_texts(None, 300), embedding_function)
+    retriever = vector_store.as_retriever(
+        search_type="similarity", search_kwargs={"k": args.top_k}
+    )
+    chains.generation_model = resume.generation_model = ResumeChatModelStub(
+        call_latency=args.call_latency, token_latency=args.token_latency
+    )
+    prompts = [
+        f"What does the article report about outcome {i}?" for i in range(args.prompts)
+    ]
+
+    print(f"{'mode':<12}{'per call':>9}{'calls':>7}{'tokens':>9}{'seconds':>9}")
+    for questions_per_call in args.questions_per_call:
+        start = time.perf_counter()
+        if questions_per_call == 1:
+            mode = "per_prompt"
+            result = asyncio.run(
+                resume_per_prompt(retriever, prompts, args.max_concurrency)
+            )
+        else:
+            mode = "grouped"
+            result = asyncio.run(
+                resume_grouped(
+                    retriever, prompts, questions_per_call, args.max_concurrency
+                )
+            )
+        print(
+            f"{mode:<12}{questions_per_call:>9}{result['calls']:>7}{result['tokens']:>9}"
+            f"{time.perf_counter() - start:>9.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
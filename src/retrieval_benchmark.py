@@ -0,0 +1,208 @@
+"""
+Compare the latency and recall@k of the search types of a store: dense similarity, BM25 and hybrid
+(reciprocal rank fusion of both).
+The corpus is synthetic, so the benchmark runs offline with known answers. Each chunk belongs to a topic
+and mentions a rare identifier, such as a trial number or a mutation. Two kinds of questions are asked:
+- identifier questions name the identifier of their chunk, but their embedding only captures its
+  topic, like an embedding model that does not know the identifier;
+- paraphrase questions share no word with their chunk, but their embedding is close to its embedding.
+The embeddings are drawn around topic centroids, and each query embedding call sleeps for the latency of
+an embedding endpoint. BM25 queries are not embedded.
+
+Usage:
+    python -m src.retrieval_benchmark [--chunks 1000 10000] [--topics 50] [--queries 200]
+                                      [--top-k 4] [--embedding-latency 0.05]
+"""
+
+import argparse
+import os
+import statistics
+import time
+import faiss
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import Embeddings
+from typing import Any, Dict, List, Tuple
+from .keyword_index import BM25Index, HybridRetriever, KeywordRetriever
+
+WORDS = (
+    "patients treated showed median progression free survival months compared control arm "
+    "hazard ratio confidence interval tumour response adverse events grade cohort"
+).split()
+SYNONYMS = (
+    "subjects receiving exhibited typical advancement absent lifetime weeks versus comparator "
+    "group risk proportion certainty range lesion reaction harmful occurrences level population"
+).split()
+
+
+class SyntheticEmbeddings(Embeddings):
+    """
+    Embeddings looked up from the vectors drawn for each text of the synthetic corpus and questions,
+    each query sleeping for a fixed latency like a remote embedding endpoint
+    """
+
+    def __init__(self, vectors: Dict[str, np.ndarray], latency: float):
+        self.vectors = vectors
+        self.latency = latency
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self.vectors[text].tolist() for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        time.sleep(self.latency)
+        return self.vectors[text].tolist()
+
+
+def synthetic_corpus(
+    num_chunks: int, num_topics: int, num_queries: int, dimensions: int = 128
+) -> Tuple[List[str], Dict[str, np.ndarray], Dict[str, List[Tuple[str, int]]]]:
+    """
+    Build the chunks, the embeddings of every text and the questions with their answer
+
+    Args:
+        num_chunks (int): The number of chunks
+        num_topics (int): The number of topics the chunks are drawn from
+        num_queries (int): The number of questions of each kind
+        dimensions (int): The dimensions of the embeddings
+
+    Returns:
+        Tuple[List[str], Dict[str, np.ndarray], Dict[str, List[Tuple[str, int]]]]: The chunks, the
+        embedding of each chunk and question, and the questions of each kind with the label of their
+        chunk
+    """
+
+    rng = np.random.default_rng(0)
+    centroids = rng.standard_normal((num_topics, dimensions), dtype=np.float32)
+    topics = rng.integers(num_topics, size=num_chunks)
+    vectors = centroids[topics] + 0.3 * rng.standard_normal(
+        (num_chunks, dimensions), dtype=np.float32
+    )
+
+    chunks = []
+    for label in range(num_chunks):
+        words = rng.choice(WORDS, size=40).tolist()
+        words.insert(int(rng.integers(40)), f"NCT{label:08d}")
+        chunks.append(" ".join(words))
+    embeddings = dict(zip(chunks, vectors))
+
+    questions = {"identifier": [], "paraphrase": []}
+    for label in rng.choice(num_chunks, size=num_queries, replace=False).tolist():
+        question = f"What did trial NCT{label:08d} report?"
+        embeddings[question] = centroids[topics[label]] + 0.3 * rng.standard_normal(
+            dimensions, dtype=np.float32
+        )
+        questions["identifier"].append((question, label))
+
+        question = " ".join(rng.choice(SYNONYMS, size=8).tolist()) + f" #{label}"
+        embeddings[question] = vectors[label] + 0.05 * rng.standard_normal(
+            dimensions, dtype=np.float32
+        )
+        questions["paraphrase"].append((question, label))
+    return chunks, embeddings, questions
+
+
+def build_store(chunks: List[str], embedding_function: Embeddings) -> FAISS:
+    """
+    Build a flat store of the chunks with its keyword index
+
+    Args:
+        chunks (List[str]): The chunks
+        embedding_function (Embeddings): The embedding function
+
+    Returns:
+        FAISS: The vector store
+    """
+
+    vectors = embedding_function.embed_documents(chunks)
+    store = FAISS(
+        embedding_function=embedding_function,
+        index=faiss.IndexFlatL2(len(vectors[0])),
+        docstore=InMemoryDocstore(),
+        index_to_docstore_id={},
+    )
+    store.add_embeddings(
+        text_embeddings=list(zip(chunks, vectors)),
+        metadatas=[{"label": label} for label in range(len(chunks))],
+    )
+    store.keyword_index = BM25Index.build(chunks)
+    return store
+
+
+def benchmark_retriever(
+    retriever, questions: List[Tuple[str, int]], top_k: int
+) -> Dict[str, Any]:
+    """
+    Ask the questions to a retriever and measure its recall and latency
+
+    Args:
+        retriever: The retriever
+        questions (List[Tuple[str, int]]): The questions, with the label of their chunk
+        top_k (int): The number of chunks retrieved
+
+    Returns:
+        Dict[str, Any]: The measures
+    """
+
+    hits = 0
+    latencies = []
+    for question, label in questions:
+        start = time.perf_counter()
+        docs = retriever.invoke(question)
+        latencies.append(time.perf_counter() - start)
+        hits += label in [doc.metadata["label"] for doc in docs[:top_k]]
+    return {
+        "recall": hits / len(questions),
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": float(np.percentile(latencies, 95)) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--chunks", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--topics", type=int, default=50)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=4)
+    parser.add_argument(
+        "--embedding-latency",
+        type=float,
+        default=0.05,
+        help="Round-trip latency of a query embedding request, in seconds",
+    )
+    args = parser.parse_args()
+
+    # The config turns LangSmith tracing on, which would add its uploads to the measures
+    os.environ["LANGCHAIN_TRACING_V2"] = "false"
+    print(
+        f"{'chunks':>7} {'search':<11}{'questions':<12}{'recall':>8}{'p50 ms':>9}{'p95 ms':>9}"
+    )
+    for num_chunks in args.chunks:
+        chunks, vectors, questions = synthetic_corpus(
+            num_chunks, args.topics, min(args.queries, num_chunks)
+        )
+        store = build_store(
+            chunks, SyntheticEmbeddings(vectors, args.embedding_latency)
+        )
+        retrievers = {
+            "similarity": store.as_retriever(
+                search_type="similarity", search_kwargs={"k": args.top_k}
+            ),
+            "bm25": KeywordRetriever(
+                vector_store=store, keyword_index=store.keyword_index, k=args.top_k
+            ),
+            "hybrid": HybridRetriever(
+                vector_store=store, keyword_index=store.keyword_index, k=args.top_k
+            ),
+        }
+        for name, retriever in retrievers.items():
+            for kind, kind_questions in questions.items():
+                result = benchmark_retriever(retriever, kind_questions, args.top_k)
+                print(
+                    f"{num_chunks:>7} {name:<11}{kind:<12}{result['recall']:>8.3f}"
+                    f"{result['p50_ms']:>9.1f}{result['p95_ms']:>9.1f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
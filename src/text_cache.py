@@ -0,0 +1,98 @@
+import json
+import os
+import sqlite3
+import threading
+import zlib
+import pypdf
+from typing import Dict, List
+from .config import text_cache_path
+from .text_cleaning import CLEANER_VERSION
+
+# Identifies the parser, page splitter and cleaner that produced the cached text.
+# Entries written by another version are ignored and rebuilt.
+TEXT_CACHE_VERSION = (
+    f"pypdf-{pypdf.__version__}-plain:split-4000-200:clean-{CLEANER_VERSION}"
+)
+
+
+class TextCache:
+    """
+    Persistent cache from a file hash to the extracted and cleaned text of each page of the PDF,
+    stored in SQLite as zlib-compressed JSON. Re-chunking or re-embedding a document starts from
+    this text instead of parsing the PDF again.
+    """
+
+    def __init__(self, path: str, version: str = TEXT_CACHE_VERSION):
+        self.path = path
+        self.version = version
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS pages ("
+                "file_hash TEXT NOT NULL, version TEXT NOT NULL, pages BLOB NOT NULL, "
+                "PRIMARY KEY (file_hash, version))"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get(self, file_hash: str) -> List[List[str]] | None:
+        """
+        Get the cleaned text of a document
+
+        Args:
+            file_hash (str): The hash of the PDF
+
+        Returns:
+            List[List[str]] | None: The cleaned sections of each page, or None if the document is not cached
+        """
+
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT pages FROM pages WHERE file_hash = ? AND version = ?",
+                (file_hash, self.version),
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, file_hash: str, pages: List[List[str]]):
+        """
+        Cache the cleaned text of a document
+
+        Args:
+            file_hash (str): The hash of the PDF
+            pages (List[List[str]]): The cleaned sections of each page
+        """
+
+        blob = zlib.compress(json.dumps(pages).encode("utf-8"))
+        with self._lock, self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO pages (file_hash, version, pages) VALUES (?, ?, ?)",
+                (file_hash, self.version, blob),
+            )
+
+    def purge_stale(self) -> int:
+        """
+        Remove the entries written by other versions of the parser or cleaner
+
+        Returns:
+            int: The number of entries removed
+        """
+
+        with self._lock, self._connect() as connection:
+            return connection.execute(
+                "DELETE FROM pages WHERE version != ?", (self.version,)
+            ).rowcount
+
+    def stats(self) -> Dict[str, int | str]:
+        with self._connect() as connection:
+            documents, size = connection.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(pages)), 0) FROM pages WHERE version = ?",
+                (self.version,),
+            ).fetchone()
+        return {"version": self.version, "documents": documents, "bytes": size}
+
+
+text_cache = TextCache(text_cache_path)
@@ -0,0 +1,88 @@
+import re
+import unicodedata
+from langchain.schema import Document
+
+# Bump when the cleaning output changes, so that the cached cleaned text is rebuilt
+CLEANER_VERSION = 1
+
+# Supprimer les URLs
+# ([$-_] spans digits, uppercase letters and the URL punctuation, so one character class is enough)
+URL_PATTERN = re.compile(r"http[s]?://[!$-_a-z]+")
+
+# Supprimer les DOI, numéros de volume, pages, et autres métadonnées scientifiques
+DOI_PATTERN = re.compile(r"DOI:?\s*\d+[\./]\d+")
+VOLUME_PATTERN = re.compile(r"Vol\.\s*\d+")
+# Numéros de pages et mentions de copyright.
+# Page numbers must start a word, so this pass runs after the DOI and volume passes: removing them
+# can put a page number right after a space instead of a digit. The word boundary is checked with a
+# lookbehind after the first letter, so that the regex engine can skip ahead to the candidate first
+# characters instead of trying every word boundary.
+PAGE_COPYRIGHT_PATTERN = re.compile(r"[Pp](?<!\w[Pp])ages?\s*\d+|©(?:\d{4})?")
+
+# Supprimer les mentions de licence et réutilisation.
+# A separate pass since removing "page\n12" can join the license mention and "License" on one line
+LICENSE_PATTERN = re.compile(r"Creative Commons.*?License")
+
+# Supprimer les informations de correspondance (emails et institutions), jusqu'à la fin de la ligne
+CORRESPONDENCE_PATTERN = re.compile(r"[Cc]orrespondence")
+
+# Remplacer les nouvelles lignes, tabulations et espaces multiples par un seul espace
+# (runs made of a single space are already clean and are not matched)
+WHITESPACE_PATTERN = re.compile(r"(?: \s|[^\S ])\s*")
+
+
+def remove_correspondence(text: str) -> str:
+    """
+    Remove each line from its first "correspondence" mention to its end, when the mention is
+    followed by a colon on the same line. Same result as re.sub(r"[Cc]orrespondence.*?:.*", "", text),
+    without rescanning long lines once per mention.
+
+    Args:
+        text (str): The text to clean
+
+    Returns:
+        str: The text without correspondence information
+    """
+
+    if "orrespondence" not in text:
+        return text
+    lines = text.split("\n")
+    for i, line in enumerate(lines):
+        match = CORRESPONDENCE_PATTERN.search(line)
+        if match is not None and ":" in line[match.end() :]:
+            lines[i] = line[: match.start()]
+    return "\n".join(lines)
+
+
+def clean_text(text: str) -> str:
+    """
+    Nettoie le texte d'un document scientifique de manière générique, en sept passes
+    d'expressions régulières précompilées.
+
+    :param text: Le texte à nettoyer
+    :return: Le texte nettoyé
+    """
+    # Normaliser les caractères Unicode
+    text = unicodedata.normalize("NFKD", text)
+
+    # Each pass may remove characters the next one relies on (e.g. the colon of a URL or a DOI
+    # for the correspondence pass), so the passes keep the order of the original substitutions
+    text = URL_PATTERN.sub("", text)
+    text = DOI_PATTERN.sub("", text)
+    text = VOLUME_PATTERN.sub("", text)
+    text = PAGE_COPYRIGHT_PATTERN.sub("", text)
+    text = LICENSE_PATTERN.sub("", text)
+    text = remove_correspondence(text)
+    text = WHITESPACE_PATTERN.sub(" ", text)
+
+    return text.strip()
+
+
+def clean_scientific_text(doc: Document) -> Document:
+    """
+    Nettoie le texte d'un document scientifique de manière générique.
+
+    :param doc: Un objet Document de LangChain
+    :return: Un nouvel objet Document avec le texte nettoyé
+    """
+    return Document(page_content=clean_text(doc.page_content), metadata=doc.metadata)
@@ -0,0 +1,214 @@
+import ast
+import json
+import os
+import threading
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from typing import Any, Dict, List
+from .config import features_path, features_csv_path, trends_aggregates_path
+
+FEATURES_SCHEMA = pa.schema(
+    [
+        ("article_name", pa.string()),
+        ("article_type", pa.string()),
+        ("article_date", pa.string()),
+        ("cancer_types", pa.list_(pa.string())),
+        ("treatment_name", pa.string()),
+        ("treatment_description", pa.string()),
+        ("treatment_sentiment", pa.string()),
+    ]
+)
+FEATURE_COLUMNS = FEATURES_SCHEMA.names
+TREATMENT_COLUMNS = ["treatment_name", "treatment_description", "treatment_sentiment"]
+
+
+def features_file_version(
+    path: str = features_path, csv_path: str = features_csv_path
+) -> str | None:
+    """
+    Identify the current content of the features table from its file metadata
+
+    Args:
+        path (str): The path to the Parquet features
+        csv_path (str): The path to the legacy CSV features, used when there is no Parquet file
+
+    Returns:
+        str | None: The version, or None if there are no features
+    """
+
+    for candidate in (path, csv_path):
+        if os.path.exists(candidate):
+            stat = os.stat(candidate)
+            return f"{os.path.basename(candidate)}:{stat.st_mtime_ns}:{stat.st_size}"
+    return None
+
+
+def read_features(
+    path: str = features_path, csv_path: str = features_csv_path
+) -> pd.DataFrame:
+    """
+    Read the features table, with cancer_types as a list column.
+    Features only available as CSV, with the lists as their Python repr, are parsed once and
+    converted to Parquet.
+
+    Args:
+        path (str): The path to the Parquet features
+        csv_path (str): The path to the legacy CSV features
+
+    Returns:
+        pd.DataFrame: The features
+    """
+
+    if os.path.exists(path):
+        return pd.read_parquet(path)
+    features_df = pd.read_csv(csv_path, dtype=str)
+    features_df["cancer_types"] = features_df["cancer_types"].map(
+        lambda value: ast.literal_eval(value) if isinstance(value, str) else []
+    )
+    write_features_table(features_df, path)
+    return features_df
+
+
+def write_features_table(features_df: pd.DataFrame, path: str = features_path):
+    """
+    Write the features table to Parquet with its typed schema, strings and a list of strings
+
+    Args:
+        features_df (pd.DataFrame): The features, with the FEATURE_COLUMNS columns
+        path (str): The path to the Parquet file
+    """
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    table = pa.Table.from_pandas(
+        features_df[FEATURE_COLUMNS], schema=FEATURES_SCHEMA, preserve_index=False
+    )
+    pq.write_table(table, path + ".tmp")
+    os.replace(path + ".tmp", path)
+
+
+def _columns(df: pd.DataFrame) -> Dict[str, List[Any]]:
+    # Column-oriented, with the missing values as null
+    return df.astype(object).where(df.notna(), None).to_dict(orient="list")
+
+
+def compute_trend_aggregates(features_df: pd.DataFrame) -> Dict[str, Any]:
+    """
+    Compute everything the Trends page plots, with grouped operations on the whole table
+
+    Args:
+        features_df (pd.DataFrame): The features, one row per article and treatment
+
+    Returns:
+        Dict[str, Any]: The cancer type, article type, date, treatment and treatment × sentiment
+        counts as column-oriented tables, and the articles of each treatment
+    """
+
+    articles = features_df.drop(columns=TREATMENT_COLUMNS).drop_duplicates(
+        subset=["article_name"]
+    )
+    cancers = (
+        articles[["article_type", "cancer_types"]]
+        .explode("cancer_types")
+        .dropna(subset=["cancer_types"])
+    )
+    treatments = features_df.dropna(subset=["treatment_name"])
+
+    return {
+        "cancer_type_counts": _columns(
+            cancers.groupby(["cancer_types", "article_type"], dropna=False)
+            .size()
+            .reset_index(name="count")
+        ),
+        "article_type_counts": _columns(
+            articles.groupby("article_type", dropna=False)
+            .size()
+            .reset_index(name="count")
+        ),
+        "article_date_counts": _columns(
+            articles.groupby(["article_date", "article_type"], dropna=False)
+            .size()
+            .reset_index(name="count")
+        ),
+        "treatment_counts": _columns(
+            treatments["treatment_name"]
+            .value_counts()
+            .rename_axis("treatment_name")
+            .reset_index(name="count")
+        ),
+        "treatment_sentiment_counts": _columns(
+            treatments.groupby(["treatment_name", "treatment_sentiment"], dropna=False)
+            .size()
+            .reset_index(name="count")
+        ),
+        "treatment_articles": treatments.drop_duplicates(
+            subset=["treatment_name", "article_name"]
+        )
+        .groupby("treatment_name")["article_name"]
+        .agg(list)
+        .to_dict(),
+    }
+
+
+def save_trend_aggregates(
+    features_df: pd.DataFrame, version: str, path: str = trends_aggregates_path
+) -> Dict[str, Any]:
+    """
+    Precompute the aggregates of a features table and store them for its version
+
+    Args:
+        features_df (pd.DataFrame): The features
+        version (str): The version of the features
+        path (str): The path to the aggregates file
+
+    Returns:
+        Dict[str, Any]: The aggregates, with their version
+    """
+
+    aggregates = {"version": version, **compute_trend_aggregates(features_df)}
+    temp_path = path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(aggregates, f)
+    os.replace(temp_path, path)
+    return aggregates
+
+
+class TrendAggregates:
+    """
+    The aggregates of the current features, kept in memory and on disk until the features change
+    """
+
+    def __init__(self, path: str = trends_aggregates_path):
+        self.path = path
+        self._aggregates: Dict[str, Any] | None = None
+        self._lock = threading.Lock()
+
+    def get(self) -> Dict[str, Any] | None:
+        """
+        Get the aggregates of the current features, recomputing them if the features changed
+
+        Returns:
+            Dict[str, Any] | None: The aggregates, or None if there are no features
+        """
+
+        version = features_file_version()
+        if version is None:
+            return None
+        with self._lock:
+            if self._aggregates is not None and self._aggregates["version"] == version:
+                return self._aggregates
+            try:
+                with open(self.path, encoding="utf-8") as f:
+                    aggregates = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                aggregates = None
+            if aggregates is None or aggregates.get("version") != version:
+                features_df = read_features()
+                # Reading legacy CSV features converts them to Parquet, a new version
+                version = features_file_version()
+                aggregates = save_trend_aggregates(features_df, version, self.path)
+            self._aggregates = aggregates
+            return aggregates
+
+
+trend_aggregates = TrendAggregates()
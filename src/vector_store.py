@@ -1,146 +1,429 @@
-import faiss
-import hashlib
+import asyncio
 import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Tuple
 from uuid import uuid4
 from langchain_openai import OpenAIEmbeddings
 from langchain_core.embeddings import Embeddings
 from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_community.vectorstores import FAISS
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from .config import embedding_folder
-import re
-from langchain.schema import Document
-import unicodedata
+from .answer_cache import answer_cache
+from .config import embedding_folder, VECTOR_STORE_CACHE_MAX_BYTES
+from .embedding import LocalEmbeddings, TruncatedEmbeddings
+from .file_manifest import file_manifest
+from .index_factory import (
+    StoreSettings,
+    build_index,
+    index_bytes_per_vector,
+    load_store_metadata,
+    truncate_embeddings,
+)
+from .ingestion import embed_pdf_chunks
+from .keyword_index import (
+    BM25Index,
+    HybridRetriever,
+    KeywordRetriever,
+    build_keyword_index,
+)
+from .persistence import (
+    current_store_version,
+    is_current_version,
+    is_vector_store,
+    load_vector_store,
+    publish_vector_store,
+)
+
+
+def embedding_backend(embedding_function: Embeddings) -> str:
+    """
+    Get the name of the backend behind an embedding function, used to key vector stores
 
+    Args:
+        embedding_function (Embeddings): The embedding function
 
-def clean_scientific_text(doc: Document) -> Document:
+    Returns:
+        str: "openai" for OpenAIEmbeddings, "local" for LocalEmbeddings, "custom" otherwise
     """
-    Nettoie le texte d'un document scientifique de manière générique.
 
-    :param doc: Un objet Document de LangChain
-    :return: Un nouvel objet Document avec le texte nettoyé
+    # Look through wrappers such as the query embedding cache
+    while hasattr(embedding_function, "underlying"):
+        embedding_function = embedding_function.underlying
+    if type(embedding_function) == OpenAIEmbeddings:
+        return "openai"
+    if isinstance(embedding_function, LocalEmbeddings):
+        return "local"
+    return "custom"
+
+
+def estimate_vector_store_size(vector_store: FAISS) -> int:
     """
-    text = doc.page_content
+    Estimate the memory footprint of a loaded vector store, in bytes
 
-    # Normaliser les caractères Unicode
-    text = unicodedata.normalize("NFKD", text)
+    Args:
+        vector_store (FAISS): The vector store
 
-    # Supprimer les URLs
-    text = re.sub(
-        r"http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+",
-        "",
-        text,
-    )
+    Returns:
+        int: The estimated size of the index vectors and the stored chunks
+    """
+
+    size = vector_store.index.ntotal * index_bytes_per_vector(vector_store.index)
+    keyword_index = getattr(vector_store, "keyword_index", None)
+    if keyword_index is not None:
+        size += keyword_index.nbytes
+    for doc in getattr(vector_store.docstore, "_dict", {}).values():
+        size += len(doc.page_content.encode("utf-8")) + len(str(doc.metadata))
+    return size
+
+
+class VectorStoreCache:
+    """
+    Process-wide LRU cache of loaded vector stores, bounded by an estimated memory budget.
+    Entries are keyed by (file hash, embedding backend, store settings key). A store rebuilt by
+    another worker process is dropped on its next lookup, as its version is no longer current.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._stores: OrderedDict[Tuple[str, ...], Tuple[FAISS, int]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Tuple[str, ...], record: bool = True) -> FAISS | None:
+        """
+        Get a vector store from the cache and mark it as most recently used
+
+        Args:
+            key (Tuple[str, ...]): The (file hash, embedding backend, store settings key) key
+            record (bool): Whether to count the lookup in the hit/miss counters
+
+        Returns:
+            FAISS | None: The cached vector store, or None on a miss
+        """
+
+        with self._lock:
+            entry = self._stores.get(key)
+        # Checked outside the lock, since it reads the CURRENT file of the store
+        if entry is not None and not is_current_version(entry[0]):
+            with self._lock:
+                if self._stores.get(key) is entry:
+                    self._remove(key)
+            entry = None
+
+        with self._lock:
+            if entry is None:
+                self.misses += record
+                return None
+            if key in self._stores:
+                self._stores.move_to_end(key)
+            self.hits += record
+            return entry[0]
+
+    def put(self, key: Tuple[str, ...], vector_store: FAISS):
+        """
+        Add a vector store to the cache, evicting the least recently used stores
+        until it fits in the memory budget. Stores larger than the whole budget are not cached.
+
+        Args:
+            key (Tuple[str, ...]): The (file hash, embedding backend, store settings key) key
+            vector_store (FAISS): The vector store to cache
+        """
+
+        size = estimate_vector_store_size(vector_store)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            self._remove(key)
+            while self._stores and self.current_bytes + size > self.max_bytes:
+                oldest_key = next(iter(self._stores))
+                self._remove(oldest_key)
+                self.evictions += 1
+            self._stores[key] = (vector_store, size)
+            self.current_bytes += size
+
+    def invalidate(self, file_hash: str):
+        """
+        Remove every cached vector store built from a given file hash
+
+        Args:
+            file_hash (str): The hash of the file
+        """
+
+        with self._lock:
+            for key in [key for key in self._stores if key[0] == file_hash]:
+                self._remove(key)
+
+    def clear(self):
+        """
+        Remove every cached vector store
+        """
+
+        with self._lock:
+            self._stores.clear()
+            self.current_bytes = 0
+
+    def stats(self) -> Dict[str, int | float]:
+        """
+        Get the cache statistics
+
+        Returns:
+            Dict[str, int | float]: The hit/miss counters and the memory usage
+        """
+
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._stores),
+                "current_bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+    def _remove(self, key: Tuple[str, ...]):
+        entry = self._stores.pop(key, None)
+        if entry is not None:
+            self.current_bytes -= entry[1]
+
+
+vector_store_cache = VectorStoreCache(max_bytes=VECTOR_STORE_CACHE_MAX_BYTES)
+
+
+def invalidate_vector_store(file_path: str):
+    """
+    Drop the cached vector stores of a file, e.g. before it is overwritten by a new upload
 
-    # Supprimer les DOI, numéros de volume, pages, et autres métadonnées scientifiques
-    text = re.sub(r"DOI:?\s*\d+[\./]\d+", "", text)  # Supprime les DOI
-    text = re.sub(r"Vol\.\s*\d+", "", text)  # Supprime les numéros de volume
-    text = re.sub(
-        r"\b(?:[Pp]age|[Pp]ages)\s*\d+", "", text
-    )  # Supprime les numéros de pages
-    text = re.sub(r"©.*?(?:\d{4})?", "", text)  # Supprime les mentions de copyright
+    Args:
+        file_path (str): The path to the file
+    """
+
+    if os.path.exists(file_path):
+        vector_store_cache.invalidate(file_manifest.get_hash(file_path))
 
-    # Supprimer les mentions de licence et réutilisation
-    text = re.sub(r"Creative Commons.*?License", "", text)
 
-    # Supprimer les informations de correspondance (emails et institutions)
-    text = re.sub(r"[Cc]orrespondence.*?:.*", "", text)
+_build_locks: Dict[Tuple[str, ...], threading.Lock] = {}
+_build_locks_guard = threading.Lock()
 
-    # Remplacer les nouvelles lignes et tabulations par des espaces
-    text = re.sub(r"[\n\t\r]+", " ", text)
 
-    # Supprimer les espaces multiples
-    text = re.sub(r"\s+", " ", text)
+def _build_lock(key: Tuple[str, ...]) -> threading.Lock:
+    with _build_locks_guard:
+        return _build_locks.setdefault(key, threading.Lock())
 
-    # Nettoyer les espaces au début et à la fin du texte
-    text = text.strip()
 
-    return Document(page_content=text, metadata=doc.metadata)
+def store_embedding_function(
+    embedding_function: Embeddings, settings: StoreSettings
+) -> Embeddings:
+    """
+    Get the embedding function a store uses for its queries, truncated to the store dimensions if needed
+
+    Args:
+        embedding_function (Embeddings): The embedding function
+        settings (StoreSettings): The store settings
 
+    Returns:
+        Embeddings: The embedding function of the store
+    """
 
-# Function to calculate the hash of the file content
-def calculate_file_hash(file_path):
-    with open(file_path, "rb") as f:
-        file_content = f.read()
-    return hashlib.sha256(file_content).hexdigest()
+    if settings.dimensions is None:
+        return embedding_function
+    return TruncatedEmbeddings(embedding_function, settings.dimensions)
 
 
-def load_or_create_vector_store(file_path: str, embedding_function: Embeddings):
+def create_vector_store(
+    file_path: str,
+    embedding_function: Embeddings,
+    settings: StoreSettings = None,
+    progress: Dict[str, int] = None,
+) -> Tuple[FAISS, Dict[str, Any]]:
     """
-    Load or create a vector store for a given file path
+    Create a vector store for a given file path: parse, clean, split and embed the PDF
 
     Args:
         file_path (str): The path to the file
         embedding_function (Embeddings): The embedding function to use
+        settings (StoreSettings): The store settings, the defaults if not set
+        progress (Dict[str, int]): Optional dictionary updated in place with the number of
+            pages parsed, chunks to embed and chunks embedded
 
     Returns:
-        vector_store: The vector store
+        Tuple[FAISS, Dict[str, Any]]: The vector store and the metadata describing its index
     """
 
-    file_hash = calculate_file_hash(file_path)
-    embeddings_path = os.path.join(embedding_folder, file_hash)
-    embeddings_path += (
-        "_openai_embeddings"
-        if type(embedding_function) == OpenAIEmbeddings
-        else "_custom_embeddings"
+    settings = settings or StoreSettings()
+    all_splits, vectors = embed_pdf_chunks(file_path, embedding_function, progress)
+
+    uuids = [str(uuid4()) for _ in range(len(all_splits))]
+    texts = [split.page_content for split in all_splits]
+    vectors = truncate_embeddings(vectors, settings.dimensions)
+
+    index, metadata = build_index(vectors, settings)
+
+    vector_store = FAISS(
+        embedding_function=store_embedding_function(embedding_function, settings),
+        index=index,
+        docstore=InMemoryDocstore(),
+        index_to_docstore_id={},
     )
 
-    if os.path.exists(embeddings_path):
-        print("Loading existing vector store")
-        vector_store = FAISS.load_local(
-            embeddings_path, embedding_function, allow_dangerous_deserialization=True
-        )
-        return vector_store
+    vector_store.add_embeddings(
+        text_embeddings=list(zip(texts, vectors.tolist())),
+        metadatas=[split.metadata for split in all_splits],
+        ids=uuids,
+    )
+    vector_store.keyword_index = BM25Index.build(texts)
 
-    else:
-        print("Creating new vector store")
-        loader = PyPDFLoader(file_path)
-        pages = loader.load_and_split()
+    return vector_store, metadata
 
-        pages_cleaned = [clean_scientific_text(page) for page in pages]
 
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000, chunk_overlap=200, add_start_index=True
-        )
-        all_splits = text_splitter.split_documents(pages_cleaned)
+def load_or_create_vector_store(
+    file_path: str,
+    embedding_function: Embeddings,
+    settings: StoreSettings = None,
+    progress: Dict[str, int] = None,
+    rebuild: bool = False,
+):
+    """
+    Load or create a vector store for a given file path.
+    Loaded stores are kept in the process-wide vector store cache, and concurrent calls for the
+    same store wait for a single load or build instead of starting their own.
+
+    Args:
+        file_path (str): The path to the file
+        embedding_function (Embeddings): The embedding function to use
+        settings (StoreSettings): The store settings, the defaults if not set
+        progress (Dict[str, int]): Optional dictionary updated in place with the build progress
+        rebuild (bool): Build the store again even if it exists, e.g. after changing the chunking.
+            The cached answers of the document are purged.
+
+    Returns:
+        vector_store: The vector store
+    """
 
-        uuids = [str(uuid4()) for _ in range(len(all_splits))]
+    settings = settings or StoreSettings()
+    file_hash = file_manifest.get_hash(file_path)
+    backend = embedding_backend(embedding_function)
+    cache_key = (file_hash, backend, settings.key)
 
-        index = faiss.IndexFlatL2(len(embedding_function.embed_query("hello world")))
+    vector_store = None if rebuild else vector_store_cache.get(cache_key)
+    if vector_store is not None:
+        return vector_store
 
-        vector_store = FAISS(
-            embedding_function=embedding_function,
-            index=index,
-            docstore=InMemoryDocstore(),
-            index_to_docstore_id={},
+    with _build_lock(cache_key):
+        # Another thread may have loaded or built the store while we were waiting
+        vector_store = (
+            None if rebuild else vector_store_cache.get(cache_key, record=False)
         )
+        if vector_store is not None:
+            return vector_store
 
-        vector_store.add_documents(documents=all_splits, ids=uuids)
-        vector_store.save_local(embeddings_path)
+        embeddings_path = os.path.join(
+            embedding_folder, f"{file_hash}_{backend}_embeddings{settings.key}"
+        )
 
+        if is_vector_store(embeddings_path) and not rebuild:
+            metadata = load_store_metadata(current_store_version(embeddings_path))
+            print(
+                f"Loading existing vector store ({metadata['effective_index_type']} index)"
+            )
+            vector_store = load_vector_store(
+                embeddings_path, store_embedding_function(embedding_function, settings)
+            )
+            if vector_store.keyword_index is None:
+                # Stores saved before they had a keyword index
+                vector_store.keyword_index = build_keyword_index(vector_store)
+                vector_store.keyword_index.save(vector_store.store_version)
+        else:
+            print("Creating new vector store")
+            vector_store, metadata = create_vector_store(
+                file_path, embedding_function, settings, progress
+            )
+            # Written as a new version, so that workers holding the previous one keep reading
+            # consistent files until they reload it
+            publish_vector_store(vector_store, embeddings_path, metadata)
+            if rebuild:
+                # Answers cached from the previous store may no longer match its chunks
+                answer_cache.purge(file_hash)
+
+        vector_store_cache.put(cache_key, vector_store)
         return vector_store
 
 
 def get_retriever(
-    search_type: str, search_kwargs: dict, pdf_path: str, embedding_function: Embeddings
+    search_type: str,
+    search_kwargs: dict,
+    pdf_path: str,
+    embedding_function: Embeddings,
+    settings: StoreSettings = None,
 ):
     """
     Get a retriever object for a given search type, search arguments, and PDF file.
     If the vector store for the PDF file does not exist, it will be created using the given embedding function.
+    Besides the FAISS search types, "bm25" ranks the chunks with the keyword index of the store, without
+    embedding the query, and "hybrid" fuses the BM25 and the similarity rankings.
 
     Args:
         search_type (str): The search type to use
         search_kwargs (dict): The search arguments to pass to the retriever
         pdf_path (str): The path to the PDF file to use
         embedding_function (Embeddings): The embedding function to use. If the vector store does not exist, it will be created using this function, otherwise it will be loade and the embedding function should be the same as the one used to create the vector store.
+        settings (StoreSettings): The store settings, the defaults if not set
 
     Returns:
         retriever: The retriever object
     """
 
-    vector_store = load_or_create_vector_store(pdf_path, embedding_function)
+    vector_store = load_or_create_vector_store(pdf_path, embedding_function, settings)
+    if search_type == "bm25":
+        return KeywordRetriever(
+            vector_store=vector_store,
+            keyword_index=vector_store.keyword_index,
+            k=search_kwargs.get("k", 4),
+        )
+    if search_type == "hybrid":
+        return HybridRetriever(
+            vector_store=vector_store,
+            keyword_index=vector_store.keyword_index,
+            k=search_kwargs.get("k", 4),
+        )
     retriever = vector_store.as_retriever(
         search_type=search_type, search_kwargs=search_kwargs
     )
     return retriever
+
+
+async def aget_retriever(
+    search_type: str,
+    search_kwargs: dict,
+    pdf_path: str,
+    embedding_function: Embeddings,
+    settings: StoreSettings = None,
+):
+    """
+    Asynchronous version of get_retriever. The blocking file hashing, FAISS loading and index
+    building are offloaded to a worker thread so they do not block the event loop.
+
+    Args:
+        search_type (str): The search type to use
+        search_kwargs (dict): The search arguments to pass to the retriever
+        pdf_path (str): The path to the PDF file to use
+        embedding_function (Embeddings): The embedding function to use
+        settings (StoreSettings): The store settings, the defaults if not set
+
+    Returns:
+        retriever: The retriever object
+    """
+
+    return await asyncio.to_thread(
+        get_retriever,
+        search_type,
+        search_kwargs,
+        pdf_path,
+        embedding_function,
+        settings,
+    )
@@ -0,0 +1,53 @@
+import hashlib
+import os
+import sys
+import tempfile
+import numpy as np
+import pytest
+from langchain_core.embeddings import Embeddings
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# The config resolves its paths from the working directory and lists src/docs on import,
+# and the caches create their files on import, so the tests run in a scratch directory
+WORKDIR = tempfile.mkdtemp(prefix="insightmed-tests-")
+os.makedirs(os.path.join(WORKDIR, "src", "docs"))
+open(os.path.join(WORKDIR, "src", "docs", "article.pdf"), "wb").close()
+os.chdir(WORKDIR)
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+import src.config  # noqa: E402
+
+os.environ["LANGCHAIN_TRACING_V2"] = "false"
+
+
+class FakeEmbeddings(Embeddings):
+    """
+    Deterministic embeddings derived from the hash of each text, counting the texts embedded
+    """
+
+    def __init__(self, dimensions: int = 16, model: str = "fake"):
+        self.dimensions = dimensions
+        self.model = model
+        self.embedded = 0
+        self.calls = 0
+
+    def vector(self, text: str):
+        seed = int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:8], 16)
+        vector = np.random.default_rng(seed).standard_normal(self.dimensions)
+        return (vector / np.linalg.norm(vector)).astype(np.float32).tolist()
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        self.embedded += len(texts)
+        return [self.vector(text) for text in texts]
+
+    def embed_query(self, text):
+        self.calls += 1
+        return self.vector(text)
+
+
+@pytest.fixture
+def fake_embeddings():
+    return FakeEmbeddings()
@@ -0,0 +1,123 @@
+import asyncio
+import itertools
+import threading
+import src.answer_cache as answer_cache_module
+from langchain_core.documents import Document
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+from src.answer_cache import AnswerCache, answer_cache_key
+from src.chains import with_answer_cache
+from src.index_factory import StoreSettings
+
+
+def response(question="What is MET?", answer="A receptor."):
+    return {
+        "question": question,
+        "llm_response": AIMessage(content=answer, response_metadata={"model": "m"}),
+        "chunks": [Document(page_content="chunk", metadata={"page": 1})],
+    }
+
+
+def test_key_normalizes_the_question_and_depends_on_the_fields():
+    key = answer_cache_key("What is MET?", file_hash="a", search_type="mmr")
+    assert (
+        answer_cache_key("  what is   MET? ", file_hash="a", search_type="mmr") == key
+    )
+    assert answer_cache_key("What is MET?", search_type="mmr", file_hash="a") == key
+    assert answer_cache_key("What is MET?", file_hash="b", search_type="mmr") != key
+    assert answer_cache_key("What is ALK?", file_hash="a", search_type="mmr") != key
+
+
+def test_cached_answers_round_trip(tmp_path):
+    cache = AnswerCache(str(tmp_path / "answers.sqlite"), ttl=60, max_entries=10)
+    assert cache.get("key") is None
+
+    cache.put("key", "hash", response())
+    cached = cache.get("key")
+    assert cached["llm_response"].content == "A receptor."
+    assert cached["llm_response"].response_metadata["cache_hit"] is True
+    assert cached["chunks"][0].metadata == {"page": 1}
+    assert cache.stats()["hits"] == 1
+
+
+def test_expiry_eviction_and_purge(tmp_path, monkeypatch):
+    expired = AnswerCache(str(tmp_path / "expired.sqlite"), ttl=0, max_entries=10)
+    expired.put("key", "hash", response())
+    assert expired.get("key") is None
+
+    clock = itertools.count(1000)
+    monkeypatch.setattr(answer_cache_module.time, "time", lambda: next(clock))
+    cache = AnswerCache(str(tmp_path / "answers.sqlite"), ttl=60, max_entries=2)
+    for key in ("a", "b", "c"):
+        cache.put(key, "hash" if key != "c" else "other", response())
+    assert cache.stats()["entries"] == 2
+    assert cache.get("a") is None
+    assert cache.purge("hash") == 1
+    assert cache.get("c") is not None
+
+
+def test_answers_are_keyed_on_the_embedding_model(tmp_path, fake_embeddings):
+    cache = AnswerCache(str(tmp_path / "answers.sqlite"), ttl=60, max_entries=10)
+    calls = []
+    rag_chain = RunnableLambda(lambda question: calls.append(question) or response())
+
+    def chain(embedding_function):
+        return with_answer_cache(
+            rag_chain,
+            "hash",
+            "mmr",
+            {"k": 4},
+            StoreSettings(),
+            embedding_function,
+            cache=cache,
+        )
+
+    chain(fake_embeddings).invoke("What is MET?")
+    chain(type(fake_embeddings)()).invoke("What is MET?")
+    assert len(calls) == 1
+    chain(type(fake_embeddings)(model="other")).invoke("What is MET?")
+    assert len(calls) == 2
+
+
+class ThreadRecordingAnswerCache(AnswerCache):
+    def __init__(self, path: str):
+        super().__init__(path, ttl=60, max_entries=10)
+        self.threads = []
+
+    def get(self, key):
+        self.threads.append(threading.current_thread())
+        return super().get(key)
+
+    def put(self, key, file_hash, response):
+        self.threads.append(threading.current_thread())
+        super().put(key, file_hash, response)
+
+
+def test_async_answers_read_and_write_sqlite_off_the_event_loop(
+    tmp_path, fake_embeddings
+):
+    cache = ThreadRecordingAnswerCache(str(tmp_path / "answers.sqlite"))
+
+    async def ainvoke(question):
+        return response(question)
+
+    chain = with_answer_cache(
+        RunnableLambda(lambda question: response(question), afunc=ainvoke),
+        "hash",
+        "mmr",
+        {"k": 4},
+        StoreSettings(),
+        fake_embeddings,
+        cache=cache,
+    )
+
+    async def run():
+        fresh = await chain.ainvoke("What is MET?")
+        cached = await chain.ainvoke("What is MET?")
+        return threading.current_thread(), fresh, cached
+
+    loop_thread, fresh, cached = asyncio.run(run())
+    assert fresh["llm_response"].response_metadata["cache_hit"] is False
+    assert cached["llm_response"].response_metadata["cache_hit"] is True
+    assert len(cache.threads) == 3
+    assert loop_thread not in cache.threads
@@ -0,0 +1,67 @@
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from src.context_assembly import assemble_context, count_tokens, merge_chunks
+
+PAGE = " ".join(
+    f"Sentence {i} reports the response of MET exon 14 skipping tumours to treatment {i}."
+    for i in range(60)
+)
+
+
+def page_chunks():
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=1000, chunk_overlap=200, add_start_index=True
+    )
+    return splitter.split_documents(
+        [Document(page_content=PAGE, metadata={"source": "a.pdf", "page": 0})]
+    )
+
+
+def test_overlapping_chunks_are_merged_into_the_page_text():
+    chunks = page_chunks()
+    docs = [chunks[2], chunks[0], chunks[1], chunks[4]]
+
+    passages = merge_chunks(docs)
+    assert len(passages) == 2
+    for passage in passages:
+        assert passage["text"] in PAGE
+    assert passages[0]["rank"] == 0
+    assert len(passages[0]["chunks"]) == 3
+
+
+def test_chunks_of_other_sections_are_not_merged():
+    first, second = page_chunks()[:2]
+    other = Document(
+        page_content="Unrelated text " * 20,
+        metadata={**second.metadata, "start_index": second.metadata["start_index"]},
+    )
+    assert len(merge_chunks([first, other])) == 2
+
+
+def test_context_stats_and_near_duplicates():
+    chunks = page_chunks()
+    copy = Document(page_content=chunks[0].page_content, metadata={"source": "b.pdf"})
+    docs = [chunks[0], chunks[1], copy]
+
+    context = assemble_context(docs)
+    stats = context["context_stats"]
+    assert stats["context_chunks"] == 2
+    assert stats["context_chunks_merged"] == 1
+    assert stats["context_chunks_duplicates"] == 1
+    assert stats["context_tokens"] == count_tokens(context["context"])
+    assert stats["context_tokens_saved"] > 0
+    assert context["chunks"] == docs[:2]
+
+
+def test_context_fits_the_token_budget():
+    chunks = page_chunks()
+    docs = [chunks[0], chunks[3], chunks[5]]
+
+    context = assemble_context(docs, max_tokens=300)
+    assert count_tokens(context["context"]) <= 300
+    assert context["chunks"] == [chunks[0]]
+    assert context["context_stats"]["context_chunks_over_budget"] == 2
+
+    truncated = assemble_context(docs[:1], max_tokens=20)
+    assert 0 < count_tokens(truncated["context"]) <= 20
+    assert assemble_context([])["context"] == ""
@@ -0,0 +1,131 @@
+import faiss
+import os
+from langchain_core.documents import Document
+from src.corpus_index import CorpusIndex
+from src.index_factory import load_store_metadata
+
+
+def add_article(index, fake_embeddings, name, num_chunks=3):
+    texts = [f"{name} chunk {i}" for i in range(num_chunks)]
+    chunks = [
+        Document(page_content=text, metadata={"source": f"docs/{name}.pdf", "page": 0})
+        for text in texts
+    ]
+    index.add_chunks(
+        f"hash-{name}",
+        f"docs/{name}.pdf",
+        chunks,
+        [fake_embeddings.vector(text) for text in texts],
+    )
+
+
+def sources(index, query):
+    docs = index.as_retriever("similarity", k=1).invoke(query)
+    return [doc.metadata["source"] for doc in docs]
+
+
+def log_files(path):
+    return sorted(name for name in os.listdir(path) if name.endswith(".log"))
+
+
+def test_additions_are_logged_then_saved_in_batches(tmp_path, fake_embeddings):
+    index = CorpusIndex(fake_embeddings, path=str(tmp_path), snapshot_min_vectors=7)
+    add_article(index, fake_embeddings, "first")
+    assert load_store_metadata(str(tmp_path))["generation"] == 1
+    assert log_files(tmp_path) == []
+
+    add_article(index, fake_embeddings, "second")
+    add_article(index, fake_embeddings, "third")
+    assert load_store_metadata(str(tmp_path))["num_vectors"] == 3
+    assert log_files(tmp_path) == ["vectors.1.log"]
+
+    reloaded = CorpusIndex(fake_embeddings, path=str(tmp_path))
+    assert sources(reloaded, "third chunk 1") == ["docs/third.pdf"]
+    assert reloaded._store.index.ntotal == 9
+
+    add_article(index, fake_embeddings, "fourth")
+    assert load_store_metadata(str(tmp_path))["generation"] == 2
+    assert log_files(tmp_path) == []
+
+
+def test_processes_catch_up_on_each_other(tmp_path, fake_embeddings):
+    first = CorpusIndex(fake_embeddings, path=str(tmp_path), snapshot_min_vectors=100)
+    second = CorpusIndex(fake_embeddings, path=str(tmp_path), snapshot_min_vectors=100)
+    add_article(first, fake_embeddings, "a")
+    add_article(second, fake_embeddings, "b")
+    add_article(first, fake_embeddings, "c")
+
+    assert sources(first, "b chunk 0") == ["docs/b.pdf"]
+    assert sources(second, "c chunk 2") == ["docs/c.pdf"]
+    assert second._store.index.ntotal == first._store.index.ntotal == 9
+
+    assert second.delete_document("docs/a.pdf")
+    assert sources(first, "a chunk 0") != ["docs/a.pdf"]
+    assert set(first._chunk_ids) == {"hash-b", "hash-c"}
+
+
+def test_a_replaced_document_and_a_torn_log_record(tmp_path, fake_embeddings):
+    index = CorpusIndex(fake_embeddings, path=str(tmp_path), snapshot_min_vectors=100)
+    add_article(index, fake_embeddings, "a")
+    add_article(index, fake_embeddings, "b")
+    with open(os.path.join(tmp_path, "vectors.1.log"), "ab") as f:
+        f.write(b"partial record")
+
+    reloaded = CorpusIndex(
+        fake_embeddings, path=str(tmp_path), snapshot_min_vectors=100
+    )
+    add_article(reloaded, fake_embeddings, "c")
+    assert sources(CorpusIndex(fake_embeddings, path=str(tmp_path)), "c chunk 1") == [
+        "docs/c.pdf"
+    ]
+
+    texts = ["new a chunk"]
+    reloaded.add_chunks(
+        "hash-a2",
+        "docs/a.pdf",
+        [Document(page_content=texts[0], metadata={"source": "docs/a.pdf"})],
+        [fake_embeddings.vector(texts[0])],
+    )
+    fresh = CorpusIndex(fake_embeddings, path=str(tmp_path))
+    fresh.as_retriever("similarity", k=1)
+    assert set(fresh._chunk_ids) == {"hash-a2", "hash-b", "hash-c"}
+    assert fresh._store.index.ntotal == 7
+
+
+def test_subset_searches_only_reach_the_subset(tmp_path, fake_embeddings):
+    index = CorpusIndex(fake_embeddings, path=str(tmp_path), snapshot_min_vectors=100)
+    for name in ("a", "b", "c"):
+        add_article(index, fake_embeddings, name)
+    assert index.delete_document("docs/a.pdf")
+
+    for search_type in ("similarity", "mmr"):
+        retriever = index.as_retriever(search_type, k=2, file_paths=["docs/c.pdf"])
+        docs = retriever.invoke("b chunk 0")
+        assert len(docs) == 2
+        assert {doc.metadata["source"] for doc in docs} == {"docs/c.pdf"}
+
+    reloaded = CorpusIndex(fake_embeddings, path=str(tmp_path))
+    docs = reloaded.as_retriever("similarity", k=5, file_paths=["docs/b.pdf"]).invoke(
+        "c chunk 0"
+    )
+    assert sorted(doc.page_content for doc in docs) == [
+        f"b chunk {i}" for i in range(3)
+    ]
+    assert (
+        index.as_retriever("similarity", k=2, file_paths=["docs/a.pdf"]).invoke(
+            "a chunk 0"
+        )
+        == []
+    )
+
+
+def test_the_ivf_index_is_retrained_as_the_corpus_grows(tmp_path, fake_embeddings):
+    index = CorpusIndex(fake_embeddings, path=str(tmp_path))
+    add_article(index, fake_embeddings, "a", num_chunks=80)
+    assert faiss.try_extract_index_ivf(index._store.index).nlist == 2
+
+    add_article(index, fake_embeddings, "b", num_chunks=200)
+    assert faiss.try_extract_index_ivf(index._store.index).nlist == 2
+    add_article(index, fake_embeddings, "c", num_chunks=40)
+    assert faiss.try_extract_index_ivf(index._store.index).nlist == 8
+    assert sources(index, "b chunk 7") == ["docs/b.pdf"]
@@ -0,0 +1,105 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import requests
+from src.embedding import My_embeddings
+
+
+class EmbeddingServer(ThreadingHTTPServer):
+    """
+    Local stub of the Ollama embedding endpoint. The first `failures` requests get `status_code`,
+    the others embed each text as a vector holding its length.
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), EmbeddingHandler)
+        self.requests = []
+        self.failures = 0
+        self.status_code = 503
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class EmbeddingHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with self.server.lock:
+            self.server.requests.append(
+                {
+                    "path": self.path,
+                    "authorization": self.headers["Authorization"],
+                    **payload,
+                }
+            )
+            failed = len(self.server.requests) <= self.server.failures
+        if failed:
+            self.send_response(self.server.status_code)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = json.dumps(
+            {"embeddings": [[float(len(text))] for text in payload["input"]]}
+        ).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = EmbeddingServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def client(server, **kwargs):
+    embeddings = My_embeddings(base_url=server.url, api_key="secret", **kwargs)
+    # Ignore any proxy configured in the environment, the server is local
+    embeddings.session.trust_env = False
+    return embeddings
+
+
+def test_embed_documents_sends_batches_in_order(server):
+    embeddings = client(server, batch_size=3, max_concurrency=2)
+
+    texts = ["a" * n for n in range(1, 9)]
+    vectors = embeddings.embed_documents(texts)
+
+    assert vectors == [[float(n)] for n in range(1, 9)]
+    assert sorted(len(request["input"]) for request in server.requests) == [2, 3, 3]
+    assert {request["path"] for request in server.requests} == {"/api/embed"}
+    assert {request["authorization"] for request in server.requests} == {
+        "Bearer secret"
+    }
+    assert len(embeddings.batch_timings) == 3
+
+
+def test_transient_errors_are_retried(server):
+    server.failures = 2
+    embeddings = client(server, batch_size=2, max_retries=2, backoff_factor=0)
+
+    assert embeddings.embed_query("abc") == [3.0]
+    assert len(server.requests) == 3
+
+
+def test_errors_are_raised_after_the_last_retry(server):
+    server.failures = 5
+    embeddings = client(server, batch_size=2, max_retries=1, backoff_factor=0)
+
+    with pytest.raises(requests.HTTPError):
+        embeddings.embed_query("abc")
+    assert len(server.requests) == 2
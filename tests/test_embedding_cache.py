@@ -0,0 +1,106 @@
+import asyncio
+import threading
+from conftest import FakeEmbeddings
+from src.embedding_cache import CachedQueryEmbeddings, EmbeddingCache, embed_with_cache
+
+
+def test_embed_with_cache_only_embeds_new_texts(tmp_path, fake_embeddings):
+    cache = EmbeddingCache(str(tmp_path / "embeddings.sqlite"))
+    texts = ["first chunk", "second chunk", "first chunk"]
+
+    vectors, stats = embed_with_cache(texts, fake_embeddings, cache, verbose=False)
+    assert fake_embeddings.embedded == 2
+    assert stats["embedded"] == 2
+    assert vectors[0] == vectors[2]
+
+    progress = {}
+    cached_vectors, stats = embed_with_cache(
+        texts + ["third chunk"], fake_embeddings, cache, progress, verbose=False
+    )
+    assert fake_embeddings.embedded == 3
+    assert stats["cache_hits"] == 3
+    assert progress == {"chunks_total": 3, "chunks_embedded": 3}
+    for cached, vector in zip(cached_vectors, vectors):
+        assert cached == vector
+
+
+def test_embed_with_cache_keys_on_the_model(tmp_path, fake_embeddings):
+    cache = EmbeddingCache(str(tmp_path / "embeddings.sqlite"))
+    embed_with_cache(["chunk"], fake_embeddings, cache, verbose=False)
+
+    fake_embeddings.model = "other"
+    embed_with_cache(["chunk"], fake_embeddings, cache, verbose=False)
+    assert fake_embeddings.embedded == 2
+
+
+def test_query_embeddings_are_memoized(tmp_path, fake_embeddings):
+    cache = EmbeddingCache(str(tmp_path / "embeddings.sqlite"))
+    embeddings = CachedQueryEmbeddings(fake_embeddings, max_entries=1, cache=cache)
+
+    vector = embeddings.embed_query("What is MET?")
+    assert embeddings.embed_query("What is MET?") == vector
+    embeddings.embed_query("Another question")
+    # Evicted from memory, found in the persistent cache
+    assert embeddings.embed_query("What is MET?") == vector
+
+    assert fake_embeddings.calls == 2
+    assert embeddings.stats()["memory_hits"] == 1
+    assert embeddings.stats()["persistent_hits"] == 1
+
+
+class QueryPrefixEmbeddings(FakeEmbeddings):
+    """
+    Embeds queries differently from documents, like models with a query instruction
+    """
+
+    def embed_query(self, text):
+        return super().embed_query(f"query: {text}")
+
+
+def test_warm_up_stores_query_embeddings(tmp_path):
+    underlying = QueryPrefixEmbeddings()
+    cache = EmbeddingCache(str(tmp_path / "embeddings.sqlite"))
+    embeddings = CachedQueryEmbeddings(underlying, cache=cache)
+
+    assert embeddings.warm_up(["What is MET?", "What is EGFR?", "What is MET?"]) == 2
+    assert underlying.embedded == 0
+    assert embeddings.warm_up(["What is MET?"]) == 0
+
+    uncached = CachedQueryEmbeddings(QueryPrefixEmbeddings(), cache=None)
+    for question in ["What is MET?", "What is EGFR?"]:
+        assert embeddings.embed_query(question) == uncached.embed_query(question)
+    assert underlying.calls == 2
+
+
+class ThreadRecordingCache(EmbeddingCache):
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.threads = []
+
+    def get_many(self, model, text_hashes):
+        self.threads.append(threading.current_thread())
+        return super().get_many(model, text_hashes)
+
+    def put_many(self, model, vectors):
+        self.threads.append(threading.current_thread())
+        super().put_many(model, vectors)
+
+
+def test_async_query_embeddings_read_and_write_sqlite_off_the_event_loop(
+    tmp_path, fake_embeddings
+):
+    cache = ThreadRecordingCache(str(tmp_path / "embeddings.sqlite"))
+    embeddings = CachedQueryEmbeddings(fake_embeddings, max_entries=1, cache=cache)
+
+    async def run():
+        vector = await embeddings.aembed_query("What is MET?")
+        await embeddings.aembed_query("Another question")
+        assert await embeddings.aembed_query("What is MET?") == vector
+        return threading.current_thread()
+
+    loop_thread = asyncio.run(run())
+    # A miss and a write for each question, then a persistent hit
+    assert len(cache.threads) == 5
+    assert loop_thread not in cache.threads
+    assert embeddings.stats()["misses"] == 2
+    assert embeddings.stats()["persistent_hits"] == 1
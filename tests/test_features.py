@@ -0,0 +1,29 @@
+import asyncio
+import src.features as features
+
+
+def test_subset_run_keeps_the_other_articles(tmp_path, monkeypatch, fake_embeddings):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    paths = []
+    for name in ("first", "second"):
+        path = docs / f"{name}.pdf"
+        path.write_bytes(name.encode())
+        paths.append(str(path))
+
+    async def fake_extract(file_path, embedding_function, settings=None):
+        return {"rows": [{"article_type": "Review"}], "tokens": 10, "seconds": 0.0}
+
+    written = []
+    monkeypatch.setattr(features, "extract_document_features", fake_extract)
+    monkeypatch.setattr(features, "list_uploaded_pdfs", lambda: paths)
+    monkeypatch.setattr(
+        features, "features_checkpoint_folder", str(tmp_path / "checkpoints")
+    )
+    monkeypatch.setattr(features, "write_features", written.append)
+
+    asyncio.run(features.extract_corpus_features(paths[:1], fake_embeddings))
+    summary = asyncio.run(features.extract_corpus_features(paths[1:], fake_embeddings))
+
+    assert summary["extracted"] == 1
+    assert [row["article_name"] for row in written[-1]] == ["first", "second"]
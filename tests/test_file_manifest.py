@@ -0,0 +1,82 @@
+from concurrent.futures import ProcessPoolExecutor
+import os
+import src.file_manifest as file_manifest_module
+from src.file_manifest import FileManifest, calculate_file_hash
+
+
+def test_hash_is_only_computed_when_the_file_changes(tmp_path, monkeypatch):
+    pdf = tmp_path / "article.pdf"
+    pdf.write_bytes(b"first version")
+    manifest = FileManifest(str(tmp_path / "manifest.json"))
+
+    hashes = []
+
+    def counting_hash(file_path, *args, **kwargs):
+        hashes.append(file_path)
+        return calculate_file_hash(file_path, *args, **kwargs)
+
+    monkeypatch.setattr(file_manifest_module, "calculate_file_hash", counting_hash)
+
+    first = manifest.get_hash(str(pdf))
+    assert first == calculate_file_hash(str(pdf))
+    assert manifest.get_hash(str(pdf)) == first
+    assert len(hashes) == 1
+
+    pdf.write_bytes(b"second version, longer")
+    second = manifest.get_hash(str(pdf))
+    assert second != first
+    assert len(hashes) == 2
+
+
+def test_manifest_is_persisted(tmp_path):
+    pdf = tmp_path / "article.pdf"
+    pdf.write_bytes(b"content")
+    path = str(tmp_path / "manifest.json")
+    file_hash = FileManifest(path).get_hash(str(pdf))
+
+    reloaded = FileManifest(path)
+    assert reloaded.lookup(str(pdf)) == file_hash
+    assert reloaded.lookup(os.path.join(str(tmp_path), ".", "article.pdf")) == file_hash
+    assert reloaded.lookup(str(tmp_path / "missing.pdf")) is None
+
+
+def test_instances_sharing_the_manifest_merge_their_entries(tmp_path):
+    path = str(tmp_path / "manifest.json")
+    first, second = FileManifest(path), FileManifest(path)
+    pdfs = []
+    for name in ("first.pdf", "second.pdf"):
+        pdf = tmp_path / name
+        pdf.write_bytes(name.encode())
+        pdfs.append(str(pdf))
+
+    first_hash = first.record(pdfs[0])
+    second_hash = second.record(pdfs[1])
+
+    assert first.lookup(pdfs[1]) == second_hash
+    reloaded = FileManifest(path)
+    assert reloaded.lookup(pdfs[0]) == first_hash
+    assert reloaded.lookup(pdfs[1]) == second_hash
+
+
+def record_files(path, file_paths):
+    manifest = FileManifest(path)
+    for file_path in file_paths:
+        manifest.record(file_path)
+
+
+def test_processes_recording_at_the_same_time_keep_every_entry(tmp_path):
+    path = str(tmp_path / "manifest.json")
+    file_paths = []
+    for i in range(40):
+        pdf = tmp_path / f"{i}.pdf"
+        pdf.write_bytes(str(i).encode())
+        file_paths.append(str(pdf))
+
+    with ProcessPoolExecutor(max_workers=4) as executor:
+        list(
+            executor.map(record_files, [path] * 4, [file_paths[i::4] for i in range(4)])
+        )
+
+    manifest = FileManifest(path)
+    for file_path in file_paths:
+        assert manifest.lookup(file_path) == calculate_file_hash(file_path)
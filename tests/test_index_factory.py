@@ -0,0 +1,146 @@
+import faiss
+import numpy as np
+import pytest
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from conftest import FakeEmbeddings
+from src.index_factory import (
+    IVF_MIN_POINTS_PER_LIST,
+    PQ_NBITS,
+    StoreSettings,
+    build_index,
+    effective_index_type,
+    truncate_embeddings,
+)
+from src.persistence import NumpyFlatIndex, load_vector_store, save_vector_store
+from src.vector_store import store_embedding_function
+
+IVF_MIN_VECTORS = 2 * IVF_MIN_POINTS_PER_LIST
+PQ_MIN_VECTORS = 2**PQ_NBITS * IVF_MIN_POINTS_PER_LIST
+
+
+def random_vectors(num_vectors, dimension=16, seed=0):
+    vectors = np.random.default_rng(seed).standard_normal(
+        (num_vectors, dimension), dtype=np.float32
+    )
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+class MatryoshkaEmbeddings(FakeEmbeddings):
+    """
+    Fake embeddings whose leading dimensions carry most of the norm, like Matryoshka embeddings
+    """
+
+    def vector(self, text):
+        vector = np.array(super().vector(text)) * 0.1 ** (
+            np.arange(self.dimensions) // 16
+        )
+        return (vector / np.linalg.norm(vector)).astype(np.float32).tolist()
+
+
+def build_store(vectors, settings, fake_embeddings, texts=None):
+    texts = texts or [f"chunk {i}" for i in range(len(vectors))]
+    vectors = truncate_embeddings(vectors, settings.dimensions)
+    index, metadata = build_index(vectors, settings)
+    store = FAISS(
+        embedding_function=store_embedding_function(fake_embeddings, settings),
+        index=index,
+        docstore=InMemoryDocstore(),
+        index_to_docstore_id={},
+    )
+    store.add_embeddings(
+        text_embeddings=list(zip(texts, vectors.tolist())),
+        ids=[f"id-{i}" for i in range(len(vectors))],
+    )
+    return store, metadata
+
+
+@pytest.mark.parametrize(
+    "index_type, num_vectors, expected",
+    [
+        ("flat", 10, "flat"),
+        ("hnsw", 10, "hnsw"),
+        ("ivf_flat", IVF_MIN_VECTORS - 1, "flat"),
+        ("ivf_flat", IVF_MIN_VECTORS, "ivf_flat"),
+        ("ivf_pq", IVF_MIN_VECTORS - 1, "flat"),
+        ("ivf_pq", PQ_MIN_VECTORS - 1, "ivf_flat"),
+        ("ivf_pq", PQ_MIN_VECTORS, "ivf_pq"),
+    ],
+)
+def test_indexes_fall_back_below_their_training_threshold(
+    index_type, num_vectors, expected
+):
+    assert effective_index_type(index_type, num_vectors) == expected
+
+    index, metadata = build_index(
+        random_vectors(num_vectors), StoreSettings(index_type=index_type)
+    )
+    assert metadata["effective_index_type"] == expected
+    assert metadata["index_type"] == index_type
+    assert index.is_trained
+    ivf = faiss.try_extract_index_ivf(index)
+    assert (ivf is not None) == expected.startswith("ivf")
+    if ivf is not None:
+        assert ivf.nlist >= 2 and ivf.nprobe <= ivf.nlist
+
+
+@pytest.mark.parametrize(
+    "index_type, num_vectors",
+    [
+        ("flat", 50),
+        ("hnsw", 50),
+        ("ivf_flat", 400),
+        ("ivf_pq", PQ_MIN_VECTORS),
+    ],
+)
+@pytest.mark.parametrize("precision", ["float32", "float16", "int8"])
+@pytest.mark.parametrize("mmap", [False, True])
+def test_stores_search_the_same_after_a_save_and_reload(
+    tmp_path, fake_embeddings, index_type, num_vectors, precision, mmap
+):
+    vectors = random_vectors(num_vectors)
+    settings = StoreSettings(index_type=index_type, precision=precision)
+    store, metadata = build_store(vectors, settings, fake_embeddings)
+    save_vector_store(store, str(tmp_path), metadata)
+
+    loaded = load_vector_store(str(tmp_path), fake_embeddings, mmap=mmap)
+    assert loaded.index.ntotal == num_vectors
+    assert isinstance(loaded.index, NumpyFlatIndex) == (
+        mmap and index_type == "flat" and precision != "int8"
+    )
+
+    queries = vectors[:5] + 0.01 * random_vectors(5, seed=1)
+    expected_distances, expected_labels = store.index.search(queries, 3)
+    distances, labels = loaded.index.search(queries, 3)
+    np.testing.assert_array_equal(labels, expected_labels)
+    np.testing.assert_allclose(distances, expected_distances, rtol=1e-3, atol=1e-4)
+
+    docs = loaded.similarity_search_by_vector(vectors[7].tolist(), k=1)
+    if index_type != "ivf_pq":
+        assert docs[0].page_content == "chunk 7"
+
+
+@pytest.mark.parametrize("mmap", [False, True])
+def test_truncated_int8_stores_return_the_float32_top_hits(tmp_path, mmap):
+    embeddings = MatryoshkaEmbeddings(dimensions=64)
+    texts = [f"finding {i} of the trial" for i in range(200)]
+    vectors = np.array(embeddings.embed_documents(texts))
+    queries = texts[::10]
+
+    reference, _ = build_store(
+        vectors, StoreSettings(dimensions=None), embeddings, texts
+    )
+    settings = StoreSettings(dimensions=16, precision="int8")
+    store, metadata = build_store(vectors, settings, embeddings, texts)
+    assert metadata["dimension"] == 16 and metadata["bytes_per_vector"] == 16
+    save_vector_store(store, str(tmp_path), metadata)
+    loaded = load_vector_store(
+        str(tmp_path), store_embedding_function(embeddings, settings), mmap=mmap
+    )
+
+    for query in queries:
+        expected = [doc.page_content for doc in reference.similarity_search(query, k=3)]
+        assert expected[0] == query
+        assert [doc.page_content for doc in loaded.similarity_search(query, k=3)] == (
+            expected
+        )
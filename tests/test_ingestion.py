@@ -0,0 +1,39 @@
+import src.ingestion as ingestion
+from src.ingestion import CHUNK_SPLITTER, embed_pdf_chunks, iter_clean_pages
+from src.ingestion_benchmark import staged_pdf_chunks, write_sample_pdf
+from src.text_cache import TextCache
+
+
+def as_tuples(chunks):
+    return [(chunk.page_content, chunk.metadata) for chunk in chunks]
+
+
+def test_streamed_and_pooled_chunks_match_the_serial_path(
+    tmp_path, monkeypatch, fake_embeddings
+):
+    pdf = str(tmp_path / "article.pdf")
+    write_sample_pdf(pdf, num_pages=12)
+    expected = as_tuples(staged_pdf_chunks(pdf))
+    assert len({metadata["page"] for _, metadata in expected}) == 12
+
+    # Small queue and batches, so the parser waits on the embedder
+    monkeypatch.setattr(ingestion, "INGESTION_QUEUE_MAX_CHUNKS", 3)
+    monkeypatch.setattr(ingestion, "INGESTION_EMBED_BATCH_SIZE", 5)
+    progress = {}
+    chunks, vectors = embed_pdf_chunks(pdf, fake_embeddings, progress)
+    assert as_tuples(chunks) == expected
+    assert vectors == [fake_embeddings.vector(text) for text, _ in expected]
+    assert progress["pages_parsed"] == 12
+    assert progress["chunks_embedded"] == progress["chunks_total"] == len(expected)
+
+    monkeypatch.setattr(ingestion, "INGESTION_PARALLEL_MIN_PAGES", 2)
+    monkeypatch.setattr(ingestion, "INGESTION_PAGES_PER_TASK", 5)
+    pages = iter_clean_pages(
+        pdf, max_workers=2, cache=TextCache(str(tmp_path / "text_cache.sqlite"))
+    )
+    pooled = [chunk for page in pages for chunk in CHUNK_SPLITTER.split_documents(page)]
+    assert as_tuples(pooled) == expected
+
+    # Then from the text cache
+    chunks, _ = embed_pdf_chunks(pdf, fake_embeddings)
+    assert as_tuples(chunks) == expected
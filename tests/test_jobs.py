@@ -0,0 +1,58 @@
+import threading
+import time
+from types import SimpleNamespace
+from src.index_factory import StoreSettings
+from src.jobs import IngestionJob, IngestionJobManager, evict_finished_jobs
+
+
+def test_submit_deduplicates_identical_requests_only(monkeypatch, fake_embeddings):
+    release = threading.Event()
+    monkeypatch.setattr(IngestionJob, "run", lambda self, *args: release.wait(5))
+    manager = IngestionJobManager(max_workers=4, max_pending=8)
+    try:
+        job = manager.submit("docs/a.pdf", fake_embeddings, file_hash="h1")
+        assert manager.submit("docs/./a.pdf", fake_embeddings, file_hash="h1") is job
+
+        others = [
+            manager.submit("docs/a.pdf", fake_embeddings, file_hash="h2"),
+            manager.submit(
+                "docs/a.pdf",
+                fake_embeddings,
+                StoreSettings(dimensions=8),
+                file_hash="h1",
+            ),
+            manager.submit("docs/a.pdf", fake_embeddings, rebuild=True, file_hash="h1"),
+        ]
+        assert len({job.job_id, *(other.job_id for other in others)}) == 4
+    finally:
+        release.set()
+    job.future.result(5)
+    assert manager.submit("docs/a.pdf", fake_embeddings, file_hash="h1") is not job
+
+
+def test_finished_jobs_are_expired_then_capped():
+    now = time.time()
+    finished_at = {"running": None, "expired": now - 100, "old": now - 5, "new": now}
+    jobs = {
+        job_id: SimpleNamespace(job_id=job_id, finished_at=at)
+        for job_id, at in finished_at.items()
+    }
+
+    evict_finished_jobs(jobs, ttl=60, max_finished=1)
+    assert list(jobs) == ["running", "new"]
+
+
+def test_manager_drops_finished_jobs(monkeypatch, fake_embeddings):
+    monkeypatch.setattr(IngestionJob, "run", lambda self, *args: None)
+    manager = IngestionJobManager(max_workers=1, max_pending=8, max_finished=1)
+
+    jobs = []
+    for file_hash in ("h1", "h2", "h3"):
+        job = manager.submit("docs/a.pdf", fake_embeddings, file_hash=file_hash)
+        job.future.result(5)
+        job.finished_at = time.time()
+        jobs.append(job)
+
+    assert manager.get(jobs[0].job_id) is None
+    assert manager.get(jobs[1].job_id) is jobs[1]
+    assert manager.get(jobs[2].job_id) is jobs[2]
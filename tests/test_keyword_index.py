@@ -0,0 +1,80 @@
+import asyncio
+import threading
+from unittest.mock import patch
+from langchain_community.vectorstores import FAISS
+from src.keyword_index import (
+    BM25Index,
+    HybridRetriever,
+    KeywordRetriever,
+    reciprocal_rank_fusion,
+    tokenize,
+)
+
+TEXTS = [
+    "Capmatinib shows a high response rate in MET exon 14 skipping NSCLC.",
+    "Tepotinib is another MET inhibitor approved for lung cancer.",
+    "Survival was longer in the treatment naive cohort.",
+    "Resistance to MET inhibitors arises through secondary mutations.",
+]
+
+
+def test_tokenize_drops_stop_words():
+    assert tokenize("What is the role of MET in NSCLC?") == ["role", "met", "nsclc"]
+
+
+def test_bm25_ranks_exact_matches_first(tmp_path):
+    index = BM25Index.build(TEXTS)
+    labels, scores = index.search("capmatinib response", 2)
+    assert labels.tolist() == [0]
+    assert scores[0] > 0
+
+    labels, _ = index.search("MET inhibitor", 4)
+    assert set(labels.tolist()) == {0, 1, 3}
+
+    index.save(str(tmp_path))
+    loaded = BM25Index.load(str(tmp_path))
+    assert loaded.search("MET inhibitor", 4)[0].tolist() == labels.tolist()
+    assert BM25Index.load(str(tmp_path / "missing")) is None
+
+
+def test_reciprocal_rank_fusion_favours_labels_in_both_rankings():
+    assert reciprocal_rank_fusion([[1, 2, 3], [3, 4, 1]], 2) == [1, 3]
+    assert reciprocal_rank_fusion([[5], []], 3) == [5]
+
+
+def test_hybrid_retriever_fuses_dense_and_keyword_rankings(fake_embeddings):
+    store = FAISS.from_texts(TEXTS, fake_embeddings)
+    index = BM25Index.build(TEXTS)
+    query = "capmatinib response"
+
+    keyword_docs = KeywordRetriever(
+        vector_store=store, keyword_index=index, k=2
+    ).invoke(query)
+    assert [doc.page_content for doc in keyword_docs] == [TEXTS[0]]
+
+    # The query embedding is that of the third text, which the dense ranking puts first
+    retriever = HybridRetriever(vector_store=store, keyword_index=index, k=2)
+    docs = retriever._fuse(query, fake_embeddings.vector(TEXTS[2]))
+    assert {doc.page_content for doc in docs} == {TEXTS[0], TEXTS[2]}
+
+
+def test_hybrid_retriever_fuses_off_the_event_loop(fake_embeddings):
+    store = FAISS.from_texts(TEXTS, fake_embeddings)
+    retriever = HybridRetriever(
+        vector_store=store, keyword_index=BM25Index.build(TEXTS), k=2
+    )
+    threads = []
+    fuse = HybridRetriever._fuse
+
+    def record_thread(self, query, embedding):
+        threads.append(threading.get_ident())
+        return fuse(self, query, embedding)
+
+    async def retrieve():
+        with patch.object(HybridRetriever, "_fuse", record_thread):
+            docs = await retriever.ainvoke("capmatinib response")
+        return docs, threading.get_ident()
+
+    docs, loop_thread = asyncio.run(retrieve())
+    assert TEXTS[0] in {doc.page_content for doc in docs}
+    assert threads and threads[0] != loop_thread
@@ -0,0 +1,73 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pytest
+from src.embedding import LocalEmbeddings
+
+
+class FakeEncoder:
+    """
+    Stands in for a SentenceTransformer, recording the size of each batch
+    """
+
+    def __init__(self, latency: float = 0.0, release: threading.Event = None):
+        self.latency = latency
+        self.release = release
+        self.batches = []
+
+    def encode(self, texts, **kwargs):
+        if self.release is not None:
+            self.release.wait()
+        time.sleep(self.latency)
+        if "fail" in texts:
+            raise RuntimeError("encoding failed")
+        self.batches.append(len(texts))
+        return np.array([[float(len(text))] for text in texts], dtype=np.float32)
+
+
+def local_embeddings(encoder: FakeEncoder, **kwargs) -> LocalEmbeddings:
+    embeddings = LocalEmbeddings(**kwargs)
+    embeddings._encoder = encoder
+    return embeddings
+
+
+def test_concurrent_queries_are_encoded_together():
+    encoder = FakeEncoder(latency=0.02)
+    embeddings = local_embeddings(encoder, batch_size=16, batch_wait=0.01)
+
+    texts = [f"query {i}" for i in range(32)]
+    with ThreadPoolExecutor(max_workers=32) as executor:
+        vectors = list(executor.map(embeddings.embed_query, texts))
+
+    assert vectors == [[float(len(text))] for text in texts]
+    assert sum(encoder.batches) == 32
+    assert len(encoder.batches) < 32
+
+
+def test_cancelled_query_does_not_stop_the_batcher():
+    release = threading.Event()
+    embeddings = local_embeddings(
+        FakeEncoder(release=release), batch_size=1, batch_wait=0
+    )
+
+    async def scenario():
+        first = asyncio.ensure_future(embeddings.aembed_query("first"))
+        await asyncio.sleep(0.05)
+        # Queued behind the first query, then abandoned by its caller
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(embeddings.aembed_query("cancelled"), 0.05)
+        release.set()
+        await first
+        return await asyncio.wait_for(embeddings.aembed_query("next"), 2)
+
+    assert asyncio.run(scenario()) == [4.0]
+
+
+def test_encoding_errors_reach_the_callers():
+    embeddings = local_embeddings(FakeEncoder(), batch_size=1, batch_wait=0)
+
+    with pytest.raises(RuntimeError, match="encoding failed"):
+        embeddings.embed_query("fail")
+    assert embeddings.embed_query("after") == [5.0]
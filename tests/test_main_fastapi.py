@@ -0,0 +1,368 @@
+import asyncio
+import hashlib
+import io
+import json
+import os
+import time
+import pytest
+from fastapi import UploadFile
+from fastapi.testclient import TestClient
+from pydantic import ValidationError
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.messages import AIMessageChunk
+import src.chains as chains
+import src.main_fastapi as main_fastapi
+import src.resume as resume
+from src.config import JOB_FINISHED_TTL
+from src.main_fastapi import ChainParameters
+from src.resume_benchmark import ResumeChatModelStub
+
+CHAIN_PARAMETERS = ChainParameters(
+    search_type="similarity", pdf_path=main_fastapi.pdf_paths[0]
+)
+
+
+def test_resume_prompts_are_answered_concurrently_in_order(
+    monkeypatch, fake_embeddings
+):
+    running = []
+    max_running = []
+    recorded = []
+
+    class ConcurrencyRecordingModel(ResumeChatModelStub):
+        async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+            running.append(None)
+            max_running.append(len(running))
+            try:
+                result = await super()._agenerate(messages, stop, run_manager, **kwargs)
+                if "boom" in messages[-1].content:
+                    raise RuntimeError("boom")
+                recorded.append(result.generations[0].message.usage_metadata)
+                return result
+            finally:
+                running.pop()
+
+    store = FAISS.from_texts(
+        [f"Outcome {i} improved in the treated arm." for i in range(10)],
+        fake_embeddings,
+    )
+
+    async def aget_retriever(**kwargs):
+        return store.as_retriever(search_type="similarity", search_kwargs={"k": 2})
+
+    # The real chain built by aget_rag_chain, on a local store and a model sleeping for each call
+    monkeypatch.setattr(chains, "aget_retriever", aget_retriever)
+    monkeypatch.setattr(
+        chains, "generation_model", ConcurrencyRecordingModel(call_latency=0.1)
+    )
+    prompts = [f"question {i}" for i in range(7)] + ["boom"]
+
+    start = time.perf_counter()
+    response = asyncio.run(
+        main_fastapi.resume_article_from_prompts(
+            CHAIN_PARAMETERS.model_copy(update={"use_cache": False}),
+            prompts,
+            max_concurrency=4,
+            mode="per_prompt",
+        )
+    )
+
+    assert time.perf_counter() - start < 0.1 * len(prompts) / 2
+    assert max(max_running) == 4
+    assert response.answers[:7] == [f"Answer to {prompt}" for prompt in prompts[:7]]
+    assert response.answers[7] == "" and "boom" in response.errors[7]
+    assert response.errors[:7] == [None] * 7
+    assert response.total_tokens == sum(usage["total_tokens"] for usage in recorded)
+    assert all(usage["input_tokens"] > 0 for usage in recorded)
+
+
+async def read_frames(response):
+    return [json.loads(frame) async for frame in response.body_iterator]
+
+
+@pytest.mark.parametrize("fail", [False, True])
+def test_stream_sends_context_tokens_then_metadata(monkeypatch, fail):
+    chunk = Document(page_content="MET exon 14", metadata={"page": 1})
+
+    async def aget_retriever(**kwargs):
+        return None
+
+    async def aretrieve_and_format(query, retriever):
+        return {
+            "context": chunk.page_content,
+            "chunks": [chunk],
+            "context_stats": {"context_tokens": 3},
+        }
+
+    async def astream_answer(context, question):
+        for token in ("MET ", "is ", "a receptor"):
+            await asyncio.sleep(0)
+            yield AIMessageChunk(content=token)
+        if fail:
+            raise RuntimeError("model unavailable")
+
+    monkeypatch.setattr(main_fastapi, "aget_retriever", aget_retriever)
+    monkeypatch.setattr(main_fastapi, "aretrieve_and_format", aretrieve_and_format)
+    monkeypatch.setattr(main_fastapi, "astream_answer", astream_answer)
+
+    async def stream():
+        response = await main_fastapi.query_article_stream(
+            CHAIN_PARAMETERS, "What is MET?"
+        )
+        return await read_frames(response)
+
+    frames = asyncio.run(stream())
+    assert [frame["type"] for frame in frames] == [
+        "context",
+        "token",
+        "token",
+        "token",
+        "error" if fail else "metadata",
+    ]
+    assert frames[0]["context"][0]["page_content"] == "MET exon 14"
+    assert "".join(frame["content"] for frame in frames[1:4]) == "MET is a receptor"
+    if not fail:
+        assert frames[-1]["response_metadata"]["context_tokens"] == 3
+        assert frames[-1]["time_to_first_token"] <= frames[-1]["total_time"]
+
+
+def test_warm_up_task_is_kept_logged_and_cancelled(monkeypatch, capsys):
+    def failing_warm_up():
+        raise RuntimeError("endpoint down")
+
+    monkeypatch.setattr(main_fastapi, "QUERY_EMBEDDING_WARMUP", True)
+    monkeypatch.setattr(main_fastapi, "warm_up_query_embeddings", failing_warm_up)
+
+    async def run_lifespan():
+        async with main_fastapi.lifespan(main_fastapi.app):
+            task = main_fastapi.app.state.warm_up_task
+            assert task is not None
+            with pytest.raises(RuntimeError):
+                await task
+        return task
+
+    task = asyncio.run(run_lifespan())
+    assert task.done()
+    assert "warm-up failed: endpoint down" in capsys.readouterr().out
+
+
+def test_unfinished_warm_up_is_cancelled_on_shutdown(monkeypatch):
+    monkeypatch.setattr(main_fastapi, "QUERY_EMBEDDING_WARMUP", True)
+    monkeypatch.setattr(
+        main_fastapi, "warm_up_query_embeddings", lambda: time.sleep(0.2)
+    )
+
+    async def run_lifespan():
+        async with main_fastapi.lifespan(main_fastapi.app):
+            await asyncio.sleep(0)
+        return main_fastapi.app.state.warm_up_task
+
+    assert asyncio.run(run_lifespan()).cancelled()
+
+
+def test_purge_answer_cache_only_accepts_known_pdfs(monkeypatch):
+    purged = []
+    monkeypatch.setattr(main_fastapi.answer_cache, "purge", purged.append)
+    monkeypatch.setattr(
+        main_fastapi.file_manifest,
+        "get_hash",
+        lambda path: pytest.fail("the PDF should not be hashed"),
+    )
+
+    with pytest.raises(main_fastapi.HTTPException) as error:
+        asyncio.run(main_fastapi.purge_answer_cache("/dev/zero"))
+    assert error.value.status_code == 404
+
+    monkeypatch.setattr(main_fastapi.file_manifest, "lookup", lambda path: "hash")
+    asyncio.run(main_fastapi.purge_answer_cache(main_fastapi.pdf_paths[0]))
+    assert purged == ["hash"]
+
+
+def test_reindex_only_accepts_known_pdfs():
+    with pytest.raises(ValidationError):
+        main_fastapi.ReindexParameters(pdf_paths=["/etc/passwd"])
+    params = main_fastapi.ReindexParameters(pdf_paths=main_fastapi.pdf_paths[:1])
+    assert params.pdf_paths == main_fastapi.pdf_paths[:1]
+
+
+def test_feature_extraction_only_accepts_known_pdfs():
+    with pytest.raises(ValidationError):
+        main_fastapi.FeatureExtractionParameters(
+            pdf_paths=[main_fastapi.pdf_paths[0], "../secrets.pdf"]
+        )
+    assert main_fastapi.FeatureExtractionParameters().pdf_paths is None
+
+
+class FakeJob:
+    def __init__(self, file_path: str):
+        self.job_id = os.path.basename(file_path)
+
+
+@pytest.fixture
+def upload_directory(monkeypatch, tmp_path):
+    monkeypatch.setattr(main_fastapi, "UPLOAD_DIRECTORY", str(tmp_path))
+    monkeypatch.setattr(main_fastapi, "pdf_paths", [])
+    monkeypatch.setattr(
+        main_fastapi.ingestion_jobs,
+        "submit",
+        lambda file_path, embeddings, file_hash=None: FakeJob(file_path),
+    )
+    return tmp_path
+
+
+def upload_size_limits():
+    return next(
+        middleware.kwargs["max_sizes"]
+        for middleware in main_fastapi.app.user_middleware
+        if middleware.cls is main_fastapi.UploadSizeLimitMiddleware
+    )
+
+
+def test_oversized_uploads_are_rejected_before_spooling(monkeypatch, upload_directory):
+    monkeypatch.setitem(upload_size_limits(), "/upload_pdf", 1000)
+    monkeypatch.setattr(
+        main_fastapi,
+        "save_pdf",
+        lambda file: pytest.fail("the upload should not be parsed"),
+    )
+    client = TestClient(main_fastapi.app)
+
+    response = client.post(
+        "/upload_pdf", files={"file": ("big.pdf", b"x" * 2000, "application/pdf")}
+    )
+    assert response.status_code == 413
+
+    # Chunked, without a Content-Length to check up front
+    def body():
+        for _ in range(4):
+            yield b"x" * 500
+
+    response = client.post(
+        "/upload_pdf",
+        content=body(),
+        headers={"Content-Type": "multipart/form-data; boundary=b"},
+    )
+    assert response.status_code == 413
+    assert os.listdir(upload_directory) == []
+
+
+def test_oversized_file_leaves_no_partial_file(monkeypatch, upload_directory):
+    monkeypatch.setattr(main_fastapi, "MAX_FILE_SIZE", 1000)
+    monkeypatch.setattr(main_fastapi, "UPLOAD_CHUNK_SIZE", 256)
+
+    with pytest.raises(main_fastapi.HTTPException) as error:
+        main_fastapi.save_pdf(UploadFile(io.BytesIO(b"x" * 1001), filename="big.pdf"))
+    assert error.value.status_code == 400
+    assert os.listdir(upload_directory) == []
+
+    content = b"x" * 1000
+    file_path, file_hash = main_fastapi.save_pdf(
+        UploadFile(io.BytesIO(content), filename="article.pdf")
+    )
+    assert os.listdir(upload_directory) == ["article.pdf"]
+    assert file_hash == hashlib.sha256(content).hexdigest()
+    with open(file_path, "rb") as f:
+        assert f.read() == content
+
+
+def test_upload_pdfs_saves_each_file_independently(upload_directory):
+    client = TestClient(main_fastapi.app)
+
+    response = client.post(
+        "/upload_pdfs",
+        files=[
+            ("files", ("first.pdf", b"first", "application/pdf")),
+            ("files", ("notes.txt", b"notes", "text/plain")),
+            ("files", ("second.pdf", b"second", "application/pdf")),
+        ],
+    )
+
+    assert response.status_code == 200
+    results = response.json()
+    assert [result["filename"] for result in results] == [
+        "first.pdf",
+        "notes.txt",
+        "second.pdf",
+    ]
+    assert results[0]["job_id"] == "first.pdf"
+    assert results[0]["sha256"] == hashlib.sha256(b"first").hexdigest()
+    assert results[1]["error"] == "Only PDF files are allowed"
+    assert results[2]["job_id"] == "second.pdf"
+    assert sorted(os.listdir(upload_directory)) == ["first.pdf", "second.pdf"]
+    assert main_fastapi.pdf_paths == [
+        os.path.join(str(upload_directory), "first.pdf"),
+        os.path.join(str(upload_directory), "second.pdf"),
+    ]
+
+
+def test_finished_feature_extraction_jobs_are_expired(monkeypatch):
+    expired = main_fastapi.FeatureExtractionJob([])
+    expired.status = "done"
+    expired.finished_at = time.time() - JOB_FINISHED_TTL - 1
+    jobs = {expired.job_id: expired}
+    monkeypatch.setattr(main_fastapi, "feature_extraction_jobs", jobs)
+
+    async def run(self, embedding_function, **kwargs):
+        self.status = "done"
+        self.finished_at = time.time()
+
+    monkeypatch.setattr(main_fastapi.FeatureExtractionJob, "run", run)
+
+    async def extract():
+        job = await main_fastapi.extract_features(
+            main_fastapi.FeatureExtractionParameters(
+                pdf_paths=main_fastapi.pdf_paths[:1]
+            )
+        )
+        await jobs[job["job_id"]].task
+        return job
+
+    job = asyncio.run(extract())
+    assert list(jobs) == [job["job_id"]]
+
+
+def test_grouped_resume_splits_the_answers_and_counts_the_tokens(
+    monkeypatch, fake_embeddings
+):
+    recorded = []
+
+    class RecordingModel(ResumeChatModelStub):
+        async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+            result = await super()._agenerate(messages, stop, run_manager, **kwargs)
+            recorded.append(result.generations[0].message.usage_metadata)
+            return result
+
+    store = FAISS.from_texts(
+        [f"Outcome {i} improved in the treated arm." for i in range(10)],
+        fake_embeddings,
+    )
+
+    async def aget_retriever(**kwargs):
+        return store.as_retriever(search_type="similarity", search_kwargs={"k": 2})
+
+    monkeypatch.setattr(main_fastapi, "aget_retriever", aget_retriever)
+    monkeypatch.setattr(resume, "generation_model", RecordingModel())
+    prompts = [f"What about outcome {i}?" for i in range(7)]
+    prompts[4] = "An unanswered question?"
+
+    response = asyncio.run(
+        main_fastapi.resume_article_from_prompts(
+            CHAIN_PARAMETERS,
+            prompts,
+            max_concurrency=2,
+            mode="grouped",
+            questions_per_call=3,
+        )
+    )
+
+    assert len(recorded) == 3
+    assert response.answers == [
+        "" if i == 4 else f"Answer to {prompt}" for i, prompt in enumerate(prompts)
+    ]
+    assert response.errors == [
+        "No answer returned for this question" if i == 4 else None
+        for i in range(len(prompts))
+    ]
+    assert response.total_tokens == sum(usage["total_tokens"] for usage in recorded)
+    assert all(usage["input_tokens"] > 0 for usage in recorded)
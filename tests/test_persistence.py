@@ -0,0 +1,110 @@
+import os
+import faiss
+import numpy as np
+import pytest
+import src.persistence as persistence
+from langchain_community.vectorstores import FAISS
+from src.index_factory import StoreSettings, build_index
+from src.persistence import (
+    CURRENT_FILE,
+    NumpyFlatIndex,
+    current_store_version,
+    is_current_version,
+    is_vector_store,
+    load_vector_store,
+    publish_vector_store,
+    remove_stale_versions,
+    save_vector_store,
+)
+from src.vector_store import VectorStoreCache
+
+
+def build_store(texts, fake_embeddings):
+    store = FAISS.from_texts(texts, fake_embeddings)
+    _, metadata = build_index(
+        store.index.reconstruct_n(0, store.index.ntotal), StoreSettings()
+    )
+    return store, metadata
+
+
+def test_rebuild_is_published_as_a_new_version(tmp_path, fake_embeddings):
+    path = str(tmp_path / "store")
+    first, metadata = build_store(["alpha chunk", "beta chunk"], fake_embeddings)
+    publish_vector_store(first, path, metadata)
+    assert is_vector_store(path)
+
+    # Another worker loaded and cached the first version
+    loaded = load_vector_store(path, fake_embeddings)
+    cache = VectorStoreCache(max_bytes=1 << 30)
+    cache.put(("hash",), loaded)
+    assert cache.get(("hash",)) is loaded
+
+    second, metadata = build_store(
+        ["gamma chunk", "delta chunk", "epsilon chunk"], fake_embeddings
+    )
+    publish_vector_store(second, path, metadata)
+
+    assert not is_current_version(loaded)
+    assert cache.get(("hash",)) is None
+    # Requests still running on the old version read consistent files
+    assert loaded.similarity_search("alpha chunk", k=1)[0].page_content == "alpha chunk"
+    reloaded = load_vector_store(path, fake_embeddings)
+    assert reloaded.index.ntotal == 3
+    assert (
+        reloaded.similarity_search("delta chunk", k=1)[0].page_content == "delta chunk"
+    )
+
+
+def test_stale_versions_are_removed_after_the_retention(tmp_path, fake_embeddings):
+    path = str(tmp_path / "store")
+    store, metadata = build_store(["alpha chunk"], fake_embeddings)
+    first = publish_vector_store(store, path, metadata)
+    second = publish_vector_store(store, path, metadata)
+
+    remove_stale_versions(path)
+    assert os.path.isdir(first)
+    remove_stale_versions(path, retention=0)
+    assert not os.path.exists(first)
+    assert current_store_version(path) == second
+
+
+def test_stores_saved_in_place_are_still_loaded_and_upgraded(tmp_path, fake_embeddings):
+    path = str(tmp_path / "store")
+    store, metadata = build_store(["alpha chunk"], fake_embeddings)
+    save_vector_store(store, path, metadata)
+    assert current_store_version(path) == path
+
+    loaded = load_vector_store(path, fake_embeddings)
+    assert is_current_version(loaded)
+
+    publish_vector_store(store, path, metadata)
+    assert not is_current_version(loaded)
+    remove_stale_versions(path, retention=0)
+    assert sorted(os.listdir(path)) == sorted(
+        [CURRENT_FILE, os.path.basename(current_store_version(path))]
+    )
+
+
+@pytest.mark.parametrize("precision", ["float32", "float16"])
+@pytest.mark.parametrize("block_size", [7, 50, 65536])
+def test_numpy_flat_index_matches_faiss(monkeypatch, precision, block_size):
+    monkeypatch.setattr(persistence, "MMAP_SEARCH_BLOCK_SIZE", block_size)
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((50, 16), dtype=np.float32).astype(precision)
+    queries = rng.standard_normal((6, 16), dtype=np.float32)
+    stored = vectors.astype(np.float32)
+    index = NumpyFlatIndex(vectors, (stored**2).sum(axis=1))
+    reference = faiss.IndexFlatL2(16)
+    reference.add(stored)
+
+    for k in (1, 10, 50):
+        distances, labels = index.search(queries, k)
+        expected_distances, expected_labels = reference.search(queries, k)
+        np.testing.assert_array_equal(labels, expected_labels)
+        np.testing.assert_allclose(distances, expected_distances, rtol=1e-5, atol=1e-4)
+
+    # Beyond the vectors, results are padded like FAISS pads them
+    _, labels = index.search(queries, 60)
+    _, expected_labels = reference.search(queries, 60)
+    np.testing.assert_array_equal(labels, expected_labels)
+    np.testing.assert_array_equal(index.reconstruct(3), stored[3])
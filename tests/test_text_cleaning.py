@@ -0,0 +1,93 @@
+import random
+import unicodedata
+import pytest
+from langchain_core.documents import Document
+from src.cleaning_benchmark import previous_clean_text
+from src.text_cleaning import clean_scientific_text, clean_text
+
+# Representative page fragments and their cleaned text. Hyphenation across lines is not repaired by
+# the cleaner, only its line break is; ligatures and accents are decomposed by the NFKD normalization.
+GOLDEN_PAGES = [
+    (
+        "The treat-\nment of non-small cell lung can-\ncer patients\nimproved overall survival.",
+        "The treat- ment of non-small cell lung can- cer patients improved overall survival.",
+    ),
+    (
+        "Eﬃcacy and safety proﬁles were signiﬁcant; ﬂuorouracil was aﬀordable.",
+        "Efficacy and safety profiles were significant; fluorouracil was affordable.",
+    ),
+    (
+        "Caractéristiques des patients atteints d’adénocarcinome – étude rétrospective.",
+        unicodedata.normalize(
+            "NFKD",
+            "Caractéristiques des patients atteints d’adénocarcinome – étude rétrospective.",
+        ),
+    ),
+    (
+        "Journal of Thoracic Oncology Vol. 12 No. 3\tPage 45\r\nResults\nPages 45-52 were "
+        "reviewed.\n\nThe homepage 3 stays.",
+        "Journal of Thoracic Oncology No. 3 Results -52 were reviewed. The homepage 3 stays.",
+    ),
+    (
+        "Available at https://doi.org/10.1016/j.jtho.2020.01.001 (DOI: 10.1016/j.jtho) and "
+        "http://example.com/a_b?x=1.",
+        "Available at (/j.jtho) and",
+    ),
+    (
+        "© 2021 The Authors. Published under a Creative Commons Attribution 4.0 International "
+        "License. ©Elsevier",
+        "2021 The Authors. Published under a . Elsevier",
+    ),
+    (
+        "Methods\nCorrespondence to: Dr. A. Smith, Institut Curie, Paris\nEmail: a@b.fr\n"
+        "correspondence analysis was used\nResults follow.",
+        "Methods Email: a@b.fr correspondence analysis was used Results follow.",
+    ),
+]
+
+FUZZ_TOKENS = [
+    "https://doi.org/10.1200/JCO.2019",
+    "DOI: 10.1056",
+    "DOI10/3",
+    "Vol. 7",
+    "page 12",
+    "Pages\n3",
+    "homepage 4",
+    "©",
+    "© 2020",
+    "Creative Commons",
+    "License",
+    "Correspondence",
+    "correspondence:",
+    ":",
+    "ﬁ",
+    "é",
+    "treat-",
+    "ment",
+    "tumour",
+    "ORR 45%",
+]
+FUZZ_SEPARATORS = [" ", "  ", "\n", "\t", "\r\n", ""]
+
+
+@pytest.mark.parametrize("page, expected", GOLDEN_PAGES)
+def test_representative_pages_are_cleaned_as_before(page, expected):
+    assert clean_text(page) == expected
+    assert previous_clean_text(page) == expected
+
+
+def test_fuzzed_pages_are_cleaned_as_before():
+    rng = random.Random(0)
+    for _ in range(2000):
+        page = "".join(
+            rng.choice(FUZZ_TOKENS) + rng.choice(FUZZ_SEPARATORS)
+            for _ in range(rng.randint(1, 30))
+        )
+        assert clean_text(page) == previous_clean_text(page), page
+
+
+def test_documents_keep_their_metadata():
+    doc = Document(page_content="Page 3\nResults", metadata={"page": 2})
+    cleaned = clean_scientific_text(doc)
+    assert cleaned.page_content == "Results"
+    assert cleaned.metadata == {"page": 2}